@@ -1,16 +1,454 @@
-from fastapi import FastAPI, HTTPException
+from array import array
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+import asyncio
+import base64
+import bisect
+import csv
+import datetime
+import decimal
+import functools
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import logging
+import operator
+import re
+import threading
+import time
+import unicodedata
+
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from psycopg import connect
+from psycopg import AsyncConnection, Connection
 from psycopg.rows import dict_row
+from pydantic import BaseModel
+from typing import Literal
+from psycopg_pool import AsyncConnectionPool, ConnectionPool, PoolTimeout
 import os
 
 from dotenv import load_dotenv
+
+try:
+    import orjson
+except ImportError:  # opcional: sin orjson se usa el json estándar
+    orjson = None
 load_dotenv()
 
+logger = logging.getLogger("api_perruls")
+
+
+def conninfo():
+    return {
+        "host": os.getenv("DB_HOST", "10.7.50.11"),
+        "dbname": os.getenv("DB_NAME", "perruls"),
+        "user": os.getenv("DB_USER", "perruls"),
+        "password": os.getenv("DB_PASS", "ikl5t8G"),
+        "port": int(os.getenv("DB_PORT", "5432")),
+    }
+
+
+# Modo de ejecución de los endpoints:
+#   sync  -> pool síncrono; cada consulta corre en el threadpool de Starlette.
+#   async -> AsyncConnectionPool; las consultas no ocupan hilos.
+API_MODE = os.getenv("API_MODE", "sync").strip().lower()
+if API_MODE not in ("sync", "async"):
+    raise RuntimeError(f"API_MODE inválido: {API_MODE!r} (usar 'sync' o 'async')")
+ASYNC_MODE = API_MODE == "async"
+
+# --- Métricas ----------------------------------------------------------------
+# Histogramas por ruta y por consulta de: espera del pool, conexión nueva,
+# ejecución, lectura de filas y serialización JSON, más el tiempo total de
+# cada request. Se exponen en formato Prometheus en /metrics y con p50/p95/p99
+# en /metrics/resumen.
+
+LIMITES_SEGUNDOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICAS_MAX_CONSULTAS = int(os.getenv("API_METRICS_MAX_QUERIES", "500"))
+# Consultas más lentas que esto (ejecución + lectura) se registran en el log; 0 = no.
+CONSULTA_LENTA_MS = float(os.getenv("API_SLOW_QUERY_MS", "0"))
+
+DESCRIPCIONES = {
+    "perruls_http_request_seconds": ("histogram", "Duración de cada request HTTP"),
+    "perruls_db_pool_wait_seconds": ("histogram", "Espera hasta obtener una conexión del pool"),
+    "perruls_db_connect_seconds": ("histogram", "Tiempo en abrir una conexión nueva a PostgreSQL"),
+    "perruls_db_execute_seconds": ("histogram", "Tiempo de execute() de la consulta"),
+    "perruls_db_fetch_seconds": ("histogram", "Tiempo en leer las filas (en streaming incluye el envío)"),
+    "perruls_encode_seconds": ("histogram", "Tiempo en serializar la respuesta JSON"),
+    "perruls_db_rows_total": ("counter", "Filas leídas"),
+    "perruls_db_queries_total": ("counter", "Consultas ejecutadas"),
+}
+
+
+class Histograma:
+    def __init__(self, limites=LIMITES_SEGUNDOS):
+        self.limites = limites
+        # conteos[i] = observaciones en (limites[i-1], limites[i]]; la última es +Inf
+        self.conteos = [0] * (len(limites) + 1)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float):
+        self.conteos[bisect.bisect_left(self.limites, valor)] += 1
+        self.suma += valor
+        self.total += 1
+
+    def cuantil(self, q: float):
+        """
+        Estimación del cuantil interpolando dentro del bucket, igual que
+        histogram_quantile de Prometheus.
+        """
+        if not self.total:
+            return None
+        objetivo = q * self.total
+        acumulado = 0
+        for i, n in enumerate(self.conteos):
+            if n and acumulado + n >= objetivo:
+                inferior = self.limites[i - 1] if i > 0 else 0.0
+                if i == len(self.limites):
+                    return inferior
+                return inferior + (self.limites[i] - inferior) * (objetivo - acumulado) / n
+            acumulado += n
+        return self.limites[-1]
+
+
+def _etiquetas_prom(etiquetas) -> str:
+    partes = []
+    for k, v in etiquetas:
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        partes.append(f'{k}="{v}"')
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+class Metricas:
+    def __init__(self):
+        # En modo sync las consultas corren en varios hilos a la vez.
+        self._lock = threading.Lock()
+        self.histogramas: dict[tuple, Histograma] = {}
+        self.contadores: dict[tuple, float] = {}
+        # id corto -> SQL normalizado (la etiqueta "query" usa el id)
+        self.consultas: dict[str, str] = {}
+
+    def observar(self, nombre: str, etiquetas: dict, valor: float):
+        clave = (nombre, tuple(etiquetas.items()))
+        with self._lock:
+            h = self.histogramas.get(clave)
+            if h is None:
+                h = self.histogramas[clave] = Histograma()
+            h.observar(valor)
+
+    def contar(self, nombre: str, etiquetas: dict, n: float = 1):
+        clave = (nombre, tuple(etiquetas.items()))
+        with self._lock:
+            self.contadores[clave] = self.contadores.get(clave, 0) + n
+
+    def id_consulta(self, sql: str):
+        """
+        Devuelve (id, sql normalizado). Pasado METRICAS_MAX_CONSULTAS
+        consultas distintas, las nuevas se agrupan como "otras".
+        """
+        texto = " ".join(sql.split())
+        qid = hashlib.sha1(texto.encode()).hexdigest()[:10]
+        with self._lock:
+            if qid not in self.consultas:
+                if len(self.consultas) >= METRICAS_MAX_CONSULTAS:
+                    return "otras", texto
+                self.consultas[qid] = texto
+        return qid, texto
+
+    def exponer(self, extra=()) -> str:
+        """
+        Texto en el formato de exposición de Prometheus (0.0.4).
+        extra: líneas (nombre, tipo, ayuda, valor) que se agregan como gauges.
+        """
+        with self._lock:
+            histogramas = [(k, list(h.conteos), h.suma, h.total) for k, h in self.histogramas.items()]
+            contadores = list(self.contadores.items())
+        lineas = []
+        por_nombre: dict[str, list] = {}
+        for (nombre, etiquetas), *resto in histogramas:
+            por_nombre.setdefault(nombre, []).append((etiquetas, *resto))
+        for (nombre, etiquetas), valor in contadores:
+            por_nombre.setdefault(nombre, []).append((etiquetas, valor))
+        for nombre in sorted(por_nombre):
+            tipo, ayuda = DESCRIPCIONES.get(nombre, ("untyped", nombre))
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} {tipo}")
+            for serie in por_nombre[nombre]:
+                etiquetas = serie[0]
+                if tipo != "histogram":
+                    lineas.append(f"{nombre}{_etiquetas_prom(etiquetas)} {serie[1]}")
+                    continue
+                conteos, suma, total = serie[1:]
+                acumulado = 0
+                for limite, n in zip(LIMITES_SEGUNDOS + ("+Inf",), conteos):
+                    acumulado += n
+                    et = _etiquetas_prom(etiquetas + (("le", limite),))
+                    lineas.append(f"{nombre}_bucket{et} {acumulado}")
+                et = _etiquetas_prom(etiquetas)
+                lineas.append(f"{nombre}_sum{et} {suma}")
+                lineas.append(f"{nombre}_count{et} {total}")
+        for nombre, tipo, ayuda, valor in extra:
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} {tipo}")
+            lineas.append(f"{nombre} {valor}")
+        return "\n".join(lineas) + "\n"
+
+    def resumen(self) -> dict:
+        """
+        p50/p95/p99 (en ms) de cada histograma, agrupados por métrica.
+        """
+        with self._lock:
+            series = [(k, h.total, h.suma, [h.cuantil(q) for q in (0.5, 0.95, 0.99)])
+                      for k, h in self.histogramas.items()]
+            filas = {dict(e).get("query"): v for (n, e), v in self.contadores.items()
+                     if n == "perruls_db_rows_total"}
+            consultas = dict(self.consultas)
+        salida: dict = {}
+        for (nombre, etiquetas), total, suma, cuantiles in series:
+            fila = dict(etiquetas)
+            fila.update(
+                count=total,
+                avg_ms=round(suma / total * 1000, 3),
+                **{f"p{p}_ms": round(c * 1000, 3) for p, c in zip((50, 95, 99), cuantiles)},
+            )
+            salida.setdefault(nombre, []).append(fila)
+        return {"metricas": salida, "consultas": consultas, "filas_por_consulta": filas}
+
+
+metricas = Metricas()
+
+# Scope ASGI del request en curso; lo fija MiddlewareMetricas y permite saber
+# la ruta (plantilla, p. ej. /mascotas/{chip_id}) desde las consultas.
+_request_actual: ContextVar[dict | None] = ContextVar("request_actual", default=None)
+
+
+def ruta_actual() -> str:
+    scope = _request_actual.get()
+    if scope is None:
+        return ""
+    ruta = scope.get("route")
+    return getattr(ruta, "path", None) or scope.get("path", "")
+
+
+class MedicionConsulta:
+    """
+    Mide una consulta: espera del pool, execute y lectura de filas.
+    Uso: creada antes de pedir la conexión; conectado() al tenerla,
+    ejecutado() tras execute y terminar(filas) al final.
+    """
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.ruta = ruta_actual()
+        self.inicio = time.perf_counter()
+        self.t_conexion = self.t_ejecucion = self.inicio
+
+    def conectado(self):
+        self.t_conexion = time.perf_counter()
+
+    def ejecutado(self):
+        self.t_ejecucion = time.perf_counter()
+
+    def terminar(self, filas: int):
+        fin = time.perf_counter()
+        qid, texto = metricas.id_consulta(self.sql)
+        ruta = {"route": self.ruta}
+        etiquetas = {"route": self.ruta, "query": qid}
+        metricas.observar("perruls_db_pool_wait_seconds", ruta, self.t_conexion - self.inicio)
+        metricas.observar("perruls_db_execute_seconds", etiquetas, self.t_ejecucion - self.t_conexion)
+        metricas.observar("perruls_db_fetch_seconds", etiquetas, fin - self.t_ejecucion)
+        metricas.contar("perruls_db_queries_total", etiquetas)
+        metricas.contar("perruls_db_rows_total", etiquetas, filas)
+        ms = (fin - self.t_conexion) * 1000
+        if CONSULTA_LENTA_MS and ms >= CONSULTA_LENTA_MS:
+            logger.warning(
+                "Consulta lenta: %.1f ms (execute %.1f ms), %d filas, ruta %s, query %s: %s",
+                ms, (self.t_ejecucion - self.t_conexion) * 1000, filas, self.ruta or "-", qid, texto[:1000],
+            )
+
+
+class ConexionMedida(Connection):
+    @classmethod
+    def connect(cls, *args, **kwargs):
+        inicio = time.perf_counter()
+        conn = super().connect(*args, **kwargs)
+        metricas.observar("perruls_db_connect_seconds", {}, time.perf_counter() - inicio)
+        return conn
+
+
+class ConexionMedidaAsync(AsyncConnection):
+    @classmethod
+    async def connect(cls, *args, **kwargs):
+        inicio = time.perf_counter()
+        conn = await super().connect(*args, **kwargs)
+        metricas.observar("perruls_db_connect_seconds", {}, time.perf_counter() - inicio)
+        return conn
+
+
+# Antes de prestar una conexión el pool la verifica (un SELECT 1 extra) solo
+# si estuvo ociosa más de DB_POOL_CHECK_IDLE segundos: es la que pudo quedar
+# cortada por un firewall o un reinicio de la base. Las de uso continuo no
+# pagan ese viaje; si una falla igual, el pool la reemplaza.
+POOL_CHEQUEO_OCIOSA = float(os.getenv("DB_POOL_CHECK_IDLE", "30"))
+
+
+def _al_devolver(conn):
+    conn.devuelta = time.monotonic()
+
+
+def _ociosa(conn) -> bool:
+    devuelta = getattr(conn, "devuelta", None)
+    return devuelta is not None and time.monotonic() - devuelta > POOL_CHEQUEO_OCIOSA
+
+
+def _chequear(conn):
+    if _ociosa(conn):
+        ConnectionPool.check_connection(conn)
+
+
+async def _al_devolver_async(conn):
+    _al_devolver(conn)
+
+
+async def _chequear_async(conn):
+    if _ociosa(conn):
+        await AsyncConnectionPool.check_connection(conn)
+
+
+# Pool de conexiones compartido por todo el proceso.
+# Se abre al iniciar la app y se cierra al apagarla (ver lifespan).
+PoolClass = AsyncConnectionPool if ASYNC_MODE else ConnectionPool
+pool = PoolClass(
+    kwargs={**conninfo(), "row_factory": dict_row},
+    connection_class=ConexionMedidaAsync if ASYNC_MODE else ConexionMedida,
+    min_size=int(os.getenv("DB_POOL_MIN", "2")),
+    max_size=int(os.getenv("DB_POOL_MAX", "10")),
+    timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+    max_idle=float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+    max_lifetime=float(os.getenv("DB_POOL_MAX_LIFETIME", "3600")),
+    check=_chequear_async if ASYNC_MODE else _chequear,
+    reset=_al_devolver_async if ASYNC_MODE else _al_devolver,
+    name="perruls",
+    open=False,
+)
+
+
+# --- Serialización JSON ------------------------------------------------------
+# Las filas de dict_row se serializan directo a bytes (orjson si está
+# instalado), sin pasar por jsonable_encoder. date/datetime salen en ISO 8601
+# y Decimal (peso) como número.
+
+def _json_default(valor):
+    if isinstance(valor, decimal.Decimal):
+        # igual que jsonable_encoder: entero si no tiene decimales
+        return int(valor) if valor.as_tuple().exponent >= 0 else float(valor)
+    if isinstance(valor, (datetime.date, datetime.datetime, datetime.time)):
+        return valor.isoformat()
+    if isinstance(valor, BaseModel):
+        return valor.model_dump()
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+
+def dumps_json(contenido) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(contenido, default=_json_default)
+    return json.dumps(
+        contenido, default=_json_default, ensure_ascii=False, separators=(",", ":")
+    ).encode()
+
+
+def codificar_respuesta(contenido) -> bytes:
+    """
+    dumps_json midiendo el tiempo en perruls_encode_seconds por ruta.
+    """
+    inicio = time.perf_counter()
+    cuerpo = dumps_json(contenido)
+    metricas.observar("perruls_encode_seconds", {"route": ruta_actual()}, time.perf_counter() - inicio)
+    return cuerpo
+
+
+class RespuestaJSON(JSONResponse):
+    """
+    Respuesta JSON por defecto de la API (ver dumps_json).
+    """
+
+    def render(self, content) -> bytes:
+        return codificar_respuesta(content)
+
+
+class MiddlewareMetricas:
+    """
+    Middleware ASGI que mide cada request (hasta el último byte enviado, así
+    también cubre las respuestas en streaming) por ruta, método y estado.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = _request_actual.set(scope)
+        inicio = time.perf_counter()
+        estado = 500
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            ruta = getattr(scope.get("route"), "path", None) or "(sin ruta)"
+            metricas.observar(
+                "perruls_http_request_seconds",
+                {"route": ruta, "method": scope["method"], "status": str(estado)},
+                time.perf_counter() - inicio,
+            )
+            _request_actual.reset(token)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if ASYNC_MODE:
+        await pool.open()
+    else:
+        pool.open()
+    oyente = asyncio.create_task(escuchar_cambios()) if CACHE_LISTEN else None
+    planes = asyncio.create_task(verificar_planes_en_fondo()) if PLANES_VERIFICAR else None
+    busqueda = asyncio.create_task(mantener_indice_busqueda()) if BUSQUEDA_ACTIVA else None
+    try:
+        yield
+    finally:
+        if planes is not None:
+            planes.cancel()
+        if busqueda is not None:
+            busqueda.cancel()
+        if oyente is not None:
+            oyente.cancel()
+            try:
+                await oyente
+            except asyncio.CancelledError:
+                pass
+        if ASYNC_MODE:
+            await pool.close()
+        else:
+            pool.close()
+
+
 app = FastAPI(
     title="API PERRULS",
     description="API para el sistema de mascotas comunitarias PERRULS",
     version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=RespuestaJSON,
 )
 
 app.add_middleware(
@@ -20,277 +458,1608 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MiddlewareMetricas)
 def get_conn():
-    return connect(
-        host=os.getenv("DB_HOST", "10.7.50.11"),
-        dbname=os.getenv("DB_NAME", "perruls"),
-        user=os.getenv("DB_USER", "perruls"),
-        password=os.getenv("DB_PASS", "ikl5t8G"),
-        port=int(os.getenv("DB_PORT", "5432")),
-        row_factory=dict_row
+    """
+    Presta una conexión del pool; se devuelve al salir del bloque with.
+    En modo async se usa con "async with".
+    """
+    return pool.connection()
+
+
+def _preparar(sql):
+    """
+    prepare= para cursor.execute: las consultas registradas (CONSULTAS) se
+    preparan en su primer uso en cada conexión del pool; el resto queda al
+    umbral automático de psycopg (prepare_threshold, 5 ejecuciones).
+    """
+    return True if sql in CONSULTAS.values() else None
+
+
+def _fetch_sync(sql, params, one):
+    medicion = MedicionConsulta(sql)
+    with get_conn() as conn:
+        medicion.conectado()
+        with conn.cursor() as cur:
+            cur.execute(sql, params, prepare=_preparar(sql))
+            medicion.ejecutado()
+            resultado = cur.fetchone() if one else cur.fetchall()
+    medicion.terminar(len(resultado) if not one else int(resultado is not None))
+    return resultado
+
+
+async def _fetch(sql, params, one):
+    if ASYNC_MODE:
+        medicion = MedicionConsulta(sql)
+        async with get_conn() as conn:
+            medicion.conectado()
+            async with conn.cursor() as cur:
+                await cur.execute(sql, params, prepare=_preparar(sql))
+                medicion.ejecutado()
+                resultado = await (cur.fetchone() if one else cur.fetchall())
+        medicion.terminar(len(resultado) if not one else int(resultado is not None))
+        return resultado
+    return await run_in_threadpool(_fetch_sync, sql, params, one)
+
+
+async def fetch_all(sql, params=None):
+    """
+    Ejecuta la consulta y devuelve todas las filas, según API_MODE.
+    """
+    return await _fetch(sql, params, False)
+
+
+async def fetch_one(sql, params=None):
+    """
+    Ejecuta la consulta y devuelve la primera fila (o None), según API_MODE.
+    """
+    return await _fetch(sql, params, True)
+
+
+# --- Paginación por cursor (keyset) ---------------------------------------
+# Los listados nunca devuelven la tabla completa: se piden "limit" filas
+# ordenadas por una clave única y el cliente continúa con "next_cursor".
+
+LIMITE_DEFECTO = int(os.getenv("API_PAGE_LIMIT", "100"))
+LIMITE_MAXIMO = int(os.getenv("API_PAGE_LIMIT_MAX", "1000"))
+
+
+def encode_cursor(valores):
+    data = json.dumps(valores, default=str, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _valor_de_cursor(valor, tipo):
+    if tipo is datetime.date:
+        return datetime.date.fromisoformat(valor)
+    # type() y no isinstance(): True no es un int válido ni 1 un bool.
+    if type(valor) is not tipo:
+        raise TypeError(valor)
+    return valor
+
+
+def decode_cursor(cursor, tipos):
+    """
+    Valores del cursor, validados contra el tipo de cada clave: un cursor
+    alterado responde 400 en vez de llegar a Postgres.
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        valores = json.loads(data)
+        if not isinstance(valores, list) or len(valores) != len(tipos):
+            raise ValueError(valores)
+        return [_valor_de_cursor(v, t) for v, t in zip(valores, tipos)]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def clave_con_nulos(expresion, tipo, relleno):
+    """
+    Claves de orden para una columna que admite NULL. Una comparación de
+    filas con NULL nunca es verdadera y esas filas quedarían fuera de la
+    paginación; (col IS NULL, COALESCE(col, relleno)) no tiene NULL y deja
+    los NULL al final, como ORDER BY ... NULLS LAST.
+    """
+    return [(f"{expresion} IS NULL", bool), (f"COALESCE({expresion}, {relleno})", tipo)]
+
+
+def parse_fields(fields, columnas):
+    """
+    Convierte "a,b,c" en la lista de columnas pedidas (todas si es None).
+    """
+    if not fields:
+        return list(columnas)
+    pedidas = [f.strip() for f in fields.split(",") if f.strip()]
+    desconocidas = [f for f in pedidas if f not in columnas]
+    if desconocidas:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Campos desconocidos: {', '.join(desconocidas)}",
+        )
+    return pedidas
+
+
+def consulta_paginada(columnas, desde, claves, filtros=(), fields=None,
+                      limit=LIMITE_DEFECTO, cursor=None):
+    """
+    Arma un SELECT paginado por keyset.
+
+    columnas: {campo: expresión SQL}; claves: (expresión SQL, tipo) que
+    forman el orden único, sin NULL (ver clave_con_nulos); el tipo valida
+    los valores del cursor. filtros: lista de (condición SQL, valor o None) que se aplican
+    sólo si el valor no es None. Con limit=None (exportaciones) no se
+    limita ni se agregan las columnas de cursor. Devuelve (sql, params, limit).
+    """
+    campos = parse_fields(fields, columnas)
+    select = [f"{columnas[c]} AS {c}" for c in campos]
+    if limit is not None:
+        limit = max(1, min(limit, LIMITE_MAXIMO))
+        select += [f"{k} AS _k{i}" for i, (k, _) in enumerate(claves)]
+
+    where, params = [], []
+    for cond, valor in filtros:
+        if valor is None:
+            continue
+        where.append(cond)
+        if "%s" in cond:
+            params.append(valor)
+    if cursor:
+        valores = decode_cursor(cursor, [t for _, t in claves])
+        marcas = ", ".join(["%s"] * len(claves))
+        where.append(f"({', '.join(k for k, _ in claves)}) > ({marcas})")
+        params.extend(valores)
+
+    sql = f"SELECT {', '.join(select)} FROM {desde}"
+    if where:
+        sql += " WHERE " + " AND ".join(f"({w})" for w in where)
+    sql += f" ORDER BY {', '.join(k for k, _ in claves)}"
+    if limit is not None:
+        # Como parámetro, para que el texto no cambie con el limit y psycopg
+        # pueda reutilizar la sentencia preparada.
+        sql += " LIMIT %b"
+        params.append(limit + 1)
+    return sql, params, limit
+
+
+def pagina(rows, limit, n_claves):
+    """
+    Separa las columnas internas _kN y calcula next_cursor.
+    """
+    hay_mas = len(rows) > limit
+    rows = rows[:limit]
+    claves = [f"_k{i}" for i in range(n_claves)]
+    next_cursor = None
+    if hay_mas and rows:
+        next_cursor = encode_cursor([rows[-1][k] for k in claves])
+    for r in rows:
+        for k in claves:
+            r.pop(k, None)
+    return {"data": rows, "next_cursor": next_cursor}
+
+
+# --- Exportación en streaming (?format=ndjson|csv) ---------------------------
+# Usa un cursor con nombre (del lado del servidor) y lee en lotes, así la
+# memoria no depende del número de filas y el cliente recibe datos de inmediato.
+
+STREAM_LOTE = int(os.getenv("API_STREAM_BATCH", "1000"))
+FORMATOS_STREAM = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+Formato = Literal["json", "ndjson", "csv"]
+
+
+def _codificar_lote(formato, rows, encabezado=None):
+    if formato == "ndjson":
+        return b"".join(dumps_json(r) + b"\n" for r in rows)
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    if encabezado:
+        writer.writerow(encabezado)
+    writer.writerows(r.values() for r in rows)
+    return buf.getvalue().encode()
+
+
+def _stream_sync(sql, params, formato):
+    medicion = MedicionConsulta(sql)
+    filas = 0
+    with get_conn() as conn:
+        medicion.conectado()
+        with conn.cursor(name="perruls_export") as cur:
+            cur.execute(sql, params)
+            medicion.ejecutado()
+            if formato == "csv":
+                yield _codificar_lote(formato, [], [d.name for d in cur.description])
+            while True:
+                rows = cur.fetchmany(STREAM_LOTE)
+                if not rows:
+                    break
+                filas += len(rows)
+                yield _codificar_lote(formato, rows)
+    medicion.terminar(filas)
+
+
+async def _stream_async(sql, params, formato):
+    medicion = MedicionConsulta(sql)
+    filas = 0
+    async with get_conn() as conn:
+        medicion.conectado()
+        async with conn.cursor(name="perruls_export") as cur:
+            await cur.execute(sql, params)
+            medicion.ejecutado()
+            if formato == "csv":
+                yield _codificar_lote(formato, [], [d.name for d in cur.description])
+            while True:
+                rows = await cur.fetchmany(STREAM_LOTE)
+                if not rows:
+                    break
+                filas += len(rows)
+                yield _codificar_lote(formato, rows)
+    medicion.terminar(filas)
+
+
+def respuesta_stream(sql, params, formato, nombre):
+    """
+    StreamingResponse con las filas de la consulta en NDJSON o CSV.
+    """
+    stream = _stream_async if ASYNC_MODE else _stream_sync
+    headers = {"Content-Disposition": f'attachment; filename="{nombre}.{formato}"'}
+    return StreamingResponse(
+        stream(sql, params, formato),
+        media_type=FORMATOS_STREAM[formato],
+        headers=headers,
     )
 
+
+# --- Caché de respuestas ----------------------------------------------------
+# Guarda el cuerpo JSON ya serializado de endpoints de referencia/reportes.
+# Cada ruta tiene su TTL; el total de entradas está acotado (LRU) y las
+# consultas concurrentes a una misma clave esperan a una sola ejecución.
+
+CACHE_MAX_ENTRADAS = int(os.getenv("CACHE_MAX_ENTRADAS", "1024"))
+CACHE_TTL = {
+    "sucursales": float(os.getenv("CACHE_TTL_SUCURSALES", "3600")),
+    "reportes": float(os.getenv("CACHE_TTL_REPORTES", "60")),
+    "inventario": float(os.getenv("CACHE_TTL_INVENTARIO", "30")),
+    "mascota": float(os.getenv("CACHE_TTL_MASCOTA", "300")),
+}
+
+
+class CacheRespuestas:
+    def __init__(self, max_entradas: int):
+        self.max_entradas = max_entradas
+        # clave -> (expira, etag, cuerpo)
+        self.entradas: OrderedDict = OrderedDict()
+        self.en_vuelo: dict = {}
+        # etiqueta -> claves, para invalidar por chip_id/nombre_campus
+        self.etiquetas: dict[str, set] = {}
+        self.etiquetas_de: dict = {}
+        # cambia con cada invalidación; una consulta que empezó antes no se guarda
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    async def obtener(self, clave, ttl: float, productor, etiquetas=()):
+        """
+        Devuelve (expira, etag, cuerpo) de la clave; si no está o venció,
+        ejecuta productor() una sola vez aunque haya varias solicitudes.
+        """
+        while True:
+            entrada = self.entradas.get(clave)
+            if entrada is not None and entrada[0] > time.monotonic():
+                self.entradas.move_to_end(clave)
+                self.hits += 1
+                return entrada
+
+            futuro = self.en_vuelo.get(clave)
+            if futuro is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(futuro)
+            except asyncio.CancelledError:
+                # Si se canceló la solicitud que ejecutaba productor() (su
+                # cliente se desconectó), las que esperaban no tienen por qué
+                # abortar: vuelven a intentar y una de ellas lo ejecuta.
+                if not futuro.cancelled():
+                    raise
+
+        self.misses += 1
+        futuro = asyncio.get_running_loop().create_future()
+        self.en_vuelo[clave] = futuro
+        version = self.version
+        try:
+            payload = await productor()
+            cuerpo = codificar_respuesta(payload)
+            etag = '"' + hashlib.sha1(cuerpo).hexdigest() + '"'
+            entrada = (time.monotonic() + ttl, etag, cuerpo)
+            if version == self.version:
+                self.guardar(clave, entrada, etiquetas)
+            futuro.set_result(entrada)
+            return entrada
+        except asyncio.CancelledError:
+            futuro.cancel()
+            raise
+        except Exception as e:
+            futuro.set_exception(e)
+            futuro.exception()  # evita el aviso "exception was never retrieved"
+            raise
+        finally:
+            del self.en_vuelo[clave]
+
+    def guardar(self, clave, entrada, etiquetas=()):
+        self.entradas[clave] = entrada
+        self.entradas.move_to_end(clave)
+        self.etiquetas_de[clave] = tuple(etiquetas)
+        for e in etiquetas:
+            self.etiquetas.setdefault(e, set()).add(clave)
+        while len(self.entradas) > self.max_entradas:
+            viejo, _ = self.entradas.popitem(last=False)
+            self._olvidar(viejo)
+            self.evictions += 1
+
+    def _olvidar(self, clave):
+        for e in self.etiquetas_de.pop(clave, ()):
+            claves = self.etiquetas.get(e)
+            if claves is not None:
+                claves.discard(clave)
+                if not claves:
+                    del self.etiquetas[e]
+
+    def invalidar(self, etiquetas):
+        """
+        Elimina las entradas marcadas con cualquiera de las etiquetas.
+        """
+        self.version += 1
+        for e in etiquetas:
+            for clave in list(self.etiquetas.get(e, ())):
+                self.entradas.pop(clave, None)
+                self._olvidar(clave)
+                self.invalidations += 1
+
+    def limpiar(self):
+        self.version += 1
+        self.entradas.clear()
+        self.etiquetas.clear()
+        self.etiquetas_de.clear()
+
+    def stats(self):
+        return {
+            "entradas": len(self.entradas),
+            "max_entradas": self.max_entradas,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+cache = CacheRespuestas(CACHE_MAX_ENTRADAS)
+
+
+def etag_coincide(if_none_match: str | None, etag: str) -> bool:
+    """
+    True si If-None-Match incluye el ETag: lista separada por comas, con o
+    sin W/ (comparación débil, como pide RFC 9110 para If-None-Match), o *.
+    """
+    if not if_none_match:
+        return False
+    for etiqueta in if_none_match.split(","):
+        etiqueta = etiqueta.strip()
+        if etiqueta == "*" or etiqueta.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+async def respuesta_cacheada(request: Request, ruta: str, productor, etiquetas=()):
+    """
+    Sirve la respuesta desde la caché con ETag y Cache-Control: no-cache.
+    Si el cliente envía If-None-Match con el mismo ETag responde 304.
+    etiquetas (p. ej. "chip:ABC", "inventario:*") permiten invalidarla
+    cuando la base avisa un cambio (ver escuchar_cambios).
+    """
+    clave = (request.url.path, tuple(sorted(request.query_params.multi_items())))
+    _, etag, cuerpo = await cache.obtener(
+        clave, CACHE_TTL[ruta], productor, etiquetas
+    )
+    # no-cache: el cliente puede guardar la respuesta pero la revalida
+    # siempre con If-None-Match (un 304 barato). Con max-age seguiría
+    # usando su copia aunque un aviso ya haya invalidado la del servidor.
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_coincide(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cuerpo, media_type="application/json", headers=headers)
+
+
+# --- Invalidación por LISTEN/NOTIFY -----------------------------------------
+# Los triggers de migraciones/001_notificar_cambios.sql (y 005 para sucursal)
+# envían un aviso por cada fila modificada; una conexión dedicada lo recibe y
+# borra de la caché solo las entradas afectadas (los de mascota marcan
+# además el índice de búsqueda para rearmarlo).
+
+CACHE_LISTEN = os.getenv("CACHE_LISTEN", "1") == "1"
+CANAL_CAMBIOS = "perruls_cambios"
+
+
+def etiquetas_de_aviso(aviso: dict) -> list[str]:
+    """
+    Traduce un aviso {"tabla", "chip_id", "nombre_campus"} a etiquetas de caché.
+    """
+    tabla = aviso.get("tabla")
+    chip_id = aviso.get("chip_id")
+    campus = aviso.get("nombre_campus")
+    etiquetas = []
+    if chip_id:
+        etiquetas.append(f"chip:{chip_id}")
+    if tabla == "mascota":
+        etiquetas.append("mascota:*")
+    elif tabla == "sucursal":
+        etiquetas.append("sucursal:*")
+    elif tabla in ("inventario", "medicamento"):
+        etiquetas.append("inventario:*")
+        if campus:
+            etiquetas.append(f"inventario:{campus}")
+        else:
+            etiquetas.extend(e for e in cache.etiquetas if e.startswith("inventario:"))
+    return etiquetas
+
+
+async def escuchar_cambios():
+    while True:
+        try:
+            async with await AsyncConnection.connect(**conninfo(), autocommit=True) as conn:
+                await conn.execute(f"LISTEN {CANAL_CAMBIOS}")
+                # Mientras no escuchábamos pudimos perder avisos.
+                cache.limpiar()
+                async for aviso in conn.notifies():
+                    try:
+                        datos = json.loads(aviso.payload)
+                        cache.invalidar(etiquetas_de_aviso(datos))
+                        if datos.get("tabla") == "mascota":
+                            cambios_mascota.set()
+                    except ValueError:
+                        logger.warning("Aviso inválido en %s: %r", CANAL_CAMBIOS, aviso.payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Conexión LISTEN perdida (%s); reintentando en 5 s", e)
+            cache.limpiar()
+            cambios_mascota.set()
+            await asyncio.sleep(5)
+
+
+@app.get("/health")
+async def health():
+    """
+    Verifica que la base responde y devuelve estadísticas del pool.
+    """
+    try:
+        await fetch_one("SELECT 1")
+        return {"status": "ok", "mode": API_MODE, "pool": pool.get_stats()}
+    except PoolTimeout:
+        raise HTTPException(status_code=503, detail="Pool de conexiones agotado")
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+# --- Consultas --------------------------------------------------------------
+# SQL fijo de los endpoints, por nombre. Se preparan en el servidor la primera
+# vez que se usan en cada conexión del pool (ver _preparar). Los listados
+# paginados y el batch se arman con consulta_mascotas(), consulta_perfil(),
+# etc.; verificar_planes revisa el plan de todas al iniciar.
+
+CONSULTAS = {
+    "mascota": """
+        SELECT 
+            m.chip_id,
+            m.nombre_mascota,
+            m.raza,
+            m.peso AS peso_kg,
+            m.edad_estimada,
+            m.estado_adop,
+            m.nombre_campus
+        FROM mascota m
+        WHERE m.chip_id = %s;
+    """,
+    "mascotas_por_chip": """
+        SELECT
+            m.chip_id,
+            m.nombre_mascota,
+            m.raza,
+            m.peso AS peso_kg,
+            m.edad_estimada,
+            m.estado_adop,
+            m.nombre_campus
+        FROM mascota m
+        WHERE m.chip_id = ANY(%s)
+    """,
+    "sucursales": """
+        SELECT 
+            nombre_campus,
+            direccion
+        FROM sucursal
+        ORDER BY nombre_campus;
+    """,
+    "mascotas_por_campus": """
+        SELECT 
+            s.nombre_campus,
+            COUNT(m.chip_id) AS total_mascotas
+        FROM sucursal s
+        LEFT JOIN mascota m 
+            ON m.nombre_campus = s.nombre_campus
+        GROUP BY s.nombre_campus
+        ORDER BY total_mascotas DESC;
+    """,
+    "resumen_campus": """
+        SELECT 
+            nombre_campus,
+            total_mascotas,
+            stock_alimento,
+            kg_por_mascota,
+            items_criticos,
+            actualizado
+        FROM resumen_campus
+        ORDER BY nombre_campus;
+    """,
+    "vacunas_mascota": """
+        SELECT 
+            v.id_vacuna,
+            v.nombre_vacuna,
+            v.fecha_aplicacion
+        FROM vacuna v
+        WHERE v.chip_id = %s
+        ORDER BY v.fecha_aplicacion DESC;
+    """,
+    "tratamientos_mascota": """
+        SELECT 
+            t.id_tratamiento,
+            t.descripcion,
+            t.fecha_inicio,
+            t.fecha_fin
+        FROM tratamiento t
+        WHERE t.chip_id = %s
+        ORDER BY t.fecha_inicio DESC;
+    """,
+    "derivaciones_mascota": """
+        SELECT 
+            d.id_derivacion,
+            d.veterinaria,
+            d.motivo,
+            d.fecha_derivacion
+        FROM derivacion d
+        WHERE d.chip_id = %s
+        ORDER BY d.fecha_derivacion DESC;
+    """,
+}
+
+MASCOTA_COLUMNAS = {
+    "chip_id": "m.chip_id",
+    "nombre_mascota": "m.nombre_mascota",
+    "raza": "m.raza",
+    "peso_kg": "m.peso",
+    "edad_estimada": "m.edad_estimada",
+    "estado_adop": "m.estado_adop",
+    "nombre_campus": "m.nombre_campus",
+}
+
+MASCOTA_CLAVES = [("m.nombre_mascota", str), ("m.chip_id", str)]
+
+
+def consulta_mascotas(fields=None, limit=LIMITE_DEFECTO, cursor=None,
+                      nombre_campus=None, estado_adop=None, raza=None):
+    return consulta_paginada(
+        MASCOTA_COLUMNAS,
+        "mascota m",
+        MASCOTA_CLAVES,
+        filtros=[
+            ("m.nombre_campus = %s", nombre_campus),
+            ("m.estado_adop = %s", estado_adop),
+            ("m.raza = %s", raza),
+        ],
+        fields=fields,
+        limit=limit,
+        cursor=cursor,
+    )
+
+
 @app.get("/mascotas")
-def listar_mascotas():
-    """
-    Lista todas las mascotas.
-    """
-    sql = """
-    SELECT 
-        m.chip_id,
-        m.nombre_mascota,
-        m.raza,
-        m.peso AS peso_kg,
-        m.edad_estimada,
-        m.estado_adop,
-        m.nombre_campus
-    FROM mascota m
-    ORDER BY m.nombre_mascota;
+async def listar_mascotas(
+    limit: int = LIMITE_DEFECTO,
+    cursor: str | None = None,
+    fields: str | None = None,
+    formato: Formato = Query("json", alias="format"),
+    nombre_campus: str | None = None,
+    estado_adop: str | None = None,
+    raza: str | None = None,
+):
+    """
+    Lista las mascotas por nombre, paginadas con cursor.
+    Filtros opcionales: nombre_campus, estado_adop, raza.
+    fields=chip_id,nombre_mascota limita las columnas devueltas.
+    format=ndjson|csv exporta todas las filas en streaming.
     """
+    sql, params, limit = consulta_mascotas(
+        fields, limit if formato == "json" else None, cursor,
+        nombre_campus=nombre_campus, estado_adop=estado_adop, raza=raza,
+    )
+    if formato != "json":
+        return respuesta_stream(sql, params, formato, "mascotas")
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute(sql)
-                rows = cur.fetchall()
-        return {"data": rows}
+        rows = await fetch_all(sql, params)
+        return RespuestaJSON(pagina(rows, limit, len(MASCOTA_CLAVES)))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/mascotas/{chip_id}")
-def obtener_mascota(chip_id: str):
+# --- Búsqueda de mascotas ---------------------------------------------------
+# /mascotas/search busca por nombre y raza sin distinguir mayúsculas ni
+# tildes, completa palabras a medio escribir y tolera errores de tipeo. El
+# índice vive en la memoria de cada proceso: se arma al iniciar y se rearma
+# en segundo plano cuando escuchar_cambios recibe avisos de la tabla mascota
+# (a lo más cada API_SEARCH_REFRESH segundos). Buscar no toca la base; solo
+# las filas del resultado se leen por chip_id, así los datos están al día.
+
+BUSQUEDA_ACTIVA = os.getenv("API_SEARCH", "1") == "1"
+BUSQUEDA_REFRESCO = float(os.getenv("API_SEARCH_REFRESH", "60"))
+BUSQUEDA_SIMILITUD = float(os.getenv("API_SEARCH_SIMILARITY", "0.3"))
+BUSQUEDA_LIMITE_DEFECTO = 20
+BUSQUEDA_LIMITE_MAXIMO = int(os.getenv("API_SEARCH_LIMIT_MAX", "100"))
+# Palabras del índice que completa, como mucho, una palabra de la consulta
+# (con una o dos letras pueden ser miles): se quedan las más frecuentes.
+BUSQUEDA_MAX_PREFIJOS = int(os.getenv("API_SEARCH_MAX_PREFIXES", "500"))
+# Si construir el índice falla, se reintenta con la siguiente búsqueda; tras
+# API_SEARCH_RETRIES fallos seguidos se espera entre intentos (1 s, 2 s, 4 s...
+# hasta API_SEARCH_REFRESH).
+BUSQUEDA_REINTENTOS = int(os.getenv("API_SEARCH_RETRIES", "3"))
+
+# Puntaje de cada palabra de la consulta según cómo calza con una palabra del
+# índice (parecido se multiplica por la similitud de trigramas). En la raza
+# vale un poco menos que en el nombre.
+PUNTAJE_EXACTO = 1.0
+PUNTAJE_PREFIJO = 0.9
+PUNTAJE_PARECIDO = 0.8
+PESO_RAZA = 0.8
+
+_SEPARADORES = re.compile(r"[^a-z0-9]+")
+
+
+def normalizar(texto):
     """
-    Devuelve el detalle de una mascota por chip_id.
+    Minúsculas, sin tildes (ñ -> n) y con las palabras separadas por espacios.
+    """
+    if not texto:
+        return ""
+    texto = unicodedata.normalize("NFKD", texto.lower()).encode("ascii", "ignore").decode()
+    return _SEPARADORES.sub(" ", texto).strip()
+
+
+def trigramas(palabra):
+    """
+    Trigramas de la palabra con el mismo relleno que pg_trgm ("  a", " ab", ..., "z ").
+    """
+    t = f"  {palabra} "
+    return {t[i:i + 3] for i in range(len(t) - 2)}
+
+
+def similitud(a, b):
+    return len(a & b) / len(a | b)
+
+
+def _bitmap(*listas):
+    """
+    Entero con el bit de cada fila de las listas (ordenadas) en 1: AND/OR de
+    enteros grandes corren en C, bastante más rápido que intersectar set()
+    de cientos de miles. Lo caro es int.from_bytes sobre todo el largo, así
+    que las listas de un mismo nivel se juntan en una sola llamada.
+    """
+    tope = max((filas[-1] for filas in listas if filas), default=-1)
+    if tope < 0:
+        return 0
+    bits = bytearray((tope >> 3) + 1)
+    for filas in listas:
+        for fila in filas:
+            bits[fila >> 3] |= 1 << (fila & 7)
+    return int.from_bytes(bits, "little")
+
+
+def _cuantas(filas):
+    """
+    Cantidad de filas de un bitmap o de una lista de filas.
+    """
+    return filas.bit_count() if isinstance(filas, int) else len(filas)
+
+
+def _primeras_filas(bits, cuantas):
+    """
+    Las primeras filas (bits en 1) de un bitmap, en orden.
+    """
+    filas = []
+    while bits and len(filas) < cuantas:
+        bajo = bits & -bits
+        filas.append(bajo.bit_length() - 1)
+        bits ^= bajo
+    return filas
+
+
+class IndiceBusqueda:
+    """
+    Índice invertido de las palabras normalizadas de nombre_mascota y raza.
+    Las filas se numeran en el orden de /mascotas (nombre_mascota, chip_id),
+    así a igual relevancia gana ese mismo orden. Las palabras frecuentes
+    (en más de 1 de cada 32 filas), los campus y los estados se guardan como
+    bitmap; las demás como lista de filas. Los números del nombre
+    ("Firulais 12") van aparte y solo calzan completos.
+    """
+
+    # Tope de combinaciones de puntaje por consulta (ver buscar).
+    MAX_COMBINACIONES = 200
+
+    def __init__(self):
+        self.filas = 0
+        # palabra -> bitmap (int) o filas (array "I" ordenado)
+        self.nombre: dict[str, int | array] = {}
+        self.raza: dict[str, int | array] = {}
+        # (número << 32) | fila, ordenado
+        self.numeros = array("Q")
+        # valor -> bitmap, para los filtros
+        self.campus: dict[str, int] = {}
+        self.estado: dict[str, int] = {}
+        self.vocabulario: list[str] = []
+        # filas en que aparece cada palabra del vocabulario (mismo orden)
+        self.frecuencia = array("I")
+        self.por_trigrama: dict[str, list[str]] = {}
+        # chip_id de todas las filas en un solo str (mucho menos memoria que
+        # una lista con 1M de str) y dónde empieza cada uno
+        self.chips = ""
+        self.inicio_chip = array("I", [0])
+        self.segundos = 0.0
+
+    @classmethod
+    def construir(cls, conn):
+        """
+        Lee mascota completa con un cursor del servidor (de a 10.000 filas).
+        """
+        indice = cls()
+        inicio = time.perf_counter()
+        chips, numeros, razas = [], [], {}
+        campus, estados = {}, {}
+        with conn.cursor(name="indice_busqueda") as cur:
+            cur.itersize = 10_000
+            cur.execute(
+                "SELECT chip_id, nombre_mascota, raza, nombre_campus, estado_adop "
+                "FROM mascota ORDER BY nombre_mascota, chip_id"
+            )
+            for fila, (chip_id, nombre, raza, nombre_campus, estado_adop) in enumerate(cur):
+                chips.append(chip_id)
+                for palabra in set(normalizar(nombre).split()):
+                    if not palabra.isdigit():
+                        indice.nombre.setdefault(palabra, array("I")).append(fila)
+                    elif len(palabra) <= 9:
+                        numeros.append(int(palabra) << 32 | fila)
+                if raza not in razas:
+                    razas[raza] = set(normalizar(raza).split())
+                for palabra in razas[raza]:
+                    indice.raza.setdefault(palabra, array("I")).append(fila)
+                campus.setdefault(nombre_campus, array("I")).append(fila)
+                estados.setdefault(estado_adop, array("I")).append(fila)
+
+        indice.filas = len(chips)
+        for palabras in (indice.nombre, indice.raza):
+            for palabra, filas in palabras.items():
+                if len(filas) * 32 >= indice.filas:
+                    palabras[palabra] = _bitmap(filas)
+        indice.campus = {c: _bitmap(filas) for c, filas in campus.items()}
+        indice.estado = {e: _bitmap(filas) for e, filas in estados.items()}
+        indice.numeros = array("Q", sorted(numeros))
+        indice.chips = "\n".join(chips)
+        indice.inicio_chip.extend(itertools.accumulate(len(c) + 1 for c in chips))
+        indice.vocabulario = sorted(indice.nombre.keys() | indice.raza.keys())
+        indice.frecuencia.extend(
+            sum(_cuantas(campo[v]) for campo in (indice.nombre, indice.raza) if v in campo)
+            for v in indice.vocabulario
+        )
+        for palabra in indice.vocabulario:
+            for t in trigramas(palabra):
+                indice.por_trigrama.setdefault(t, []).append(palabra)
+        indice.segundos = time.perf_counter() - inicio
+        return indice
+
+    def chip(self, fila):
+        return self.chips[self.inicio_chip[fila]:self.inicio_chip[fila + 1] - 1]
+
+    def stats(self):
+        return {
+            "filas": self.filas,
+            "palabras": len(self.vocabulario),
+            "segundos_construccion": round(self.segundos, 3),
+        }
+
+    def expandir(self, palabra):
+        """
+        {palabra del índice: puntaje} para una palabra de la consulta: ella
+        misma, las que empiezan con ella (hasta BUSQUEDA_MAX_PREFIJOS, las
+        más frecuentes) y las parecidas por trigramas (a la palabra completa
+        o a su comienzo del mismo largo).
+        """
+        puntajes = {}
+        desde = hasta = bisect.bisect_left(self.vocabulario, palabra)
+        while hasta < len(self.vocabulario) and self.vocabulario[hasta].startswith(palabra):
+            hasta += 1
+        prefijos = range(desde, hasta)
+        if len(prefijos) > BUSQUEDA_MAX_PREFIJOS:
+            prefijos = heapq.nlargest(BUSQUEDA_MAX_PREFIJOS, prefijos, key=self.frecuencia.__getitem__)
+            if self.vocabulario[desde] == palabra and desde not in prefijos:
+                prefijos.append(desde)
+        for i in prefijos:
+            v = self.vocabulario[i]
+            puntajes[v] = PUNTAJE_EXACTO if v == palabra else PUNTAJE_PREFIJO
+        if len(palabra) >= 3:
+            propios = trigramas(palabra)
+            # Trigramas en común con cada palabra del vocabulario, contados
+            # en los índices. El comienzo de v comparte a lo más esos mismos
+            # más su trigrama final ("xy "), y toda palabra tiene al menos
+            # min(largo + 1, 3) trigramas: si ni así se llega al umbral, se
+            # descarta sin armar sus trigramas (casi todas las candidatas).
+            comunes = Counter(itertools.chain.from_iterable(self.por_trigrama.get(t, ()) for t in propios))
+            final = palabra[-2:]
+            for v, n in comunes.items():
+                if v in puntajes:
+                    continue
+                c = n + (v[len(palabra) - 2:len(palabra)] == final)
+                if c < BUSQUEDA_SIMILITUD * (len(propios) + min(len(v) + 1, 3) - c):
+                    continue
+                s = max(similitud(propios, trigramas(v)), similitud(propios, trigramas(v[:len(palabra)])))
+                if s >= BUSQUEDA_SIMILITUD:
+                    puntajes[v] = PUNTAJE_PARECIDO * s
+        return puntajes
+
+    def _niveles(self, palabra, posibles):
+        """
+        [(puntaje, bitmap)] de una palabra de la consulta, de mayor a menor
+        puntaje; cada fila queda solo en el mejor nivel en que calza.
+        """
+        # puntaje -> (OR de los bitmaps, listas de filas a juntar en uno)
+        por_puntaje = {}
+        if palabra.isdigit():
+            if len(palabra) <= 9:
+                desde = bisect.bisect_left(self.numeros, int(palabra) << 32)
+                hasta = bisect.bisect_left(self.numeros, int(palabra) + 1 << 32)
+                por_puntaje[PUNTAJE_EXACTO] = (0, [[v & 0xFFFFFFFF for v in self.numeros[desde:hasta]]])
+        else:
+            for v, puntaje in self.expandir(palabra).items():
+                for campo, peso in ((self.nombre, 1.0), (self.raza, PESO_RAZA)):
+                    if v in campo:
+                        filas = campo[v]
+                        bits, listas = por_puntaje.setdefault(puntaje * peso, (0, []))
+                        if isinstance(filas, int):
+                            por_puntaje[puntaje * peso] = (bits | filas, listas)
+                        else:
+                            listas.append(filas)
+        niveles, vistas = [], 0
+        for puntaje in sorted(por_puntaje, reverse=True):
+            bits, listas = por_puntaje[puntaje]
+            bits = (bits | _bitmap(*listas)) & posibles & ~vistas
+            if bits:
+                niveles.append((puntaje, bits))
+                vistas |= bits
+        return niveles
+
+    def buscar(self, consulta, limit, nombre_campus=None, estado_adop=None):
+        """
+        [(fila, puntaje)] de las limit filas más relevantes. Cada palabra de
+        la consulta debe calzar con el nombre o la raza; el puntaje de la fila
+        es la suma del mejor calce de cada una.
+        """
+        posibles = (1 << self.filas) - 1
+        for valor, bitmaps in ((nombre_campus, self.campus), (estado_adop, self.estado)):
+            if valor is not None:
+                posibles &= bitmaps.get(valor, 0)
+        palabras = list(dict.fromkeys(normalizar(consulta).split()))
+        if not palabras or not posibles:
+            return []
+        niveles = []
+        for palabra in palabras:
+            niveles.append(self._niveles(palabra, posibles))
+            posibles &= functools.reduce(operator.or_, (bits for _, bits in niveles[-1]), 0)
+            if not posibles:
+                return []
+        niveles = [[(p, bits & posibles) for p, bits in n if bits & posibles] for n in niveles]
+
+        # Se recorren las combinaciones de niveles (uno por palabra) de mayor
+        # a menor puntaje total y se toman sus filas en orden, hasta juntar
+        # limit (terminando las combinaciones empatadas en ese total). Pasado
+        # el tope de combinaciones el resto sale en orden de fila, con su
+        # puntaje calculado una por una.
+        resultado, cubiertas, previas, ultimo = [], 0, 0, None
+        for n, (total, indices) in enumerate(_combinaciones(niveles)):
+            if total != ultimo:
+                if len(resultado) >= limit:
+                    break
+                previas, ultimo = len(resultado), total
+            if n == self.MAX_COMBINACIONES:
+                for fila in _primeras_filas(posibles & ~cubiertas, limit - previas):
+                    puntaje = sum(next(p for p, bits in nivel if bits >> fila & 1) for nivel in niveles)
+                    resultado.append((fila, puntaje))
+                break
+            bits = functools.reduce(operator.and_, (niveles[i][j][1] for i, j in enumerate(indices)))
+            if bits:
+                cubiertas |= bits
+                resultado += [(fila, total) for fila in _primeras_filas(bits, limit - previas)]
+        resultado.sort(key=lambda x: (-x[1], x[0]))
+        return resultado[:limit]
+
+
+def _combinaciones(niveles):
+    """
+    (total, índices) de las combinaciones de un nivel por palabra, de mayor
+    a menor total (búsqueda de mejor primero con un heap).
+    """
+    actual = (0,) * len(niveles)
+    heap = [(-sum(n[0][0] for n in niveles), actual)]
+    vistas = {actual}
+    while heap:
+        total, actual = heapq.heappop(heap)
+        yield round(-total, 6), actual
+        for i, j in enumerate(actual):
+            if j + 1 < len(niveles[i]):
+                siguiente = actual[:i] + (j + 1,) + actual[i + 1:]
+                if siguiente not in vistas:
+                    vistas.add(siguiente)
+                    heapq.heappush(heap, (total + niveles[i][j][0] - niveles[i][j + 1][0], siguiente))
+
+
+indice_busqueda: IndiceBusqueda | None = None
+cambios_mascota = asyncio.Event()
+# Lo marca /mascotas/search cuando no hay índice: pide reintentar ya.
+pedido_indice = asyncio.Event()
+
+
+def construir_indice_busqueda():
+    # Conexión aparte, como verificar_planes: no ocupa el pool.
+    with Connection.connect(**conninfo()) as conn:
+        return IndiceBusqueda.construir(conn)
+
+
+async def mantener_indice_busqueda():
+    """
+    Arma el índice al iniciar y lo rearma cuando hay cambios en mascota
+    (sin LISTEN, cada API_SEARCH_REFRESH segundos). Mientras se rearma se
+    sigue buscando en el anterior. Si falla, se reintenta con la próxima
+    búsqueda que no encuentre índice (o a los API_SEARCH_REFRESH segundos).
+    """
+    global indice_busqueda
+    fallos = 0
+    while True:
+        cambios_mascota.clear()
+        pedido_indice.clear()
+        try:
+            indice_busqueda = await asyncio.to_thread(construir_indice_busqueda)
+        except Exception as e:
+            fallos += 1
+            logger.warning("No se pudo construir el índice de búsqueda (intento %d): %s", fallos, e)
+            if fallos >= BUSQUEDA_REINTENTOS:
+                await asyncio.sleep(min(BUSQUEDA_REFRESCO, 2 ** (fallos - BUSQUEDA_REINTENTOS)))
+            try:
+                await asyncio.wait_for(pedido_indice.wait(), BUSQUEDA_REFRESCO)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        fallos = 0
+        logger.info("Índice de búsqueda: %s", indice_busqueda.stats())
+        if CACHE_LISTEN:
+            await cambios_mascota.wait()
+        await asyncio.sleep(BUSQUEDA_REFRESCO)
+
+
+@app.get("/mascotas/search")
+async def buscar_mascotas(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = BUSQUEDA_LIMITE_DEFECTO,
+    nombre_campus: str | None = None,
+    estado_adop: str | None = None,
+):
     """
-    sql = """
-    SELECT 
-        m.chip_id,
-        m.nombre_mascota,
-        m.raza,
-        m.peso AS peso_kg,
-        m.edad_estimada,
-        m.estado_adop,
-        m.nombre_campus
-    FROM mascota m
-    WHERE m.chip_id = %s;
+    Busca mascotas por nombre y raza, de la más a la menos relevante
+    (campo "relevancia"). Ignora mayúsculas y tildes, completa palabras y
+    tolera errores de tipeo: "lab", "labrdor" y "Lúcas" encuentran
+    Labrador y Lucas. Filtros opcionales: nombre_campus, estado_adop.
     """
+    indice = indice_busqueda
+    if indice is None:
+        pedido_indice.set()
+        raise HTTPException(
+            status_code=503,
+            detail="El índice de búsqueda se está construyendo",
+            headers={"Retry-After": "5"},
+        )
+    limit = max(1, min(limit, BUSQUEDA_LIMITE_MAXIMO))
+    # Con palabras cortas los bitmaps son grandes: en un hilo, para no
+    # detener el event loop mientras tanto.
+    encontradas = await asyncio.to_thread(indice.buscar, q, limit, nombre_campus, estado_adop)
+    if not encontradas:
+        return RespuestaJSON({"data": []})
+    chips = [indice.chip(fila) for fila, _ in encontradas]
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute(sql, (chip_id,))
-                row = cur.fetchone()
+        rows = await fetch_all(CONSULTAS["mascotas_por_chip"], (chips,))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    por_chip = {row["chip_id"]: row for row in rows}
+    data = []
+    for chip_id, (_, puntaje) in zip(chips, encontradas):
+        row = por_chip.get(chip_id)
+        # El índice puede ir atrasado: se omiten las que ya no existen o ya
+        # no cumplen los filtros.
+        if row is None or nombre_campus not in (None, row["nombre_campus"]) \
+                or estado_adop not in (None, row["estado_adop"]):
+            continue
+        data.append({**row, "relevancia": round(puntaje, 3)})
+    return RespuestaJSON({"data": data})
+
+
+@app.get("/mascotas/{chip_id}")
+async def obtener_mascota(chip_id: str, request: Request):
+    """
+    Devuelve el detalle de una mascota por chip_id.
+    """
+    async def consultar():
+        row = await fetch_one(CONSULTAS["mascota"], (chip_id,))
         if row is None:
             raise HTTPException(status_code=404, detail="Mascota no encontrada")
         return row
+
+    try:
+        return await respuesta_cacheada(request, "mascota", consultar, [f"chip:{chip_id}"])
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/sucursales")
-def listar_sucursales():
+async def listar_sucursales(request: Request):
     """
     Devuelve la lista de sucursales/campus registradas.
     """
-    sql = """
-    SELECT 
-        nombre_campus,
-        direccion
-    FROM sucursal
-    ORDER BY nombre_campus;
-    """
-    try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute(sql)
-                rows = cur.fetchall()
+    async def consultar():
+        rows = await fetch_all(CONSULTAS["sucursales"])
 
         sucursales = [
-            {"nombre_campus": r[0], "direccion": r[1]} for r in rows
+            {"nombre_campus": r["nombre_campus"], "direccion": r["direccion"]} for r in rows
         ]
 
         return {"data": sucursales}
+
+    try:
+        return await respuesta_cacheada(request, "sucursales", consultar, ["sucursal:*"])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/reportes/mascotas-por-campus")
-def mascotas_por_campus():
+async def mascotas_por_campus(request: Request):
     """
     Número de mascotas por campus.
     """
-    sql = """
-    SELECT 
-        s.nombre_campus,
-        COUNT(m.chip_id) AS total_mascotas
-    FROM sucursal s
-    LEFT JOIN mascota m 
-        ON m.nombre_campus = s.nombre_campus
-    GROUP BY s.nombre_campus
-    ORDER BY total_mascotas DESC;
-    """
+    async def consultar():
+        rows = await fetch_all(CONSULTAS["mascotas_por_campus"])
+        return {"data": rows}
+
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute(sql)
-                rows = cur.fetchall()
+        return await respuesta_cacheada(request, "reportes", consultar, ["mascota:*", "sucursal:*"])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+
+@app.get("/reportes/campus")
+async def resumen_por_campus(request: Request):
+    """
+    Dashboard por campus: mascotas, stock de comida, kg por mascota e ítems
+    con stock crítico. Lee la tabla resumen_campus (migraciones/002), que los
+    triggers mantienen al día.
+    """
+    async def consultar():
+        rows = await fetch_all(CONSULTAS["resumen_campus"])
         return {"data": rows}
+
+    try:
+        return await respuesta_cacheada(
+            request, "reportes", consultar, ["mascota:*", "inventario:*", "sucursal:*"]
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/mascotas/{chip_id}/vacunas")
-def vacunas_de_mascota(chip_id: str):
+async def vacunas_de_mascota(chip_id: str, request: Request):
     """
     Historial de vacunas de una mascota.
     """
-    sql = """
-    SELECT 
-        v.id_vacuna,
-        v.nombre_vacuna,
-        v.fecha_aplicacion
-    FROM vacuna v
-    WHERE v.chip_id = %s
-    ORDER BY v.fecha_aplicacion DESC;
-    """
-    try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute(sql, (chip_id,))
-                rows = cur.fetchall()
+    async def consultar():
+        rows = await fetch_all(CONSULTAS["vacunas_mascota"], (chip_id,))
         return {"data": rows}
+
+    try:
+        return await respuesta_cacheada(request, "mascota", consultar, [f"chip:{chip_id}"])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+TRATAMIENTO_COLUMNAS = {
+    "id_tratamiento": "t.id_tratamiento",
+    "chip_id": "t.chip_id",
+    "nombre_mascota": "m.nombre_mascota",
+    "descripcion": "t.descripcion",
+    "fecha_tratamiento_inic": "t.fecha_tratamiento_inic",
+    "fecha_tratamiento_fin": "t.fecha_tratamiento_fin",
+}
+
+# fecha_tratamiento_inic admite NULL (ver migraciones/004_claves_con_nulos.sql).
+TRATAMIENTO_CLAVES = [
+    *clave_con_nulos("t.fecha_tratamiento_inic", datetime.date, "DATE 'epoch'"),
+    ("t.id_tratamiento", int),
+]
+
+
+def consulta_tratamientos(fields=None, limit=LIMITE_DEFECTO, cursor=None, nombre_campus=None):
+    return consulta_paginada(
+        TRATAMIENTO_COLUMNAS,
+        "tratamiento t JOIN mascota m ON m.chip_id = t.chip_id",
+        TRATAMIENTO_CLAVES,
+        filtros=[
+            ("t.fecha_tratamiento_fin IS NULL OR t.fecha_tratamiento_fin < CURRENT_DATE", True),
+            ("m.nombre_campus = %s", nombre_campus),
+        ],
+        fields=fields,
+        limit=limit,
+        cursor=cursor,
+    )
+
+
 @app.get("/tratamientos")
-def tratamientos_hechos():
-    """
-    Historial de tratamientos realizados.
-    """
-    sql = """
-    SELECT 
-        t.id_tratamiento,
-        t.chip_id,
-        m.nombre_mascota,
-        t.descripcion,
-        t.fecha_tratamiento_inic,
-        t.fecha_tratamiento_fin
-    FROM tratamiento t
-    JOIN mascota m ON m.chip_id = t.chip_id
-    WHERE t.fecha_tratamiento_fin IS NULL OR t.fecha_tratamiento_fin < CURRENT_DATE
-    ORDER BY t.fecha_tratamiento_inic;
+async def tratamientos_hechos(
+    limit: int = LIMITE_DEFECTO,
+    cursor: str | None = None,
+    fields: str | None = None,
+    formato: Formato = Query("json", alias="format"),
+    nombre_campus: str | None = None,
+):
+    """
+    Historial de tratamientos realizados, paginado con cursor.
+    format=ndjson|csv exporta todas las filas en streaming.
     """
+    sql, params, limit = consulta_tratamientos(
+        fields, limit if formato == "json" else None, cursor, nombre_campus=nombre_campus,
+    )
+    if formato != "json":
+        return respuesta_stream(sql, params, formato, "tratamientos")
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute(sql)
-                rows = cur.fetchall()
-        return {"data": rows}
+        rows = await fetch_all(sql, params)
+        return RespuestaJSON(pagina(rows, limit, len(TRATAMIENTO_CLAVES)))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/mascotas/{chip_id}/tratamientos")
-def tratamientos_de_mascota(chip_id: str):
+async def tratamientos_de_mascota(chip_id: str, request: Request):
     """
     Lista de tratamientos de una mascota (historial).
     """
-    sql = """
-    SELECT 
-        t.id_tratamiento,
-        t.descripcion,
-        t.fecha_inicio,
-        t.fecha_fin
-    FROM tratamiento t
-    WHERE t.chip_id = %s
-    ORDER BY t.fecha_inicio DESC;
-    """
-    try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute(sql, (chip_id,))
-                rows = cur.fetchall()
+    async def consultar():
+        rows = await fetch_all(CONSULTAS["tratamientos_mascota"], (chip_id,))
         return {"data": rows}
+
+    try:
+        return await respuesta_cacheada(request, "mascota", consultar, [f"chip:{chip_id}"])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+COMIDA_COLUMNAS = {
+    "nombre_item": "i.nombre",
+    "unidad_de_medida": "i.unidad_de_medida",
+    "cantidad": "i.cantidad",
+    "nombre_campus": "i.nombre_campus",
+    "fecha_venc": "i.fecha_venc",
+}
+
+COMIDA_CLAVES = [*clave_con_nulos("i.nombre_campus", str, "''"), ("i.nombre", str), ("i.id_item", int)]
+
+
+def consulta_comida(fields=None, limit=LIMITE_DEFECTO, cursor=None, nombre_campus=None, critico=False):
+    return consulta_paginada(
+        COMIDA_COLUMNAS,
+        "inventario i",
+        COMIDA_CLAVES,
+        filtros=[
+            ("i.tipo = 'Comida'", True),
+            ("i.cantidad < 10", True if critico else None),
+            # = nombre_campus, escrito sobre las expresiones de COMIDA_CLAVES
+            # para que el índice de 004 sirva al filtro y al orden a la vez.
+            ("NOT (i.nombre_campus IS NULL) AND COALESCE(i.nombre_campus, '') = %s", nombre_campus),
+        ],
+        fields=fields,
+        limit=limit,
+        cursor=cursor,
+    )
+
+
 @app.get("/inventario/comida")
-def inventario_comida(critico: bool = False):
+async def inventario_comida(
+    request: Request,
+    critico: bool = False,
+    limit: int = LIMITE_DEFECTO,
+    cursor: str | None = None,
+    fields: str | None = None,
+    formato: Formato = Query("json", alias="format"),
+    nombre_campus: str | None = None,
+):
     """
-    Lista alimentos por campus.
+    Lista alimentos por campus, paginados con cursor.
     Si critico = true, solo muestra stock bajo (< 10).
+    format=ndjson|csv exporta todas las filas en streaming.
     """
-    base_sql = """
-    SELECT 
-        i.nombre AS nombre_item,
-        i.unidad_de_medida,
-        i.cantidad,
-        i.nombre_campus,
-        i.fecha_venc
-    FROM inventario i
-    WHERE i.tipo = 'Comida'
-    """
-    if critico:
-        base_sql += " AND i.cantidad < 10 "
-    base_sql += " ORDER BY i.nombre_campus, i.nombre;"
+    sql, params, limit = consulta_comida(
+        fields, limit if formato == "json" else None, cursor,
+        nombre_campus=nombre_campus, critico=critico,
+    )
+    if formato != "json":
+        return respuesta_stream(sql, params, formato, "inventario_comida")
+    async def consultar():
+        rows = await fetch_all(sql, params)
+        return pagina(rows, limit, len(COMIDA_CLAVES))
 
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute(base_sql)
-                rows = cur.fetchall()
-        return {"data": rows}
+        return await respuesta_cacheada(
+            request, "inventario", consultar, [f"inventario:{nombre_campus or '*'}"]
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+MEDICAMENTO_COLUMNAS = {
+    "nombre_campus": "s.nombre_campus",
+    "medicamento": "i.nombre",
+    "cantidad": "i.cantidad",
+    "gramaje": "med.gramaje",
+}
+
+MEDICAMENTO_CLAVES = [("s.nombre_campus", str), ("i.nombre", str), ("i.id_item", int)]
+
+
+def consulta_medicamentos(fields=None, limit=LIMITE_DEFECTO, cursor=None, nombre_campus=None):
+    return consulta_paginada(
+        MEDICAMENTO_COLUMNAS,
+        """inventario i
+        JOIN sucursal s
+            ON i.nombre_campus = s.nombre_campus
+        JOIN medicamento med
+            ON med.id_item = i.id_item""",
+        MEDICAMENTO_CLAVES,
+        filtros=[
+            ("i.tipo = 'Medicamento'", True),
+            ("s.nombre_campus = %s", nombre_campus),
+        ],
+        fields=fields,
+        limit=limit,
+        cursor=cursor,
+    )
+
+
 @app.get("/inventario/medicamentos")
-def inventario_medicamentos():
-    """
-    Lista medicamentos por campus, incluyendo gramaje.
-    """
-    sql = """
-    SELECT 
-        s.nombre_campus,
-        i.nombre AS medicamento,
-        i.cantidad,
-        med.gramaje
-    FROM inventario i
-    JOIN sucursal s
-        ON i.nombre_campus = s.nombre_campus
-    JOIN medicamento med
-        ON med.id_item = i.id_item
-    WHERE i.tipo = 'Medicamento'
-    ORDER BY s.nombre_campus, i.nombre;
+async def inventario_medicamentos(
+    request: Request,
+    limit: int = LIMITE_DEFECTO,
+    cursor: str | None = None,
+    fields: str | None = None,
+    formato: Formato = Query("json", alias="format"),
+    nombre_campus: str | None = None,
+):
     """
+    Lista medicamentos por campus, incluyendo gramaje, paginados con cursor.
+    format=ndjson|csv exporta todas las filas en streaming.
+    """
+    sql, params, limit = consulta_medicamentos(
+        fields, limit if formato == "json" else None, cursor, nombre_campus=nombre_campus,
+    )
+    if formato != "json":
+        return respuesta_stream(sql, params, formato, "inventario_medicamentos")
+    async def consultar():
+        rows = await fetch_all(sql, params)
+        return pagina(rows, limit, len(MEDICAMENTO_CLAVES))
+
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute(sql)
-                rows = cur.fetchall()
-        return {"data": rows}
+        return await respuesta_cacheada(
+            request, "inventario", consultar, [f"inventario:{nombre_campus or '*'}"]
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/mascotas/{chip_id}/derivaciones")
-def derivaciones_de_mascota(chip_id: str):
+async def derivaciones_de_mascota(chip_id: str, request: Request):
     """
     Historial de derivaciones de una mascota a veterinarias.
     """
-    sql = """
-    SELECT 
-        d.id_derivacion,
-        d.veterinaria,
-        d.motivo,
-        d.fecha_derivacion
-    FROM derivacion d
-    WHERE d.chip_id = %s
-    ORDER BY d.fecha_derivacion DESC;
+    async def consultar():
+        rows = await fetch_all(CONSULTAS["derivaciones_mascota"], (chip_id,))
+        return {"data": rows}
+
+    try:
+        return await respuesta_cacheada(request, "mascota", consultar, [f"chip:{chip_id}"])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Secciones del perfil: cada una es un subquery que arma un arreglo JSON
+# con el mismo contenido que su endpoint /mascotas/{chip_id}/<seccion>.
+PERFIL_SECCIONES = {
+    "vacunas": """
+        SELECT COALESCE(json_agg(json_build_object(
+            'id_vacuna', v.id_vacuna,
+            'nombre_vacuna', v.nombre_vacuna,
+            'fecha_aplicacion', v.fecha_aplicacion
+        ) ORDER BY v.fecha_aplicacion DESC), '[]'::json)
+        FROM vacuna v
+        WHERE v.chip_id = m.chip_id
+    """,
+    "tratamientos": """
+        SELECT COALESCE(json_agg(json_build_object(
+            'id_tratamiento', t.id_tratamiento,
+            'descripcion', t.descripcion,
+            'fecha_inicio', t.fecha_inicio,
+            'fecha_fin', t.fecha_fin
+        ) ORDER BY t.fecha_inicio DESC), '[]'::json)
+        FROM tratamiento t
+        WHERE t.chip_id = m.chip_id
+    """,
+    "derivaciones": """
+        SELECT COALESCE(json_agg(json_build_object(
+            'id_derivacion', d.id_derivacion,
+            'veterinaria', d.veterinaria,
+            'motivo', d.motivo,
+            'fecha_derivacion', d.fecha_derivacion
+        ) ORDER BY d.fecha_derivacion DESC), '[]'::json)
+        FROM derivacion d
+        WHERE d.chip_id = m.chip_id
+    """,
+}
+
+
+def consulta_perfil(secciones, varios=False):
+    """
+    SELECT de la mascota con las secciones pedidas como subqueries (un solo
+    viaje a la base). varios=True filtra por chip_id = ANY(%s) para
+    /mascotas/batch (la lista va como un arreglo de texto, igual que en
+    mascotas_por_chip).
+    """
+    select = [f"{expr} AS {c}" for c, expr in MASCOTA_COLUMNAS.items()]
+    select += [f"({PERFIL_SECCIONES[s]}) AS {s}" for s in secciones]
+    condicion = "m.chip_id = ANY(%s)" if varios else "m.chip_id = %s"
+    return f"SELECT {', '.join(select)} FROM mascota m WHERE {condicion}"
+
+
+# El perfil completo (sin include) es el pedido habitual: se registra para
+# prepararlo desde el primer uso, como las demás CONSULTAS.
+CONSULTAS["perfil"] = consulta_perfil(list(PERFIL_SECCIONES))
+
+
+@app.get("/mascotas/{chip_id}/perfil")
+async def perfil_de_mascota(chip_id: str, request: Request, include: str | None = None):
+    """
+    Detalle de una mascota junto con sus historiales, en una sola consulta.
+    include=vacunas,derivaciones elige las secciones (por defecto todas).
     """
+    secciones = parse_fields(include, PERFIL_SECCIONES)
+    sql = CONSULTAS["perfil"] if include is None else consulta_perfil(secciones)
+    async def consultar():
+        row = await fetch_one(sql, (chip_id,))
+        if row is None:
+            raise HTTPException(status_code=404, detail="Mascota no encontrada")
+        return row
+
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute(sql, (chip_id,))
-                rows = cur.fetchall()
-        return {"data": rows}
+        return await respuesta_cacheada(request, "mascota", consultar, [f"chip:{chip_id}"])
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+BATCH_MAXIMO = int(os.getenv("API_BATCH_MAX", "5000"))
+
+
+class BatchMascotas(BaseModel):
+    chip_ids: list[str]
+    include: list[str] = []
+
+
+@app.post("/mascotas/batch")
+async def mascotas_batch(body: BatchMascotas):
+    """
+    Detalle de muchas mascotas en una sola consulta (chip_id = ANY).
+    include puede pedir vacunas, tratamientos y/o derivaciones por mascota.
+    La respuesta respeta el orden de chip_ids; los que no existen vienen
+    como {"chip_id": ..., "encontrada": false}.
+    """
+    if len(body.chip_ids) > BATCH_MAXIMO:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo {BATCH_MAXIMO} chip_id por solicitud",
+        )
+    secciones = parse_fields(",".join(body.include), PERFIL_SECCIONES) if body.include else []
+    # Sin repetidas (en el orden pedido): cada sección es una columna del SELECT.
+    secciones = list(dict.fromkeys(secciones))
+    if not body.chip_ids:
+        return RespuestaJSON({"data": []})
+    sql = consulta_perfil(secciones, varios=True)
+    try:
+        rows = await fetch_all(sql, (list(dict.fromkeys(body.chip_ids)),))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    por_chip = {r["chip_id"]: r for r in rows}
+    data = []
+    for chip_id in body.chip_ids:
+        row = por_chip.get(chip_id)
+        if row is None:
+            data.append({"chip_id": chip_id, "encontrada": False})
+        else:
+            data.append({**row, "encontrada": True})
+    return RespuestaJSON({"data": data})
+
+
+# --- Verificación de planes -------------------------------------------------
+# Al iniciar se corre EXPLAIN sobre la consulta de cada endpoint, con los
+# valores de una mascota real, y se avisa en el log si alguna recorre entera
+# una tabla grande: casi siempre falta un índice de migraciones/ (003, 004).
+
+PLANES_VERIFICAR = os.getenv("API_EXPLAIN_CHECK", "1") == "1"
+PLANES_MIN_FILAS = int(os.getenv("API_EXPLAIN_MIN_ROWS", "10000"))
+
+# Rutas que por diseño leen la tabla completa (agregados de reportes).
+PLANES_TABLA_COMPLETA = {"/reportes/mascotas-por-campus"}
+
+verificacion_planes: dict = {"estado": "pendiente", "consultas": []}
+
+
+def consultas_a_verificar(muestra):
+    """
+    (ruta, sql, params) de cada endpoint; los listados van sin filtros y con
+    cada filtro por separado.
+    """
+    chip = (muestra["chip_id"],)
+    consultas = [
+        ("/mascotas/{chip_id}", CONSULTAS["mascota"], chip),
+        ("/sucursales", CONSULTAS["sucursales"], None),
+        ("/reportes/mascotas-por-campus", CONSULTAS["mascotas_por_campus"], None),
+        ("/reportes/campus", CONSULTAS["resumen_campus"], None),
+        ("/mascotas/{chip_id}/vacunas", CONSULTAS["vacunas_mascota"], chip),
+        ("/mascotas/{chip_id}/tratamientos", CONSULTAS["tratamientos_mascota"], chip),
+        ("/mascotas/{chip_id}/derivaciones", CONSULTAS["derivaciones_mascota"], chip),
+        ("/mascotas/{chip_id}/perfil", CONSULTAS["perfil"], chip),
+        ("/mascotas/batch", consulta_perfil(list(PERFIL_SECCIONES), varios=True), ([muestra["chip_id"]],)),
+        ("/mascotas/search", CONSULTAS["mascotas_por_chip"], ([muestra["chip_id"]],)),
+    ]
+    campus = muestra["nombre_campus"]
+    listados = [
+        ("/mascotas", consulta_mascotas,
+         {"nombre_campus": campus, "estado_adop": muestra["estado_adop"], "raza": muestra["raza"]}),
+        ("/tratamientos", consulta_tratamientos, {"nombre_campus": campus}),
+        ("/inventario/comida", consulta_comida, {"nombre_campus": campus, "critico": True}),
+        ("/inventario/medicamentos", consulta_medicamentos, {"nombre_campus": campus}),
+    ]
+    for ruta, armar, filtros in listados:
+        sql, params, _ = armar()
+        consultas.append((ruta, sql, params))
+        for nombre, valor in filtros.items():
+            sql, params, _ = armar(**{nombre: valor})
+            consultas.append((f"{ruta}?{nombre}", sql, params))
+    return consultas
+
+
+def _seq_scans(nodo, filas, salida):
+    if nodo.get("Node Type") == "Seq Scan":
+        tabla = nodo.get("Relation Name")
+        if filas.get(tabla, 0) >= PLANES_MIN_FILAS:
+            salida.append({"tabla": tabla, "filas": int(filas[tabla]), "filtro": nodo.get("Filter")})
+    for hijo in nodo.get("Plans", ()):
+        _seq_scans(hijo, filas, salida)
+    return salida
+
+
+def verificar_planes():
+    """
+    EXPLAIN de cada consulta de consultas_a_verificar en una conexión aparte
+    (no ocupa el pool ni cuenta en las métricas). Avisa por log de cada Seq
+    Scan sobre una tabla con al menos API_EXPLAIN_MIN_ROWS filas estimadas
+    y deja el detalle en verificacion_planes (ver /planes).
+    """
+    inicio = time.perf_counter()
+    with Connection.connect(**conninfo(), row_factory=dict_row, autocommit=True) as conn:
+        conn.execute("SET statement_timeout = '5s'")
+        filas = {
+            r["relname"]: r["reltuples"]
+            for r in conn.execute(
+                "SELECT relname, reltuples FROM pg_class "
+                "WHERE relkind IN ('r', 'p') AND relnamespace = 'public'::regnamespace"
+            )
+        }
+        muestra = conn.execute(
+            "SELECT chip_id, nombre_campus, estado_adop, raza FROM mascota LIMIT 1"
+        ).fetchone()
+        if muestra is None:
+            verificacion_planes.update(estado="sin datos", consultas=[])
+            return verificacion_planes
+        resultado = []
+        for ruta, sql, params in consultas_a_verificar(muestra):
+            plan = conn.execute("EXPLAIN (FORMAT JSON) " + sql, params).fetchone()["QUERY PLAN"][0]["Plan"]
+            scans = [] if ruta in PLANES_TABLA_COMPLETA else _seq_scans(plan, filas, [])
+            resultado.append({"ruta": ruta, "costo": plan["Total Cost"], "seq_scans": scans})
+            for scan in scans:
+                logger.warning(
+                    "EXPLAIN %s: Seq Scan sobre %s (~%d filas)%s; ¿falta aplicar alguna migración de migraciones/?",
+                    ruta, scan["tabla"], scan["filas"],
+                    f", filtro {scan['filtro']}" if scan["filtro"] else "",
+                )
+    verificacion_planes.update(
+        estado="ok",
+        segundos=round(time.perf_counter() - inicio, 3),
+        con_seq_scan=sum(1 for r in resultado if r["seq_scans"]),
+        consultas=resultado,
+    )
+    return verificacion_planes
+
+
+async def verificar_planes_en_fondo():
+    try:
+        await asyncio.to_thread(verificar_planes)
+    except Exception as e:
+        verificacion_planes.update(estado=f"error: {e}", consultas=[])
+        logger.warning("No se pudo verificar los planes de consulta: %s", e)
+
+
+@app.get("/cache")
+async def estado_cache():
+    """
+    Contadores de la caché de respuestas (hits, misses, evictions...).
+    """
+    return cache.stats()
+
+
+@app.get("/metrics")
+async def exponer_metricas():
+    """
+    Métricas en formato Prometheus: histogramas por ruta y consulta, más
+    el estado del pool, de la caché y del índice de búsqueda.
+    """
+    extra = [
+        (f"perruls_pool_{k.removeprefix('pool_')}", "gauge", f"Estadística del pool: {k}", v)
+        for k, v in sorted(pool.get_stats().items())
+    ]
+    extra += [
+        (f"perruls_cache_{k}", "gauge", f"Caché de respuestas: {k}", v)
+        for k, v in cache.stats().items()
+    ]
+    if indice_busqueda is not None:
+        extra += [
+            (f"perruls_busqueda_{k}", "gauge", f"Índice de búsqueda: {k}", v)
+            for k, v in indice_busqueda.stats().items()
+        ]
+    return Response(
+        content=metricas.exponer(extra),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+@app.get("/metrics/resumen")
+async def resumen_metricas():
+    """
+    p50/p95/p99 en ms por ruta y consulta, con el texto de cada consulta.
+    """
+    return metricas.resumen()
+
+
+@app.get("/planes")
+async def planes_de_consulta(refrescar: bool = False):
+    """
+    Resultado de la verificación de planes del inicio (EXPLAIN de cada
+    endpoint y los Seq Scan sobre tablas grandes). refrescar=true la repite,
+    por ejemplo después de aplicar una migración.
+    """
+    if refrescar:
+        await verificar_planes_en_fondo()
+    return verificacion_planes
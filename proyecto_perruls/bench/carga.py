@@ -0,0 +1,825 @@
+"""
+Benchmark de carga de PERRULS contra un Postgres local.
+
+Crea el esquema (bench/esquema.sql) en una base aparte, siembra datos
+sintéticos deterministas a la escala pedida, aplica migraciones/*.sql y
+luego mide con varios clientes concurrentes:
+
+  - api: todos los endpoints de api_perruls.py por HTTP, contra un uvicorn
+    que levanta el propio script (o uno ya corriendo, con --url);
+  - gui: las acciones rápidas de la GUI (QUICK_ACTIONS) con PGClient, tal
+    como las ejecuta la GUI (primera página + count), y una pasada con el
+    resultado completo para medir memoria.
+
+Reporta throughput, latencias p50/p95/p99, CPU (del proceso medido y de
+Postgres, por petición) y memoria, y guarda todo en JSON
+(bench/resultados/) para comparar versiones con el subcomando comparar.
+
+La conexión se toma de DB_HOST/DB_USER/DB_PASS/DB_PORT, como la API; la base
+es BENCH_DB_NAME (por defecto perruls_bench) y se crea si no existe.
+¡preparar borra las tablas de esa base!
+
+Uso:
+  python bench/carga.py preparar --escala 100k [--nombres 40000]
+  python bench/carga.py correr --escala 100k [--modo async] [--concurrencia 16]
+                               [--duracion 30] [--solo api|gui] [--url http://...]
+  python bench/carga.py comparar base.json nuevo.json [--umbral 10]
+"""
+import argparse
+import datetime
+import importlib.util
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import urllib.parse
+
+import psycopg
+
+DIR_BENCH = os.path.dirname(os.path.abspath(__file__))
+DIR_PROYECTO = os.path.dirname(DIR_BENCH)
+DIR_RESULTADOS = os.path.join(DIR_BENCH, "resultados")
+
+ESCALAS = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+BENCH_DB = os.getenv("BENCH_DB_NAME", "perruls_bench")
+
+CAMPUS_BASE = ["Isabel Bongard", "Tres Pascualas", "San Andrés"]
+RAZAS = ["Quiltro", "Labrador", "Poodle", "Pastor Alemán", "Beagle",
+         "Golden", "Chihuahua", "Dálmata", "Bulldog", "Schnauzer"]
+ESTADOS = ["Disponible", "Adoptado", "En tratamiento"]
+# Lo que se escribe en el buscador: comienzos, errores de tipeo, sin tildes
+# y combinaciones de nombre y raza.
+BUSQUEDAS = ["f", "firu", "canela", "lucas", "tona", "nato", "pelsua", "labrdor",
+             "pastor alem", "bigotes d", "mancha pastor", "chispa", "golden", "p s", "ma"]
+# Nombres de mascota distintos. Con el valor por defecto son los 12 de
+# NOMBRES, en ciclo; con más (--nombres 40000, como una base real) los
+# primeros siguen siendo esos y el resto se arma con SILABAS, con una
+# distribución sesgada: pocos nombres muy repetidos y una cola larga.
+NOMBRES = ["Firulais", "Canela", "Negro", "Mancha", "Lúcas", "Peludo", "Chispa",
+           "Toña", "Maní", "Bigotes", "Ñato", "Pelusa"]
+SILABAS = [
+    ["Ba", "Be", "Bo", "Ca", "Co", "Cu", "Da", "Do", "Fa", "Fe", "Fi", "Ga", "Go", "Ki", "La",
+     "Lu", "Ma", "Mi", "Mo", "Na", "Ne", "Pa", "Pe", "Pi", "Ro", "Sa", "Si", "Ta", "To", "Za"],
+    ["la", "li", "lo", "lu", "ma", "mi", "mo", "na", "ni", "no", "ra", "ri", "ro", "ru", "sa",
+     "si", "so", "ta", "ti", "to", "ba", "bi", "bo", "ca", "co", "da", "di", "do", "fa", "fi",
+     "ga", "go", "ja", "ju", "ka", "ko", "pa", "pi", "va", "vi"],
+    ["", "n", "s", "r", "l", "x", "to", "ta", "na", "no", "la", "lo", "ra", "ro", "sa", "so",
+     "co", "ca", "fi", "ne", "li", "ni", "ti", "mo", "ma", "ri", "ru", "do", "da", "ba", "bi",
+     "chi", "cha", "ke", "ko", "pe", "po", "te", "zo", "zu"],
+]
+MAX_NOMBRES = len(NOMBRES) + len(SILABAS[0]) * len(SILABAS[1]) * len(SILABAS[2])
+
+
+def parametros_db(dbname: str) -> dict:
+    return {
+        "host": os.getenv("DB_HOST", "localhost"),
+        "dbname": dbname,
+        "user": os.getenv("DB_USER", "perruls"),
+        "password": os.getenv("DB_PASS", ""),
+        "port": int(os.getenv("DB_PORT", "5432")),
+    }
+
+
+def conectar(dbname: str = BENCH_DB, **kw) -> psycopg.Connection:
+    return psycopg.connect(**parametros_db(dbname), **kw)
+
+
+def campus_para(n: int) -> list[str]:
+    """Los tres campus reales más campus sintéticos a escalas grandes."""
+    extra = min(200, n // 50_000)
+    return CAMPUS_BASE + [f"Campus {i:03d}" for i in range(1, extra + 1)]
+
+
+def chip(i: int) -> str:
+    return f"CHIP{i:08d}"
+
+
+# ---------------------------------------------------------------------------
+# Siembra
+# ---------------------------------------------------------------------------
+
+# Todo se genera en el servidor con generate_series y valores derivados del
+# número de fila, así dos corridas a la misma escala tienen los mismos datos.
+# %(n)s = mascotas; %(campus)s = lista de campus; %(razas)s, %(estados)s;
+# %(nombres)s = nombres distintos (ver NOMBRES y SILABAS).
+SIEMBRA = [
+    ("sucursal", """
+        INSERT INTO sucursal (nombre_campus, direccion)
+        SELECT c, 'Dirección ' || c FROM unnest(%(campus)s::text[]) AS c
+    """),
+    ("mascota", """
+        INSERT INTO mascota
+        SELECT 'CHIP' || lpad(g::text, 8, '0'),
+               CASE WHEN k < cardinality(%(nombres_base)s::text[]) THEN (%(nombres_base)s::text[])[1 + k]
+                    ELSE (%(silabas1)s::text[])[1 + k %% %(n1)s]
+                         || (%(silabas2)s::text[])[1 + k / %(n1)s %% %(n2)s]
+                         || (%(silabas3)s::text[])[1 + k / (%(n1)s * %(n2)s) %% %(n3)s]
+               END || ' ' || g,
+               (%(razas)s::text[])[1 + (g * 7) %% cardinality(%(razas)s::text[])],
+               round((3 + (g * 13) %% 400 / 10.0)::numeric, 2),
+               (g * 5) %% 16,
+               (%(estados)s::text[])[1 + (g * 3) %% cardinality(%(estados)s::text[])],
+               (%(campus)s::text[])[1 + g %% cardinality(%(campus)s::text[])]
+        FROM generate_series(1::bigint, %(n)s) AS g
+        -- k: número de nombre; u^3 con u "aleatorio" (hash de g) concentra
+        -- las filas en los primeros.
+        CROSS JOIN LATERAL (
+            SELECT CASE WHEN %(nombres)s <= cardinality(%(nombres_base)s::text[]) THEN g %% %(nombres)s
+                        ELSE floor(%(nombres)s * power((g * 2654435761 %% 4294967296) / 4294967296.0, 3))::int
+                   END AS k
+        ) AS x
+    """),
+    ("vacuna", """
+        INSERT INTO vacuna (chip_id, nombre_vacuna, fecha_aplicacion)
+        SELECT 'CHIP' || lpad((1 + (g * 7919) %% %(n)s)::text, 8, '0'),
+               (ARRAY['Rabia','Óctuple','Séxtuple','KC','Leptospirosis'])[1 + g %% 5],
+               date '2019-01-01' + ((g * 37) %% 2500)::int
+        FROM generate_series(1::bigint, 2 * %(n)s) AS g
+    """),
+    ("tratamiento", """
+        INSERT INTO tratamiento (chip_id, descripcion, fecha_inicio, fecha_fin,
+                                 fecha_tratamiento_inic, fecha_tratamiento_fin)
+        SELECT chip_id, descripcion, inicio, fin, inicio, fin
+        FROM (
+            SELECT 'CHIP' || lpad((1 + (g * 104729) %% %(n)s)::text, 8, '0') AS chip_id,
+                   (ARRAY['Desparasitación','Antibiótico','Curación','Control post operatorio'])[1 + g %% 4]
+                       AS descripcion,
+                   date '2020-01-01' + ((g * 53) %% 2400)::int AS inicio,
+                   CASE WHEN g %% 4 = 0 THEN NULL
+                        ELSE date '2020-01-01' + ((g * 53) %% 2400 + 5 + g %% 30)::int END AS fin
+            FROM generate_series(1::bigint, %(n)s + %(n)s / 2) AS g
+        ) t
+    """),
+    ("derivacion", """
+        INSERT INTO derivacion (chip_id, veterinaria, motivo, ubicacion_vet, fecha_derivacion, fecha)
+        SELECT 'CHIP' || lpad((1 + (g * 15485863) %% %(n)s)::text, 8, '0'),
+               (ARRAY['Vet Sur','Clínica Concepción','Hospital Veterinario UdeC'])[1 + g %% 3],
+               (ARRAY['Fractura','Cirugía','Exámenes','Dermatitis'])[1 + g %% 4],
+               (ARRAY['Concepción','Talcahuano','Chiguayante'])[1 + g %% 3],
+               date '2020-01-01' + ((g * 17) %% 2400)::int,
+               date '2020-01-01' + ((g * 17) %% 2400)::int
+        FROM generate_series(1::bigint, greatest(1, %(n)s / 5)) AS g
+    """),
+    ("inventario", """
+        INSERT INTO inventario (nombre, tipo, unidad_de_medida, cantidad, nombre_campus, fecha_venc)
+        SELECT CASE WHEN i <= 20 THEN 'Alimento ' || i ELSE 'Medicamento ' || (i - 20) END,
+               CASE WHEN i <= 20 THEN 'Comida' ELSE 'Medicamento' END,
+               CASE WHEN i <= 20 THEN 'kg' ELSE 'unidad' END,
+               (i * 37 + c.n * 11) %% 120,
+               c.nombre_campus,
+               date '2026-01-01' + ((i * 29 + c.n) %% 700)::int
+        FROM unnest(%(campus)s::text[]) WITH ORDINALITY AS c(nombre_campus, n),
+             generate_series(1, 40) AS i
+    """),
+    ("medicamento", """
+        INSERT INTO medicamento (id_item, gramaje)
+        SELECT id_item, (ARRAY['50mg','250mg','500mg','1g'])[1 + id_item %% 4]
+        FROM inventario WHERE tipo = 'Medicamento'
+    """),
+]
+
+CLAVES_FORANEAS = [
+    "ALTER TABLE mascota ADD FOREIGN KEY (nombre_campus) REFERENCES sucursal",
+    "ALTER TABLE vacuna ADD FOREIGN KEY (chip_id) REFERENCES mascota",
+    "ALTER TABLE tratamiento ADD FOREIGN KEY (chip_id) REFERENCES mascota",
+    "ALTER TABLE derivacion ADD FOREIGN KEY (chip_id) REFERENCES mascota",
+    "ALTER TABLE inventario ADD FOREIGN KEY (nombre_campus) REFERENCES sucursal",
+    "ALTER TABLE medicamento ADD FOREIGN KEY (id_item) REFERENCES inventario",
+]
+
+TABLAS = ["sucursal", "mascota", "vacuna", "tratamiento", "derivacion", "inventario", "medicamento"]
+
+
+def crear_base():
+    with conectar(os.getenv("BENCH_DB_ADMIN", "postgres"), autocommit=True) as conn:
+        existe = conn.execute("SELECT 1 FROM pg_database WHERE datname = %s", (BENCH_DB,)).fetchone()
+        if not existe:
+            conn.execute(f'CREATE DATABASE "{BENCH_DB}"')
+
+
+def preparar(escala: str, nombres: int = len(NOMBRES)):
+    n = ESCALAS[escala]
+    crear_base()
+    params = {"n": n, "campus": campus_para(n), "razas": RAZAS, "estados": ESTADOS,
+              "nombres": nombres, "nombres_base": NOMBRES,
+              "silabas1": SILABAS[0], "silabas2": SILABAS[1], "silabas3": SILABAS[2],
+              "n1": len(SILABAS[0]), "n2": len(SILABAS[1]), "n3": len(SILABAS[2])}
+    t_total = time.perf_counter()
+    with conectar(autocommit=True) as conn:
+        conn.execute("SET synchronous_commit = off")
+        conn.execute("SET maintenance_work_mem = '256MB'")
+        with open(os.path.join(DIR_BENCH, "esquema.sql"), encoding="utf-8") as f:
+            conn.execute(f.read())
+        for tabla, sql in SIEMBRA:
+            t0 = time.perf_counter()
+            filas = conn.execute(sql, params).rowcount
+            print(f"  {tabla:<12}{filas:>12,} filas  {time.perf_counter() - t0:8.1f} s", flush=True)
+        t0 = time.perf_counter()
+        for sql in CLAVES_FORANEAS:
+            conn.execute(sql)
+        conn.execute("ANALYZE")
+        print(f"  claves foráneas + ANALYZE  {time.perf_counter() - t0:8.1f} s", flush=True)
+        # Las migraciones van después de sembrar: 001 enviaría un NOTIFY por fila.
+        dir_mig = os.path.join(DIR_PROYECTO, "migraciones")
+        for nombre in sorted(os.listdir(dir_mig)):
+            if nombre.endswith(".sql"):
+                t0 = time.perf_counter()
+                with open(os.path.join(dir_mig, nombre), encoding="utf-8") as f:
+                    conn.execute(f.read())
+                print(f"  {nombre:<26}{time.perf_counter() - t0:8.1f} s", flush=True)
+        conn.execute("INSERT INTO bench_meta (escala, mascotas, nombres) VALUES (%s, %s, %s)",
+                     (escala, n, nombres))
+    print(f"Escala {escala} ({nombres} nombres) lista en {time.perf_counter() - t_total:.1f} s")
+
+
+def escala_actual() -> tuple[str, int] | None:
+    try:
+        with conectar() as conn:
+            return conn.execute(
+                "SELECT escala, nombres FROM bench_meta ORDER BY creado DESC LIMIT 1"
+            ).fetchone()
+    except psycopg.Error:
+        return None
+
+
+def info_base() -> dict:
+    with conectar() as conn:
+        filas = dict(conn.execute(
+            "SELECT relname, reltuples::bigint FROM pg_class WHERE relname = ANY(%s)", (TABLAS,)
+        ).fetchall())
+        return {
+            "postgres": conn.execute("SHOW server_version").fetchone()[0],
+            "filas_estimadas": {t: filas.get(t) for t in TABLAS},
+            "tamano_bytes": conn.execute("SELECT pg_database_size(current_database())").fetchone()[0],
+        }
+
+
+# ---------------------------------------------------------------------------
+# Generador de carga
+# ---------------------------------------------------------------------------
+
+def percentil(ordenados: list[float], p: float) -> float:
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not ordenados:
+        return 0.0
+    return ordenados[min(len(ordenados) - 1, max(0, int(round(p * len(ordenados))) - 1))]
+
+
+def estadisticas(muestras: list[tuple], segundos: float) -> dict:
+    """muestras: (segundos, ok, bytes). Latencias en ms."""
+    lat = sorted(m[0] * 1000 for m in muestras)
+    errores = sum(1 for m in muestras if not m[1])
+    return {
+        "peticiones": len(muestras),
+        "errores": errores,
+        "por_segundo": round(len(muestras) / segundos, 2) if segundos else 0.0,
+        "media_ms": round(sum(lat) / len(lat), 3) if lat else 0.0,
+        "p50_ms": round(percentil(lat, 0.50), 3),
+        "p95_ms": round(percentil(lat, 0.95), 3),
+        "p99_ms": round(percentil(lat, 0.99), 3),
+        "max_ms": round(lat[-1], 3) if lat else 0.0,
+        "bytes_medio": round(sum(m[2] for m in muestras) / len(muestras)) if muestras else 0,
+    }
+
+
+def generar_carga(escenarios, crear_estado, cerrar_estado, concurrencia, duracion, calentamiento, semilla,
+                  medir_cpu=None):
+    """
+    Corre `concurrencia` hilos durante calentamiento + duracion segundos.
+    escenarios: [(nombre, peso, fn(estado, rng) -> (ok, bytes))]. Las
+    muestras del calentamiento se descartan. medir_cpu() -> {nombre:
+    segundos de CPU} se toma al terminar el calentamiento y al final.
+    Devuelve (muestras por escenario, segundos medidos, CPU consumida).
+    """
+    nombres = [e[0] for e in escenarios]
+    pesos = [e[1] for e in escenarios]
+    funciones = {e[0]: e[2] for e in escenarios}
+    inicio = time.perf_counter() + calentamiento
+    fin = inicio + duracion
+    por_hilo: list[dict] = []
+    fallos: list[BaseException] = []
+
+    def trabajador(i):
+        rng = random.Random(semilla * 1000 + i)
+        muestras: dict[str, list] = {n: [] for n in nombres}
+        por_hilo.append(muestras)
+        try:
+            estado = crear_estado()
+        except BaseException as e:
+            fallos.append(e)
+            return
+        try:
+            while (ahora := time.perf_counter()) < fin:
+                nombre = rng.choices(nombres, pesos)[0]
+                t0 = time.perf_counter()
+                try:
+                    ok, nbytes = funciones[nombre](estado, rng)
+                except Exception:
+                    ok, nbytes = False, 0
+                    estado = reabrir(estado, crear_estado, cerrar_estado)
+                if ahora >= inicio:
+                    muestras[nombre].append((time.perf_counter() - t0, ok, nbytes))
+        finally:
+            cerrar_estado(estado)
+
+    cpu: list[dict] = []
+    if medir_cpu:
+        reloj = threading.Timer(calentamiento, lambda: cpu.append(medir_cpu()))
+        reloj.start()
+    hilos = [threading.Thread(target=trabajador, args=(i,), daemon=True) for i in range(concurrencia)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    if fallos:
+        raise fallos[0]
+    consumo = None
+    if medir_cpu:
+        reloj.join()
+        fin_cpu = medir_cpu()
+        consumo = {k: round(fin_cpu[k] - cpu[0][k], 3) for k in fin_cpu}
+    juntas = {n: [m for hilo in por_hilo for m in hilo[n]] for n in nombres}
+    return juntas, duracion, consumo
+
+
+def reabrir(estado, crear_estado, cerrar_estado):
+    try:
+        cerrar_estado(estado)
+    except Exception:
+        pass
+    return crear_estado()
+
+
+def resumen_carga(muestras: dict, segundos: float, cpu: dict | None = None) -> dict:
+    todas = [m for lista in muestras.values() for m in lista]
+    resultado = {
+        "total": estadisticas(todas, segundos),
+        "detalle": {n: estadisticas(lista, segundos) for n, lista in muestras.items()},
+    }
+    if cpu:
+        # Segundos de CPU en la fase medida y ms de CPU por petición.
+        resultado["cpu"] = {
+            **{f"{k}_s": v for k, v in cpu.items()},
+            **{f"{k}_ms_por_peticion": round(v * 1000 / len(todas), 3) for k, v in cpu.items() if todas},
+        }
+    return resultado
+
+
+def cpu_segundos(pids) -> float:
+    """utime + stime de los procesos (Linux, /proc); los que ya no existen cuentan 0."""
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                campos = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        total += int(campos[11]) + int(campos[12])
+    return total / os.sysconf("SC_CLK_TCK")
+
+
+def pids_postgres() -> list[int]:
+    """Procesos postgres locales (backends del pool incluidos)."""
+    pids = []
+    for nombre in os.listdir("/proc"):
+        if nombre.isdigit():
+            try:
+                with open(f"/proc/{nombre}/comm") as f:
+                    if f.read().strip() == "postgres":
+                        pids.append(int(nombre))
+            except OSError:
+                pass
+    return pids
+
+
+def medidor_cpu(pid_cliente: int | None):
+    """
+    medir_cpu para generar_carga: CPU del proceso indicado (la API o este
+    mismo, para la GUI) y de Postgres, si corre en esta máquina. None fuera
+    de Linux.
+    """
+    if not os.path.isdir("/proc"):
+        return None
+
+    def medir():
+        valores = {"postgres": cpu_segundos(pids_postgres())}
+        if pid_cliente:
+            valores["proceso"] = cpu_segundos([pid_cliente])
+        return valores
+    return medir
+
+
+class MemoriaProceso:
+    """Muestrea VmRSS de un proceso (Linux, /proc) en un hilo aparte."""
+
+    def __init__(self, pid: int | None, intervalo: float = 0.25):
+        self.pid = pid
+        self.intervalo = intervalo
+        self.muestras: list[int] = []
+        self._parar = threading.Event()
+        self._hilo = threading.Thread(target=self._bucle, daemon=True)
+
+    def leer(self) -> int | None:
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for linea in f:
+                    if linea.startswith("VmRSS:"):
+                        return int(linea.split()[1]) * 1024
+        except OSError:
+            return None
+        return None
+
+    def _bucle(self):
+        while not self._parar.wait(self.intervalo):
+            if (rss := self.leer()) is not None:
+                self.muestras.append(rss)
+
+    def __enter__(self):
+        if self.pid:
+            if (rss := self.leer()) is not None:
+                self.muestras.append(rss)
+            self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        if self._hilo.is_alive():
+            self._hilo.join()
+
+    def resumen(self) -> dict | None:
+        if not self.muestras:
+            return None
+        return {"rss_inicial": self.muestras[0], "rss_max": max(self.muestras), "rss_final": self.muestras[-1]}
+
+
+# ---------------------------------------------------------------------------
+# API
+# ---------------------------------------------------------------------------
+
+def escenarios_api(n: int, campus: list[str]) -> list:
+    """(nombre, peso, fn) para cada endpoint; fn recibe la conexión HTTP."""
+    def un_chip(rng):
+        return chip(rng.randint(1, n))
+
+    def un_campus(rng):
+        return urllib.parse.quote(rng.choice(campus))
+
+    def get(ruta):
+        def fn(conn, rng):
+            return pedir(conn, "GET", ruta(rng) if callable(ruta) else ruta)
+        return fn
+
+    def batch(conn, rng):
+        cuerpo = {"chip_ids": [un_chip(rng) for _ in range(50)], "include": ["vacunas"]}
+        return pedir(conn, "POST", "/mascotas/batch", cuerpo)
+
+    return [
+        ("GET /health", 1, get("/health")),
+        ("GET /mascotas", 5, get("/mascotas?limit=100")),
+        ("GET /mascotas filtrado", 5, get(
+            lambda r: f"/mascotas?limit=50&estado_adop=Disponible&nombre_campus={un_campus(r)}")),
+        ("GET /mascotas fields", 2, get("/mascotas?limit=500&fields=chip_id,nombre_mascota")),
+        ("GET /mascotas?format=ndjson", 1, get(
+            lambda r: f"/mascotas?format=ndjson&raza=Beagle&nombre_campus={un_campus(r)}")),
+        ("GET /mascotas/search", 10, get(
+            lambda r: f"/mascotas/search?q={urllib.parse.quote(r.choice(BUSQUEDAS))}")),
+        ("GET /mascotas/search filtrado", 5, get(
+            lambda r: f"/mascotas/search?q={urllib.parse.quote(r.choice(BUSQUEDAS))}"
+                      f"&estado_adop=Disponible&nombre_campus={un_campus(r)}")),
+        ("GET /mascotas/{chip_id}", 20, get(lambda r: f"/mascotas/{un_chip(r)}")),
+        ("GET /mascotas/{chip_id}/vacunas", 10, get(lambda r: f"/mascotas/{un_chip(r)}/vacunas")),
+        ("GET /mascotas/{chip_id}/tratamientos", 10, get(lambda r: f"/mascotas/{un_chip(r)}/tratamientos")),
+        ("GET /mascotas/{chip_id}/derivaciones", 5, get(lambda r: f"/mascotas/{un_chip(r)}/derivaciones")),
+        ("GET /mascotas/{chip_id}/perfil", 10, get(lambda r: f"/mascotas/{un_chip(r)}/perfil")),
+        ("POST /mascotas/batch", 3, batch),
+        ("GET /sucursales", 3, get("/sucursales")),
+        ("GET /reportes/mascotas-por-campus", 1, get("/reportes/mascotas-por-campus")),
+        ("GET /reportes/campus", 3, get("/reportes/campus")),
+        ("GET /tratamientos", 3, get(lambda r: f"/tratamientos?limit=100&nombre_campus={un_campus(r)}")),
+        ("GET /inventario/comida", 3, get(lambda r: f"/inventario/comida?nombre_campus={un_campus(r)}")),
+        ("GET /inventario/comida?critico", 2, get("/inventario/comida?critico=true")),
+        ("GET /inventario/medicamentos", 3, get("/inventario/medicamentos?limit=100")),
+    ]
+
+
+def pedir(conn: http.client.HTTPConnection, metodo: str, ruta: str, cuerpo=None) -> tuple[bool, int]:
+    headers = {"Accept-Encoding": "identity"}
+    datos = None
+    if cuerpo is not None:
+        datos = json.dumps(cuerpo).encode()
+        headers["Content-Type"] = "application/json"
+    conn.request(metodo, ruta, body=datos, headers=headers)
+    resp = conn.getresponse()
+    leido = resp.read()
+    # 404 es una respuesta válida (chip inexistente), no un error de carga.
+    return resp.status < 400 or resp.status == 404, len(leido)
+
+
+def levantar_api(modo: str, puerto: int) -> subprocess.Popen:
+    env = dict(os.environ, DB_NAME=BENCH_DB, API_MODE=modo)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api_perruls:app", "--host", "127.0.0.1",
+         "--port", str(puerto), "--log-level", "warning", "--no-access-log"],
+        cwd=DIR_PROYECTO, env=env,
+    )
+    # /mascotas/search responde 503 hasta que termina de armar su índice.
+    esperas = [("/health", 30)]
+    if env.get("API_SEARCH", "1") == "1":
+        esperas.append(("/mascotas/search?q=a", 600))
+    for ruta, segundos in esperas:
+        limite = time.monotonic() + segundos
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"uvicorn terminó con código {proc.returncode}")
+            if time.monotonic() > limite:
+                proc.terminate()
+                raise RuntimeError(f"la API no respondió {ruta} en {segundos} s")
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", puerto, timeout=2)
+                conn.request("GET", ruta)
+                estado = conn.getresponse().status
+                conn.close()
+                if estado == 200:
+                    break
+            except OSError:
+                pass
+            time.sleep(0.2)
+    return proc
+
+
+def correr_api(args, n: int) -> dict:
+    proc = None
+    url = urllib.parse.urlsplit(args.url or f"http://127.0.0.1:{args.puerto}")
+    pid = args.pid
+    if not args.url:
+        proc = levantar_api(args.modo, args.puerto)
+        pid = proc.pid
+    try:
+        def crear():
+            return http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+
+        print(f"API: {args.concurrencia} clientes, {args.duracion} s (+{args.calentamiento} s de calentamiento)",
+              flush=True)
+        with MemoriaProceso(pid) as memoria:
+            muestras, segundos, cpu = generar_carga(
+                escenarios_api(n, campus_para(n)), crear, lambda c: c.close(),
+                args.concurrencia, args.duracion, args.calentamiento, args.semilla,
+                medir_cpu=medidor_cpu(pid),
+            )
+        resultado = resumen_carga(muestras, segundos, cpu)
+        resultado["memoria_servidor"] = memoria.resumen()
+        try:
+            conn = crear()
+            conn.request("GET", "/metrics/resumen")
+            resultado["metricas_servidor"] = json.loads(conn.getresponse().read())
+            conn.close()
+        except (OSError, ValueError):
+            resultado["metricas_servidor"] = None
+        return resultado
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(10)
+
+
+# ---------------------------------------------------------------------------
+# GUI (PGClient)
+# ---------------------------------------------------------------------------
+
+def cargar_gui():
+    """Importa el módulo de la GUI (el nombre de archivo no es importable)."""
+    ruta = os.path.join(DIR_PROYECTO, "consultas rapidas python (1).py")
+    spec = importlib.util.spec_from_file_location("consultas_rapidas", ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def acciones_gui(gui) -> dict:
+    acciones = {attr.removeprefix("btn_q_"): sql for attr, (_, sql) in gui.QUICK_ACTIONS.items()}
+    acciones["cargar_tabla_mascota"] = f"SELECT * FROM {gui.psql_ident('mascota')} ORDER BY 1"
+    return acciones
+
+
+def correr_gui(args) -> dict:
+    gui = cargar_gui()
+    acciones = acciones_gui(gui)
+    p = parametros_db(BENCH_DB)
+
+    def crear():
+        cliente = gui.PGClient()
+        cliente.connect(p["host"], p["dbname"], p["user"], p["password"], p["port"])
+        return cliente
+
+    def paginada(sql):
+        # Camino por defecto de la GUI: primera página + count(*) aparte.
+        def fn(cliente, rng):
+            _, filas, _ = cliente.run_query_page(sql, 1, 100, use_cache=False)
+            cliente.count_rows(sql, use_cache=False)
+            return True, filas.nbytes() if hasattr(filas, "nbytes") else 0
+        return fn
+
+    concurrencia = args.concurrencia_gui
+    print(f"GUI: {concurrencia} clientes, {args.duracion} s", flush=True)
+    muestras, segundos, cpu = generar_carga(
+        [(nombre, 1, paginada(sql)) for nombre, sql in acciones.items()],
+        crear, lambda c: c.close(),
+        concurrencia, args.duracion, args.calentamiento, args.semilla,
+        medir_cpu=medidor_cpu(os.getpid()),
+    )
+    resultado = resumen_carga(muestras, segundos, cpu)
+
+    # Resultado completo (sin paginar): tiempo, tamaño del ColumnStore y pico
+    # de memoria de Python. El pico se mide en una corrida aparte porque
+    # tracemalloc hace más lenta la conversión.
+    completo = {}
+    cliente = crear()
+    try:
+        for nombre, sql in acciones.items():
+            t0 = time.perf_counter()
+            _, filas = cliente.run_query(sql, use_cache=False)
+            segundos_completo = time.perf_counter() - t0
+            nbytes = filas.nbytes() if hasattr(filas, "nbytes") else None
+            cantidad = len(filas)
+            del filas
+            tracemalloc.start()
+            _, filas = cliente.run_query(sql, use_cache=False)
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del filas
+            completo[nombre] = {
+                "filas": cantidad,
+                "segundos": round(segundos_completo, 4),
+                "bytes_resultado": nbytes,
+                "pico_python_bytes": pico,
+            }
+            print(f"  {nombre:<28}{cantidad:>10,} filas {segundos_completo:8.3f} s", flush=True)
+    finally:
+        cliente.close()
+    resultado["completo"] = completo
+    return resultado
+
+
+# ---------------------------------------------------------------------------
+# Resultados
+# ---------------------------------------------------------------------------
+
+def version_git() -> str | None:
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=DIR_PROYECTO,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        sucio = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               cwd=DIR_PROYECTO, capture_output=True, text=True).stdout.strip()
+        return sha + ("-sucio" if sucio else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def imprimir_tabla(titulo: str, seccion: dict):
+    print(f"\n{titulo}")
+    print(f"{'':<40}{'pet/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'err':>6}")
+    for nombre, e in {"TOTAL": seccion["total"], **seccion["detalle"]}.items():
+        print(f"{nombre:<40}{e['por_segundo']:>9.1f}{e['p50_ms']:>10.2f}{e['p95_ms']:>10.2f}"
+              f"{e['p99_ms']:>10.2f}{e['errores']:>6}")
+    if cpu := seccion.get("cpu"):
+        print("CPU por petición: " + ", ".join(
+            f"{k.removesuffix('_ms_por_peticion')} {v:.2f} ms" for k, v in cpu.items() if k.endswith("_por_peticion")
+        ))
+
+
+def correr(args):
+    n = ESCALAS[args.escala]
+    if args.preparar or escala_actual() != (args.escala, args.nombres):
+        print(f"Sembrando escala {args.escala} en {BENCH_DB}…", flush=True)
+        preparar(args.escala, args.nombres)
+    resultado = {
+        "formato": 1,
+        "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+        "version": version_git(),
+        "escala": args.escala,
+        "mascotas": n,
+        "nombres": args.nombres,
+        "base": info_base(),
+        "entorno": {"python": platform.python_version(), "plataforma": platform.platform(),
+                    "cpus": os.cpu_count()},
+        "config": {k: getattr(args, k) for k in
+                   ("modo", "concurrencia", "concurrencia_gui", "duracion", "calentamiento", "semilla", "url")},
+    }
+    if args.solo in (None, "api"):
+        resultado["api"] = correr_api(args, n)
+        imprimir_tabla("API", resultado["api"])
+    if args.solo in (None, "gui"):
+        resultado["gui"] = correr_gui(args)
+        imprimir_tabla("GUI (página + count)", resultado["gui"])
+
+    salida = args.salida
+    if not salida:
+        os.makedirs(DIR_RESULTADOS, exist_ok=True)
+        sello = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        salida = os.path.join(DIR_RESULTADOS, f"{sello}_{args.escala}_{args.modo}.json")
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados en {salida}")
+
+
+def comparar(args) -> int:
+    """
+    Compara dos resultados por endpoint/acción: pet/s y p95. Marca como
+    regresión una caída de throughput o una subida de p95 mayor al umbral
+    (en %), solo si ambas corridas tienen al menos --min-muestras peticiones
+    (con pocas muestras el p95 es ruido). Devuelve 1 si hay regresiones,
+    para usarlo en CI.
+    """
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.nuevo, encoding="utf-8") as f:
+        nuevo = json.load(f)
+    if base.get("escala") != nuevo.get("escala"):
+        print(f"Aviso: escalas distintas ({base.get('escala')} vs {nuevo.get('escala')})")
+    print(f"{base.get('version')} -> {nuevo.get('version')}")
+    regresiones = 0
+    for seccion in ("api", "gui"):
+        if seccion not in base or seccion not in nuevo:
+            continue
+        print(f"\n{seccion.upper():<40}{'pet/s':>18}{'Δ%':>8}{'p95 ms':>20}{'Δ%':>8}")
+        filas = {"TOTAL": (base[seccion]["total"], nuevo[seccion]["total"])}
+        for nombre, e in nuevo[seccion]["detalle"].items():
+            if nombre in base[seccion]["detalle"]:
+                filas[nombre] = (base[seccion]["detalle"][nombre], e)
+        for nombre, (a, b) in filas.items():
+            d_rps = delta(a["por_segundo"], b["por_segundo"])
+            d_p95 = delta(a["p95_ms"], b["p95_ms"])
+            marca = ""
+            if min(a["peticiones"], b["peticiones"]) < args.min_muestras:
+                marca = "  (pocas muestras)"
+            elif (d_rps is not None and d_rps < -args.umbral) or (d_p95 is not None and d_p95 > args.umbral):
+                marca = "  << regresión"
+                regresiones += 1
+            print(f"{nombre:<40}{a['por_segundo']:>8.1f} →{b['por_segundo']:>8.1f}{fmt_delta(d_rps):>8}"
+                  f"{a['p95_ms']:>9.2f} →{b['p95_ms']:>9.2f}{fmt_delta(d_p95):>8}{marca}")
+        cpu_a, cpu_b = base[seccion].get("cpu") or {}, nuevo[seccion].get("cpu") or {}
+        for clave in cpu_b:
+            if clave.endswith("_por_peticion") and clave in cpu_a:
+                print(f"CPU {clave.removesuffix('_ms_por_peticion')} ms/pet{'':<17}{cpu_a[clave]:>8.2f} →"
+                      f"{cpu_b[clave]:>8.2f}{fmt_delta(delta(cpu_a[clave], cpu_b[clave])):>8}")
+    print(f"\n{regresiones} regresiones (umbral {args.umbral:g} %)")
+    return 1 if regresiones else 0
+
+
+def delta(antes: float, despues: float) -> float | None:
+    return (despues - antes) / antes * 100 if antes else None
+
+
+def fmt_delta(d: float | None) -> str:
+    return "—" if d is None else f"{d:+.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga de PERRULS")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("preparar", help="crea el esquema y siembra datos")
+    p.add_argument("--escala", choices=ESCALAS, default="1k")
+    p.add_argument("--nombres", type=int, choices=range(1, MAX_NOMBRES + 1), default=len(NOMBRES),
+                   metavar=f"1..{MAX_NOMBRES}", help="nombres de mascota distintos")
+
+    p = sub.add_parser("correr", help="siembra si hace falta y mide")
+    p.add_argument("--escala", choices=ESCALAS, default="1k")
+    p.add_argument("--nombres", type=int, choices=range(1, MAX_NOMBRES + 1), default=len(NOMBRES),
+                   metavar=f"1..{MAX_NOMBRES}", help="nombres de mascota distintos")
+    p.add_argument("--preparar", action="store_true", help="volver a sembrar aunque la escala coincida")
+    p.add_argument("--modo", choices=("sync", "async"), default=os.getenv("API_MODE", "sync"))
+    p.add_argument("--concurrencia", type=int, default=16, help="clientes HTTP")
+    p.add_argument("--concurrencia-gui", type=int, default=4, help="clientes PGClient")
+    p.add_argument("--duracion", type=float, default=30, help="segundos medidos por fase")
+    p.add_argument("--calentamiento", type=float, default=5, help="segundos descartados al inicio")
+    p.add_argument("--semilla", type=int, default=1)
+    p.add_argument("--solo", choices=("api", "gui"))
+    p.add_argument("--puerto", type=int, default=8765)
+    p.add_argument("--url", help="API ya levantada (no se lanza uvicorn)")
+    p.add_argument("--pid", type=int, help="pid de esa API, para medir su memoria")
+    p.add_argument("--salida", help="archivo JSON (por defecto bench/resultados/...)")
+
+    p = sub.add_parser("comparar", help="compara dos resultados JSON")
+    p.add_argument("base")
+    p.add_argument("nuevo")
+    p.add_argument("--umbral", type=float, default=10, help="%% de cambio que cuenta como regresión")
+    p.add_argument("--min-muestras", type=int, default=30, help="peticiones mínimas para comparar")
+
+    args = parser.parse_args()
+    if args.comando == "preparar":
+        preparar(args.escala, args.nombres)
+    elif args.comando == "correr":
+        correr(args)
+    else:
+        sys.exit(comparar(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+-- Esquema PERRULS para el benchmark (bench/carga.py).
+-- Solo las columnas que usan api_perruls.py y las acciones rápidas de la GUI.
+-- Las claves foráneas se agregan después de sembrar los datos (ver carga.py),
+-- así la carga masiva no las valida fila por fila.
+--
+-- ¡Borra las tablas! Usar solo en la base de benchmark (BENCH_DB_NAME).
+
+DROP TABLE IF EXISTS medicamento, inventario, derivacion, tratamiento, vacuna,
+    mascota, sucursal, resumen_campus, bench_meta CASCADE;
+
+CREATE TABLE sucursal (
+    nombre_campus   text PRIMARY KEY,
+    direccion       text
+);
+
+CREATE TABLE mascota (
+    chip_id         text PRIMARY KEY,
+    nombre_mascota  text NOT NULL,
+    raza            text,
+    peso            numeric(5,2),
+    edad_estimada   integer,
+    estado_adop     text,
+    nombre_campus   text
+);
+
+CREATE TABLE vacuna (
+    id_vacuna         integer GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    chip_id           text NOT NULL,
+    nombre_vacuna     text NOT NULL,
+    fecha_aplicacion  date
+);
+
+-- La API lee tanto fecha_inicio/fecha_fin (/mascotas/{chip_id}/tratamientos)
+-- como fecha_tratamiento_inic/fin (/tratamientos); se siembran con los mismos valores.
+CREATE TABLE tratamiento (
+    id_tratamiento          integer GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    chip_id                 text NOT NULL,
+    descripcion             text,
+    fecha_inicio            date,
+    fecha_fin               date,
+    fecha_tratamiento_inic  date,
+    fecha_tratamiento_fin   date
+);
+
+-- Igual que arriba: fecha_derivacion (API) y fecha (GUI).
+CREATE TABLE derivacion (
+    id_derivacion     integer GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    chip_id           text NOT NULL,
+    veterinaria       text,
+    motivo            text,
+    ubicacion_vet     text,
+    fecha_derivacion  date,
+    fecha             date
+);
+
+CREATE TABLE inventario (
+    id_item           integer GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    nombre            text NOT NULL,
+    tipo              text NOT NULL,
+    unidad_de_medida  text,
+    cantidad          numeric,
+    nombre_campus     text,
+    fecha_venc        date
+);
+
+CREATE TABLE medicamento (
+    id_item  integer PRIMARY KEY,
+    gramaje  text
+);
+
+CREATE TABLE bench_meta (
+    escala    text NOT NULL,
+    mascotas  bigint NOT NULL,
+    nombres   integer NOT NULL,
+    creado    timestamptz NOT NULL DEFAULT now()
+);
@@ -0,0 +1,93 @@
+"""
+Micro-benchmark de serialización JSON de la API.
+
+Compara el camino anterior (jsonable_encoder + json estándar, lo que hace
+FastAPI con un dict devuelto por el handler) con dumps_json/RespuestaJSON,
+usando filas con la forma de /mascotas y /tratamientos.
+
+Uso: python bench/json_encode.py [n_filas]
+"""
+import datetime
+import decimal
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+import api_perruls  # noqa: E402
+
+
+def filas_mascotas(n):
+    return [
+        {
+            "chip_id": f"CHIP{i:07d}",
+            "nombre_mascota": f"Firulais {i}",
+            "raza": ("Quiltro", "Labrador", "Poodle")[i % 3],
+            "peso_kg": decimal.Decimal(f"{5 + i % 30}.{i % 100:02d}"),
+            "edad_estimada": i % 15,
+            "estado_adop": ("Disponible", "Adoptado")[i % 2],
+            "nombre_campus": ("Isabel Bongard", "Tres Pascualas", "San Andrés")[i % 3],
+        }
+        for i in range(n)
+    ]
+
+
+def filas_tratamientos(n):
+    hoy = datetime.date(2024, 1, 1)
+    return [
+        {
+            "id_tratamiento": i,
+            "chip_id": f"CHIP{i:07d}",
+            "nombre_mascota": f"Firulais {i}",
+            "descripcion": "Desparasitación",
+            "fecha_tratamiento_inic": hoy + datetime.timedelta(days=i % 365),
+            "fecha_tratamiento_fin": None,
+        }
+        for i in range(n)
+    ]
+
+
+def camino_anterior(payload):
+    return JSONResponse(content=jsonable_encoder(payload)).body
+
+
+def camino_nuevo(payload):
+    return api_perruls.RespuestaJSON(payload).body
+
+
+def medir(fn, payload, repeticiones=5):
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        fn(payload)
+        tiempos.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    fn(payload)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(tiempos), pico
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    motor = "orjson" if api_perruls.orjson is not None else "json estándar"
+    print(f"{n} filas · dumps_json usa {motor}")
+    print(f"{'endpoint':<14}{'camino':<10}{'tiempo ms':>12}{'pico KiB':>12}")
+    for nombre, generar in (("/mascotas", filas_mascotas), ("/tratamientos", filas_tratamientos)):
+        payload = {"data": generar(n)}
+        assert camino_anterior(payload) is not None and camino_nuevo(payload) is not None
+        base = None
+        for etiqueta, fn in (("anterior", camino_anterior), ("nuevo", camino_nuevo)):
+            seg, pico = medir(fn, payload)
+            extra = f"  x{base / seg:.1f}" if base else ""
+            base = base or seg
+            print(f"{nombre:<14}{etiqueta:<10}{seg * 1000:>12.2f}{pico / 1024:>12.0f}{extra}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,142 @@
 import csv
+import datetime as dt
+import itertools
+import json
+import os
+import re
+import sys
 import threading
+import time
+import uuid
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
 import tkinter as tk
+import tkinter.font as tkfont
 from tkinter import ttk, messagebox, filedialog
 import psycopg
+from psycopg.pq import TransactionStatus
 from psycopg.rows import tuple_row
 
 class PGClient:
     def __init__(self):
         self.conn: psycopg.Connection | None = None
+        # Conexión secundaria para consultas auxiliares (esquema, columnas),
+        # en paralelo con la principal.
+        self.aux_conn: psycopg.Connection | None = None
+        # El count(*) de la paginación va en su propia conexión: cancel_count
+        # no debe cortar una lectura del esquema que esté en aux_conn.
+        self.count_conn: psycopg.Connection | None = None
+        self._params: dict = {}
+        # statement_timeout en ms (0 = sin límite); se aplica antes de la
+        # siguiente consulta en el hilo que la ejecuta.
+        self.statement_timeout_ms = 0
+        self._applied_timeout: dict = {}
+        # _aux/_count se llaman desde varios hilos: sin el lock dos de ellos
+        # podrían abrir cada uno su conexión y pisarse.
+        self._conn_lock = threading.Lock()
+        self.cache = ResultCache()
+        # Metadatos del esquema (ver refresh_schema); None = aún no leídos.
+        self.schema: dict | None = None
+        # True si el último run_query/run_query_page salió de la caché.
+        self.last_from_cache = False
 
     def connect(self, host: str, dbname: str, user: str, password: str, port: int = 5432):
-        if self.conn and not self.conn.closed:
-            self.conn.close()
-        self.conn = psycopg.connect(host=host, dbname=dbname, user=user, password=password, port=port, row_factory=tuple_row)
+        self.close()
+        self._params = dict(host=host, dbname=dbname, user=user, password=password, port=port)
+        self.conn = psycopg.connect(**self._params, row_factory=tuple_row)
 
     def is_connected(self) -> bool:
         return self.conn is not None and not self.conn.closed
 
     def close(self):
-        if self.conn and not self.conn.closed:
-            self.conn.close()
-
-    def run_query(self, sql: str, params: tuple | None = None):
+        for c in (self.conn, self.aux_conn, self.count_conn):
+            if c and not c.closed:
+                c.close()
+        self.aux_conn = self.count_conn = None
+        self._applied_timeout.clear()
+        self.cache.clear()
+        self.schema = None
+
+    def _aux(self) -> psycopg.Connection:
+        with self._conn_lock:
+            if self.aux_conn is None or self.aux_conn.closed:
+                self.aux_conn = psycopg.connect(**self._params, row_factory=tuple_row, autocommit=True)
+            return self.aux_conn
+
+    def _count(self) -> psycopg.Connection:
+        with self._conn_lock:
+            if self.count_conn is None or self.count_conn.closed:
+                self.count_conn = psycopg.connect(**self._params, row_factory=tuple_row, autocommit=True)
+            return self.count_conn
+
+    def set_statement_timeout(self, seconds: float):
+        self.statement_timeout_ms = max(0, int(seconds * 1000))
+
+    def _apply_timeout(self, conn: psycopg.Connection):
+        if self._applied_timeout.get(id(conn)) != self.statement_timeout_ms:
+            # En la conexión principal (sin autocommit) el SET abre una
+            # transacción; si no había una en curso se confirma enseguida para
+            # no dejar la sesión "idle in transaction". Si la había, el SET
+            # queda dentro de ella (y _recover lo vuelve a aplicar si se pierde).
+            idle = conn.info.transaction_status == TransactionStatus.IDLE
+            conn.execute(f"SET statement_timeout = {int(self.statement_timeout_ms)}")
+            if idle and not conn.autocommit:
+                conn.commit()
+            self._applied_timeout[id(conn)] = self.statement_timeout_ms
+
+    def _recover(self, conn: psycopg.Connection):
+        """Tras un error (o cancelación) la transacción queda abortada: se hace
+        rollback para poder seguir usando la conexión. El SET se pierde con el
+        rollback, así que se vuelve a aplicar en la próxima consulta.
+        """
+        if not conn.closed and conn.info.transaction_status == TransactionStatus.INERROR:
+            conn.rollback()
+            self._applied_timeout.pop(id(conn), None)
+
+    def cancel(self):
+        """Cancela en el servidor lo que estén ejecutando todas las conexiones."""
+        for c in (self.conn, self.aux_conn, self.count_conn):
+            if c and not c.closed:
+                c.cancel_safe()
+
+    def run_query(self, sql: str, params: tuple | None = None, use_cache: bool = True):
+        """Ejecuta la consulta. Las de solo lectura se guardan en la caché
+        (clave: SQL + parámetros); use_cache=False la ignora y la renueva.
+        Cualquier otra sentencia (INSERT, UPDATE, ...) vacía la caché.
+        """
         if not self.is_connected():
             raise RuntimeError("No hay conexión activa.")
+        key = ("query", strip_sql(sql), params)
+        cacheable = is_pageable(sql)
+        self.last_from_cache = False
+        if cacheable and use_cache:
+            hit = self.cache.get(key)
+            if hit is not None:
+                self.last_from_cache = True
+                return hit
+        result = self._execute(sql, params)
+        if cacheable:
+            self.cache.put(key, result)
+        else:
+            self.cache.clear()
+            if strip_sql(sql).split(None, 1)[0].lower() in ("create", "alter", "drop"):
+                self.schema = None
+        return result
+
+    def _execute(self, sql: str, params: tuple | None = None):
+        try:
+            self._apply_timeout(self.conn)
+            return self._run(sql, params)
+        except Exception:
+            self._recover(self.conn)
+            raise
+
+    def _run(self, sql: str, params: tuple | None):
         with self.conn.cursor() as cur:
-            cur.execute(sql, params or ())
+            cur.execute(sql, params)
             columns = []
             try:
                 if cur.description:
@@ -34,17 +145,1209 @@ class PGClient:
                 columns = []
             rows = []
             try:
-                rows = cur.fetchall() if cur.description else []
+                if cur.description:
+                    # Se convierte por tramos para no tener nunca todas las
+                    # filas como tuplas de Python a la vez.
+                    rows = ColumnStore(columns)
+                    while chunk := cur.fetchmany(FETCH_CHUNK):
+                        rows.extend(chunk)
             except psycopg.ProgrammingError:
                 rows = []
             return columns, rows
 
-    def table_schema(self, table_name: str):
+    def run_query_page(self, sql: str, page: int, size: int, use_cache: bool = True):
+        """Ejecuta solo una página de la consulta (LIMIT/OFFSET en el servidor).
+        Devuelve (columnas, filas, hay_mas).
+        """
+        inner = strip_sql(sql)
+        key = ("page", inner, page, size)
+        hit = self.cache.get(key) if use_cache else None
+        self.last_from_cache = hit is not None
+        if hit is not None:
+            return hit
+        offset = (max(1, page) - 1) * size
+        if not self.is_connected():
+            raise RuntimeError("No hay conexión activa.")
+        columns, rows = self._execute(f"SELECT * FROM ({inner}) AS q LIMIT {size + 1} OFFSET {offset}")
+        result = (columns, rows[:size], len(rows) > size)
+        self.cache.put(key, result)
+        return result
+
+    def count_rows(self, sql: str, use_cache: bool = True) -> int:
+        """count(*) de la consulta en su propia conexión (ver cancel_count)."""
+        if not self.is_connected():
+            raise RuntimeError("No hay conexión activa.")
+        key = ("count", strip_sql(sql))
+        hit = self.cache.get(key) if use_cache else None
+        if hit is not None:
+            return hit
+        conn = self._count()
+        self._apply_timeout(conn)
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT count(*) FROM ({strip_sql(sql)}) AS q")
+            total = cur.fetchone()[0]
+        self.cache.put(key, total)
+        return total
+
+    def cancel_count(self):
+        if self.count_conn and not self.count_conn.closed:
+            self.count_conn.cancel_safe()
+
+    def run_aux_query(self, sql: str, params: tuple | None = None):
+        """Consulta corta en la conexión auxiliar (autocommit), en paralelo con
+        lo que esté ejecutando la principal.
+        """
+        if not self.is_connected():
+            raise RuntimeError("No hay conexión activa.")
+        conn = self._aux()
+        self._apply_timeout(conn)
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            columns = [d.name for d in cur.description] if cur.description else []
+            return columns, (cur.fetchall() if cur.description else [])
+
+    def copy_to_csv(self, sql: str, path: str, progress=None, on_conn=None) -> tuple[int, int]:
+        """Exporta la consulta a un CSV con COPY (...) TO STDOUT WITH CSV HEADER,
+        escribiendo los bloques a disco a medida que llegan (memoria constante).
+
+        Usa una conexión propia para no ocupar la principal; on_conn(conn) la
+        entrega al llamador para que pueda cancelarla con conn.cancel_safe().
+        progress(filas, bytes) se llama cada ~0,2 s. Devuelve (filas, bytes).
+        """
+        if not self.is_connected():
+            raise RuntimeError("No hay conexión activa.")
+        rows = nbytes = 0
+        last = time.monotonic()
+        with psycopg.connect(**self._params, autocommit=True) as conn:
+            conn.execute("SET client_encoding TO 'UTF8'")
+            if on_conn:
+                on_conn(conn)
+            with conn.cursor() as cur, open(path, "wb") as f:
+                with cur.copy(f"COPY ({strip_sql(sql)}) TO STDOUT WITH (FORMAT csv, HEADER)") as copy:
+                    # El servidor envía un bloque por fila (más uno de encabezado).
+                    for block in copy:
+                        f.write(block)
+                        rows += 1
+                        nbytes += len(block)
+                        if progress and time.monotonic() - last >= 0.2:
+                            last = time.monotonic()
+                            progress(max(0, rows - 1), nbytes)
+        return max(0, rows - 1), nbytes
+
+    def primary_key(self, table: str, conn: psycopg.Connection | None = None) -> list[str]:
         sql = (
-            "SELECT column_name, data_type, is_nullable, column_default "
-            "FROM information_schema.columns WHERE table_schema='public' AND table_name=%s ORDER BY ordinal_position"
+            "SELECT a.attname FROM pg_index i "
+            "JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey) "
+            "WHERE i.indrelid = to_regclass(%s) AND i.indisprimary "
+            "ORDER BY array_position(i.indkey::int2[], a.attnum)"
         )
-        return self.run_query(sql, (table_name,))
+        if conn is None:
+            return [r[0] for r in self.run_aux_query(sql, (psql_ident(table),))[1]]
+        with conn.cursor() as cur:
+            cur.execute(sql, (psql_ident(table),))
+            return [r[0] for r in cur.fetchall()]
+
+    def import_csv(self, table: str, path: str, mapping: list[tuple[int, str]], types: dict | None = None,
+                   upsert: bool = False, batch_rows: int = 50000, progress=None, should_stop=None,
+                   on_conn=None) -> tuple[int, float]:
+        """Carga un CSV en la tabla con COPY FROM STDIN, en lotes de batch_rows
+        filas dentro de una sola transacción (si algo falla no queda nada a medias).
+
+        mapping: pares (índice de columna del CSV, columna de la tabla).
+        types: {columna: data_type} de table_schema; en columnas que no son de
+        texto una celda vacía se carga como NULL.
+        upsert: copia primero a una tabla temporal y luego hace
+        INSERT ... ON CONFLICT (clave primaria) DO UPDATE.
+        progress(filas, segundos) se llama tras cada lote; si should_stop()
+        devuelve True se cancela y se hace rollback. Devuelve (filas, segundos).
+        """
+        if not self.is_connected():
+            raise RuntimeError("No hay conexión activa.")
+        if not mapping:
+            raise ValueError("No hay columnas para importar.")
+        types = types or {}
+        indexes = [i for i, _ in mapping]
+        columns = [c for _, c in mapping]
+        blank_is_null = [types.get(c, "").split("(")[0] not in TEXT_TYPES for c in columns]
+        target = psql_ident(table)
+        col_sql = ", ".join(psql_ident(c) for c in columns)
+        rows = 0
+        started = time.monotonic()
+        with psycopg.connect(**self._params) as conn:
+            if on_conn:
+                on_conn(conn)
+            with conn.transaction():
+                dest = target
+                if upsert:
+                    keys = self.primary_key(table, conn)
+                    if not keys:
+                        raise RuntimeError(f"La tabla {table} no tiene clave primaria; no se puede actualizar.")
+                    missing = [k for k in keys if k not in columns]
+                    if missing:
+                        raise RuntimeError(f"Falta mapear la clave primaria: {', '.join(missing)}")
+                    conn.execute(f"CREATE TEMP TABLE perruls_import (LIKE {target} INCLUDING DEFAULTS) ON COMMIT DROP")
+                    dest = "perruls_import"
+                with open(path, newline="", encoding="utf-8-sig") as f:
+                    reader = csv.reader(f, sniff_csv_dialect(path))
+                    next(reader, None)
+                    while True:
+                        batch = list(itertools.islice(reader, batch_rows))
+                        if not batch:
+                            break
+                        with conn.cursor() as cur:
+                            with cur.copy(f"COPY {dest} ({col_sql}) FROM STDIN") as copy:
+                                for r in batch:
+                                    copy.write_row([
+                                        None if i >= len(r) or (null and r[i] == "") else r[i]
+                                        for i, null in zip(indexes, blank_is_null)
+                                    ])
+                        rows += len(batch)
+                        if progress:
+                            progress(rows, time.monotonic() - started)
+                        if should_stop and should_stop():
+                            raise ImportCancelled()
+                if upsert:
+                    key_sql = ", ".join(psql_ident(k) for k in keys)
+                    updates = [c for c in columns if c not in keys]
+                    action = ("DO UPDATE SET " + ", ".join(f"{psql_ident(c)} = EXCLUDED.{psql_ident(c)}" for c in updates)
+                              if updates else "DO NOTHING")
+                    # Si el CSV repite una clave gana la última fila.
+                    conn.execute(
+                        f"INSERT INTO {target} ({col_sql}) "
+                        f"SELECT DISTINCT ON ({key_sql}) {col_sql} FROM perruls_import ORDER BY {key_sql}, ctid DESC "
+                        f"ON CONFLICT ({key_sql}) {action}"
+                    )
+        self.cache.clear()
+        return rows, time.monotonic() - started
+
+    def refresh_schema(self) -> dict:
+        """Lee de pg_catalog, en una sola consulta, las tablas y vistas de public
+        con sus columnas, tipos y filas estimadas (reltuples). Mucho más rápido
+        que information_schema en catálogos grandes.
+
+        Devuelve {tabla: {"rows": estimación o -1, "columns": [[nombre, tipo,
+        acepta_nulos, default], ...]}} y lo deja en self.schema.
+        """
+        _, rows = self.run_aux_query(SCHEMA_SQL)
+        tables: dict = {}
+        for table, estimate, column, dtype, nullable, default in rows:
+            entry = tables.setdefault(table, {"rows": estimate, "columns": []})
+            if column is not None:
+                entry["columns"].append([column, dtype, nullable, default])
+        self.schema = tables
+        return tables
+
+    def list_tables(self):
+        schema = self.schema if self.schema is not None else self.refresh_schema()
+        rows = [(name, t["rows"] if t["rows"] >= 0 else None) for name, t in sorted(schema.items())]
+        return ["table_name", "filas_estimadas"], rows
+
+    def table_schema(self, table_name: str):
+        schema = self.schema
+        if schema is None or table_name not in schema:
+            schema = self.refresh_schema()
+        columns = schema.get(table_name, {"columns": []})["columns"]
+        rows = [(c, t, "YES" if nullable else "NO", d) for c, t, nullable, d in columns]
+        return ["column_name", "data_type", "is_nullable", "column_default"], rows
+
+FETCH_CHUNK = 10000
+
+# Tipos que se guardan con diccionario (códigos + valores distintos) mientras
+# se repitan lo suficiente.
+DICT_TYPES = (str, bool, dt.date, dt.datetime, dt.time, dt.timedelta, uuid.UUID, Decimal)
+
+class Column:
+    """Una columna de ColumnStore.
+
+    Según el primer valor no nulo se elige la representación:
+      int      -> array('q')
+      float    -> array('d')
+      dict     -> códigos array('I') + lista de valores distintos
+      text     -> bytes UTF-8 concatenados + array('Q') de offsets, para
+                  texto o Decimal con demasiados valores distintos para el
+                  diccionario (el Decimal se guarda como str(v), que es exacto)
+      obj      -> lista de objetos (cualquier otro caso)
+    Los nulos se marcan en un bitmap y en los datos queda un valor de relleno.
+    """
+    DICT_MAX = 1 << 16
+
+    def __init__(self):
+        self.kind: str | None = None
+        self.n = 0
+        self.nulls: bytearray | None = None
+        self.data = None
+        self.values: list | None = None
+        self.index: dict | None = None
+        self.blob: bytearray | None = None
+        self.conv = str
+
+    def extend(self, values: tuple):
+        start = self.n
+        self.n += len(values)
+        has_nulls = None in values
+        if has_nulls:
+            self._mark_nulls(start, values)
+        if self.kind is None:
+            first = next((v for v in values if v is not None), None)
+            if first is None:
+                return
+            self._start(first, start)
+        try:
+            self._append(values, has_nulls)
+        except (TypeError, OverflowError):
+            # Un valor que no entra en la representación elegida: se pasa a
+            # lista de objetos y se reintenta.
+            self._to_obj(start)
+            self._append(values, has_nulls)
+        if self.kind == "dict" and len(self.values) > self.DICT_MAX and len(self.values) * 2 > self.n:
+            self._undict()
+
+    def _mark_nulls(self, start: int, values: tuple):
+        if self.nulls is None:
+            self.nulls = bytearray()
+        need = (start + len(values) + 7) // 8
+        if len(self.nulls) < need:
+            self.nulls.extend(bytes(need - len(self.nulls)))
+        nulls = self.nulls
+        i = values.index(None)
+        while True:
+            j = start + i
+            nulls[j >> 3] |= 1 << (j & 7)
+            try:
+                i = values.index(None, i + 1)
+            except ValueError:
+                break
+
+    def is_null(self, i: int) -> bool:
+        nulls = self.nulls
+        return nulls is not None and (i >> 3) < len(nulls) and bool(nulls[i >> 3] & (1 << (i & 7)))
+
+    def _start(self, first, pad: int):
+        t = type(first)
+        if t is int:
+            self.kind, self.data = "int", array("q", bytes(8 * pad))
+        elif t is float:
+            self.kind, self.data = "float", array("d", bytes(8 * pad))
+        elif isinstance(first, DICT_TYPES):
+            self.kind, self.data = "dict", array("I", bytes(4 * pad))
+            # None apunta a un código cualquiera: el bitmap manda.
+            self.values, self.index = [first], {self._key(first): 0, None: 0}
+        else:
+            self.kind, self.data = "obj", [None] * pad
+
+    @staticmethod
+    def _key(v):
+        # Decimal('1.0') == Decimal('1.00'): se distinguen para no cambiar
+        # cómo se muestra el valor.
+        return (v, v.as_tuple().exponent) if type(v) is Decimal else v
+
+    def _append(self, values: tuple, has_nulls: bool):
+        kind = self.kind
+        if kind == "int":
+            self.data.extend([0 if v is None else v for v in values] if has_nulls else values)
+        elif kind == "float":
+            self.data.extend([0.0 if v is None else v for v in values] if has_nulls else values)
+        elif kind == "dict":
+            index, vals = self.index, self.values
+            keys = [None if v is None else self._key(v) for v in values] if type(vals[0]) is Decimal else values
+            codes = list(map(index.get, keys, itertools.repeat(-1)))
+            if -1 in codes:
+                for i, c in enumerate(codes):
+                    if c < 0:
+                        k = keys[i]
+                        c = index.get(k)
+                        if c is None:
+                            c = index[k] = len(vals)
+                            vals.append(values[i])
+                        codes[i] = c
+            self.data.extend(codes)
+        elif kind == "text":
+            conv = self.conv
+            if not set(map(type, values)) <= {conv, type(None)}:
+                raise TypeError
+            if conv is not str:
+                values = [None if v is None else str(v) for v in values]
+            parts = [b"" if v is None else v.encode("utf-8", "surrogatepass") for v in values]
+            offsets = self.data
+            offsets.extend(itertools.islice(itertools.accumulate(map(len, parts), initial=offsets[-1]), 1, None))
+            self.blob += b"".join(parts)
+        else:
+            self.data.extend(values)
+
+    def _to_obj(self, upto: int):
+        self.data = [self.get(i) for i in range(upto)]
+        self.kind = "obj"
+        self.values = self.index = self.blob = None
+
+    def _undict(self):
+        vals, codes = self.values, self.data
+        conv = type(vals[0])
+        if conv in (str, Decimal) and all(type(v) is conv for v in vals):
+            blob = bytearray()
+            offsets = array("Q", [0])
+            for i, c in enumerate(codes):
+                if not self.is_null(i):
+                    blob += str(vals[c]).encode("utf-8", "surrogatepass")
+                offsets.append(len(blob))
+            self.kind, self.blob, self.data, self.conv = "text", blob, offsets, conv
+        else:
+            self.kind, self.data = "obj", [None if self.is_null(i) else vals[c] for i, c in enumerate(codes)]
+        self.values = self.index = None
+
+    def get(self, i: int):
+        if self.kind is None or self.is_null(i):
+            return None
+        kind = self.kind
+        if kind == "dict":
+            return self.values[self.data[i]]
+        if kind == "text":
+            return self.conv(self.blob[self.data[i]:self.data[i + 1]].decode("utf-8", "surrogatepass"))
+        return self.data[i]
+
+    def slice(self, start: int, end: int) -> list:
+        kind = self.kind
+        if kind is None:
+            return [None] * (end - start)
+        if kind == "dict":
+            vals = self.values
+            out = [vals[c] for c in self.data[start:end]]
+        elif kind == "text":
+            blob, offsets = self.blob, self.data
+            out = [blob[offsets[i]:offsets[i + 1]].decode("utf-8", "surrogatepass") for i in range(start, end)]
+            if self.conv is not str:
+                out = [self.conv(v) if v else None for v in out]
+        else:
+            out = list(self.data[start:end])
+        nulls = self.nulls
+        if nulls is not None and any(nulls[start >> 3:(end + 7) >> 3]):
+            for i in range(start, end):
+                if self.is_null(i):
+                    out[i - start] = None
+        return out
+
+    def take(self, ids) -> list:
+        """Valores de las filas ids, en ese orden."""
+        kind = self.kind
+        if kind is None:
+            return [None] * len(ids)
+        if kind == "text":
+            return [self.get(i) for i in ids]
+        if kind == "dict":
+            vals, codes = self.values, self.data
+            out = [vals[codes[i]] for i in ids]
+        else:
+            data = self.data
+            out = [data[i] for i in ids]
+        if self.nulls is not None:
+            is_null = self.is_null
+            out = [None if is_null(i) else v for i, v in zip(ids, out)]
+        return out
+
+    def null_rows(self) -> list[int]:
+        """Filas nulas, en orden, leídas del bitmap byte a byte."""
+        out = []
+        for b, byte in enumerate(self.nulls or b""):
+            if byte:
+                out.extend((b << 3) + k for k in range(8) if byte >> k & 1)
+        return out
+
+    def nbytes(self) -> int:
+        size = len(self.nulls or b"")
+        if self.kind in ("int", "float", "dict", "text"):
+            size += self.data.itemsize * len(self.data)
+        if self.blob is not None:
+            size += len(self.blob)
+        if self.values is not None:
+            size += list_size(self.values) + sys.getsizeof(self.index)
+        if self.kind == "obj":
+            size += list_size(self.data)
+        return size
+
+def list_size(values: list) -> int:
+    """Tamaño aproximado de una lista de valores, midiendo una muestra."""
+    if not values:
+        return sys.getsizeof(values)
+    sample = values[:200]
+    return sys.getsizeof(values) + int(sum(sys.getsizeof(v) for v in sample) / len(sample) * len(values))
+
+class ColumnStore:
+    """Resultado de una consulta guardado por columnas (ver Column), mucho más
+    compacto que una lista de tuplas. Se usa como una lista de solo lectura:
+    len(), store[i] y store[a:b] devuelven tuplas, y se puede iterar.
+    """
+
+    def __init__(self, columns, rows=()):
+        self.columns = list(columns)
+        self._cols = [Column() for _ in self.columns]
+        self._len = 0
+        self.extend(rows)
+
+    def extend(self, rows):
+        rows = rows if isinstance(rows, list) else list(rows)
+        if not rows:
+            return
+        for col, values in zip(self._cols, zip(*rows)):
+            col.extend(values)
+        self._len += len(rows)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, end, step = key.indices(self._len)
+            if step != 1:
+                return [self[i] for i in range(start, end, step)]
+            if start >= end:
+                return []
+            return list(zip(*(c.slice(start, end) for c in self._cols)))
+        if key < 0:
+            key += self._len
+        if not 0 <= key < self._len:
+            raise IndexError("índice fuera de rango")
+        return tuple(c.get(key) for c in self._cols)
+
+    def __iter__(self):
+        for start in range(0, self._len, FETCH_CHUNK):
+            yield from self[start:start + FETCH_CHUNK]
+
+    def column(self, j: int) -> Column:
+        return self._cols[j]
+
+    def view(self, start: int, end: int) -> "StoreView":
+        return StoreView(self, start, min(end, self._len))
+
+    def take(self, ids) -> list[tuple]:
+        if not len(ids):
+            return []
+        return list(zip(*(c.take(ids) for c in self._cols)))
+
+    def nbytes(self) -> int:
+        return sys.getsizeof(self) + sum(c.nbytes() for c in self._cols)
+
+class StoreView:
+    """Rango [start, end) de un ColumnStore sin copiar filas (una página)."""
+
+    def __init__(self, store: ColumnStore, start: int, end: int):
+        self.store, self.start, self.end = store, start, max(start, end)
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, end, step = key.indices(len(self))
+            return self.store[self.start + start:self.start + end:step]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("índice fuera de rango")
+        return self.store[self.start + key]
+
+    def __iter__(self):
+        for start in range(self.start, self.end, FETCH_CHUNK):
+            yield from self.store[start:min(start + FETCH_CHUNK, self.end)]
+
+class IndexedRows:
+    """Filas de un resultado en el orden (y subconjunto) que da order, sin
+    copiarlas. Es lo que se muestra cuando hay orden o filtro locales.
+    """
+
+    def __init__(self, base, order: array):
+        self.base, self.order = base, order
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def _take(self, ids) -> list[tuple]:
+        base = self.base
+        return base.take(ids) if isinstance(base, ColumnStore) else [base[i] for i in ids]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self._take(self.order[key])
+        return self.base[self.order[key]]
+
+    def __iter__(self):
+        for start in range(0, len(self.order), FETCH_CHUNK):
+            yield from self._take(self.order[start:start + FETCH_CHUNK])
+
+    def view(self, start: int, end: int) -> "IndexedRows":
+        return IndexedRows(self.base, self.order[start:end])
+
+def sort_key(v):
+    # El texto se ordena sin distinguir mayúsculas (y "Ana" antes que "ana").
+    return (v.casefold(), v) if type(v) is str else v
+
+def sorted_ids(keys, null_ids: list[int], n: int) -> array:
+    """Filas 0..n-1 ordenadas por keys[i], con las nulas al final (como ASC
+    en PostgreSQL). Si los valores no se pueden comparar se ordena por str.
+    """
+    if null_ids:
+        nulls = set(null_ids)
+        ids = [i for i in range(n) if i not in nulls]
+    else:
+        ids = range(n)
+    try:
+        order = sorted(ids, key=keys.__getitem__)
+    except TypeError:
+        order = sorted(ids, key=lambda i: str(keys[i]))
+    order.extend(null_ids)
+    return array("I", order)
+
+class ResultIndex:
+    """Índices sobre un resultado ya cargado para ordenar y filtrar en memoria.
+
+    - Orden: por columna, la permutación ascendente de las filas; se calcula
+      la primera vez que se pide y queda guardada (la descendente es la misma
+      al revés).
+    - Filtro: índice invertido valor -> filas para las columnas con
+      diccionario (valores repetidos) y, para el resto, el texto de toda la
+      columna en un solo str donde se busca con str.find.
+    El texto buscado es str(valor) sin distinguir mayúsculas.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.n = len(rows)
+        self.ncols = len(rows.columns) if isinstance(rows, ColumnStore) else (len(rows[0]) if rows else 0)
+        self._orders: dict[int, array] = {}
+        self._positions: dict[int, array] = {}
+        self._search: list | None = None
+        self._lock = threading.Lock()
+
+    def _column(self, j: int) -> Column | None:
+        return self.rows.column(j) if isinstance(self.rows, ColumnStore) else None
+
+    def _values(self, j: int) -> list:
+        col = self._column(j)
+        return col.slice(0, self.n) if col is not None else [r[j] for r in self.rows]
+
+    def order(self, j: int) -> array:
+        with self._lock:
+            if j not in self._orders:
+                self._orders[j] = self._sort(j)
+            return self._orders[j]
+
+    def _sort(self, j: int) -> array:
+        col = self._column(j)
+        if col is not None and col.kind == "dict":
+            # Se ordenan solo los valores distintos y cada fila toma el rango de su código.
+            vals = col.values
+            try:
+                ranked = sorted(range(len(vals)), key=lambda c: sort_key(vals[c]))
+            except TypeError:
+                ranked = sorted(range(len(vals)), key=lambda c: str(vals[c]))
+            rank = array("I", bytes(4 * len(vals)))
+            for r, c in enumerate(ranked):
+                rank[c] = r
+            return sorted_ids(list(map(rank.__getitem__, col.data)), col.null_rows(), self.n)
+        if col is not None and col.kind in ("int", "float"):
+            return sorted_ids(col.data, col.null_rows(), self.n)
+        values = self._values(j)
+        null_ids = col.null_rows() if col is not None else [i for i, v in enumerate(values) if v is None]
+        return sorted_ids([sort_key(v) for v in values], null_ids, self.n)
+
+    def position(self, j: int) -> array:
+        """Inversa de order(j): posición de cada fila en el orden ascendente."""
+        order = self.order(j)
+        with self._lock:
+            if j not in self._positions:
+                pos = array("I", bytes(4 * len(order)))
+                for k, i in enumerate(order):
+                    pos[i] = k
+                self._positions[j] = pos
+            return self._positions[j]
+
+    def _build_search(self) -> list:
+        search = []
+        for j in range(self.ncols):
+            col = self._column(j)
+            if col is not None and col.kind == "dict":
+                groups = [array("I") for _ in col.values]
+                appenders = [g.append for g in groups]
+                for i, c in enumerate(col.data):
+                    appenders[c](i)
+                if col.nulls is not None:
+                    nulls = set(col.null_rows())
+                    groups[0] = array("I", [i for i in groups[0] if i not in nulls])
+                search.append(("dict", [str(v).casefold() for v in col.values], groups))
+            else:
+                if col is not None and col.kind in ("int", "float"):
+                    texts = list(map(str, col.data))
+                    for i in col.null_rows():
+                        texts[i] = ""
+                else:
+                    texts = ["" if v is None else str(v).casefold() for v in self._values(j)]
+                starts = array("Q", itertools.accumulate((len(t) + 1 for t in texts), initial=0))
+                search.append(("text", "\x00".join(texts), starts))
+        return search
+
+    def search(self, text: str) -> array | None:
+        """Filas (en orden) donde alguna columna contiene text; None = todas."""
+        with self._lock:
+            if self._search is None:
+                self._search = self._build_search()
+            search = self._search
+        q = text.casefold()
+        found: set[int] = set()
+        for kind, data, extra in search:
+            if kind == "dict":
+                for c, value in enumerate(data):
+                    if q in value:
+                        found.update(extra[c])
+            else:
+                pos = data.find(q)
+                while pos != -1:
+                    row = bisect_right(extra, pos) - 1
+                    found.add(row)
+                    # Siguiente búsqueda desde la fila siguiente.
+                    pos = data.find(q, extra[row + 1])
+            if len(found) == self.n:
+                return None
+        return array("I", sorted(found))
+
+    def view(self, j: int | None, desc: bool, text: str) -> array | None:
+        """Filas a mostrar con el orden por la columna j (None = sin orden) y
+        el filtro text ("" = sin filtro). None = todas en el orden original.
+        """
+        matches = self.search(text) if text else None
+        if j is None:
+            return matches
+        if matches is None:
+            order = self.order(j)
+            return order[::-1] if desc else order
+        pos = self.position(j)
+        return array("I", sorted(matches, key=pos.__getitem__, reverse=desc))
+
+class ResultCache:
+    """Caché LRU de resultados, acotada por cantidad, memoria estimada y TTL.
+
+    Las claves son tuplas (tipo, sql, ...) para poder descartar todo lo de una
+    misma consulta (resultado, páginas y count) con discard_sql.
+    """
+
+    def __init__(self, max_entries: int = 64, max_bytes: int = 128 * 1024 * 1024, ttl: float = 300):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()  # clave -> (expira, bytes, valor)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, value):
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            if size > self.max_bytes:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, size, value)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._data)))
+
+    def _drop(self, key):
+        self._bytes -= self._data.pop(key)[1]
+
+    def discard_sql(self, sql: str):
+        sql = strip_sql(sql)
+        with self._lock:
+            for key in [k for k in self._data if k[1] == sql]:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> str:
+        with self._lock:
+            return f"caché: {len(self._data)} resultados, {self._bytes / 1048576:.1f} MB, {self.hits} aciertos / {self.misses} fallos"
+
+def estimate_size(value) -> int:
+    """Tamaño aproximado en bytes de un resultado (columnas, filas[, ...]).
+    Para no recorrer millones de filas se mide una muestra y se extrapola.
+    """
+    if not isinstance(value, tuple):
+        return sys.getsizeof(value)
+    size = sys.getsizeof(value)
+    for part in value:
+        if isinstance(part, ColumnStore):
+            size += part.nbytes()
+        elif isinstance(part, list) and part:
+            sample = part[:200]
+            per_row = sum(sys.getsizeof(r) + sum(sys.getsizeof(v) for v in r) for r in sample) / len(sample)
+            size += sys.getsizeof(part) + int(per_row * len(part))
+        else:
+            size += sys.getsizeof(part)
+    return size
+
+SCHEMA_SQL = """
+SELECT c.relname, c.reltuples::bigint, a.attname, format_type(a.atttypid, a.atttypmod),
+       NOT a.attnotnull, pg_get_expr(d.adbin, d.adrelid)
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+LEFT JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+LEFT JOIN pg_attrdef d ON d.adrelid = c.oid AND d.adnum = a.attnum
+WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p', 'v', 'm', 'f')
+ORDER BY c.relname, a.attnum
+"""
+
+# Copia local del esquema por servidor y base, para mostrar las tablas al
+# instante en el próximo inicio (se actualiza en segundo plano igual).
+SCHEMA_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".perruls", "esquema.json")
+
+def _read_schema_file() -> dict:
+    try:
+        with open(SCHEMA_CACHE_PATH, encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def load_schema_cache(key: str) -> dict | None:
+    entry = _read_schema_file().get(key)
+    return entry.get("tables") if isinstance(entry, dict) else None
+
+def save_schema_cache(key: str, tables: dict):
+    data = _read_schema_file()
+    data[key] = {"saved": dt.datetime.now().isoformat(timespec="seconds"), "tables": tables}
+    try:
+        os.makedirs(os.path.dirname(SCHEMA_CACHE_PATH), exist_ok=True)
+        tmp = SCHEMA_CACHE_PATH + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, SCHEMA_CACHE_PATH)
+    except OSError:
+        pass
+
+TEXT_TYPES = {"text", "character varying", "character", "citext", "name"}
+
+class ImportCancelled(Exception):
+    pass
+
+def sniff_csv_dialect(path: str):
+    """Detecta el separador (coma o punto y coma, típico de Excel en español)."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        sample = f.read(64 * 1024)
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=",;\t|")
+    except csv.Error:
+        return csv.excel
+
+def read_csv_header(path: str) -> list[str]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return next(csv.reader(f, sniff_csv_dialect(path)), [])
+
+class ImportDialog(tk.Toplevel):
+    """Diálogo para mapear columnas del CSV a la tabla e importar en segundo plano."""
+    SKIP = "(omitir)"
+
+    def __init__(self, app, table: str, path: str, header: list[str], schema_rows):
+        super().__init__(app)
+        self.app = app
+        self.table = table
+        self.path = path
+        self.header = header
+        self.types = {r[0]: r[1] for r in schema_rows}
+        self.conn: psycopg.Connection | None = None
+        self.cancelled = False
+        self.running = False
+        self.title(f"Importar CSV en {table}")
+        self.transient(app)
+
+        body = ttk.Frame(self, padding=10)
+        body.pack(fill=tk.BOTH, expand=True)
+        ttk.Label(body, text=os.path.basename(path)).grid(row=0, column=0, columnspan=3, sticky="w", pady=(0, 6))
+        ttk.Label(body, text="Columna", font=("Segoe UI", 10, "bold")).grid(row=1, column=0, sticky="w")
+        ttk.Label(body, text="Tipo", font=("Segoe UI", 10, "bold")).grid(row=1, column=1, sticky="w", padx=8)
+        ttk.Label(body, text="Columna del CSV", font=("Segoe UI", 10, "bold")).grid(row=1, column=2, sticky="w")
+        by_name = {h.strip().lower(): h for h in header}
+        self.choices: dict[str, tk.StringVar] = {}
+        for n, (col, dtype) in enumerate(self.types.items(), start=2):
+            ttk.Label(body, text=col).grid(row=n, column=0, sticky="w")
+            ttk.Label(body, text=dtype).grid(row=n, column=1, sticky="w", padx=8)
+            var = tk.StringVar(value=by_name.get(col.lower(), self.SKIP))
+            ttk.Combobox(body, textvariable=var, values=[self.SKIP] + header, state="readonly", width=24).grid(
+                row=n, column=2, sticky="ew", pady=1)
+            self.choices[col] = var
+
+        self.upsert_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(body, text="Actualizar filas existentes (upsert por clave primaria)",
+                        variable=self.upsert_var).grid(row=n + 1, column=0, columnspan=3, sticky="w", pady=(8, 0))
+        self.lbl_progress = ttk.Label(body, text="")
+        self.lbl_progress.grid(row=n + 2, column=0, columnspan=3, sticky="w", pady=(6, 0))
+        btns = ttk.Frame(body)
+        btns.grid(row=n + 3, column=0, columnspan=3, sticky="e", pady=(8, 0))
+        self.btn_import = ttk.Button(btns, text="Importar", command=self.on_import)
+        self.btn_import.pack(side=tk.LEFT)
+        self.btn_close = ttk.Button(btns, text="Cerrar", command=self.on_close)
+        self.btn_close.pack(side=tk.LEFT, padx=(6, 0))
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def on_import(self):
+        mapping = [(self.header.index(v.get()), col) for col, v in self.choices.items() if v.get() != self.SKIP]
+        if not mapping:
+            messagebox.showinfo("Importar", "Elige al menos una columna.", parent=self)
+            return
+        self.running = True
+        self.cancelled = False
+        self.btn_import.configure(state="disabled")
+        self.btn_close.configure(text="Cancelar")
+        self.lbl_progress.configure(text="Importando…")
+        upsert = self.upsert_var.get()
+
+        def on_conn(conn):
+            self.conn = conn
+
+        def progress(rows, seconds):
+            self.after(0, lambda: self.lbl_progress.configure(
+                text=f"{rows:,} filas · {rows / max(seconds, 1e-6):,.0f} filas/s"))
+
+        def worker():
+            try:
+                rows, seconds = self.app.client.import_csv(
+                    self.table, self.path, mapping, self.types, upsert,
+                    progress=progress, should_stop=lambda: self.cancelled, on_conn=on_conn)
+                self.after(0, lambda: self._finished(rows, seconds, None))
+            except Exception as e:
+                self.after(0, lambda e=e: self._finished(0, 0, e))
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _finished(self, rows, seconds, error):
+        self.running = False
+        self.conn = None
+        self.btn_import.configure(state="normal")
+        self.btn_close.configure(text="Cerrar")
+        if error is None:
+            self.lbl_progress.configure(
+                text=f"Listo: {rows:,} filas en {seconds:.1f} s ({rows / max(seconds, 1e-6):,.0f} filas/s)")
+            self.app.status.configure(text=f"{rows} filas importadas en {self.table}")
+        elif self.cancelled:
+            self.lbl_progress.configure(text="Importación cancelada (sin cambios)")
+        else:
+            self.lbl_progress.configure(text="Error: no se importó nada")
+            messagebox.showerror("Importar", str(error), parent=self)
+
+    def on_close(self):
+        if not self.running:
+            self.destroy()
+            return
+        self.cancelled = True
+        self.lbl_progress.configure(text="Cancelando…")
+        conn = self.conn
+        if conn is not None:
+            threading.Thread(target=conn.cancel_safe, daemon=True).start()
+
+class QueryExecutor:
+    """Ejecuta los trabajos de la conexión principal de a uno, en un único hilo.
+
+    Cada trabajo pertenece a un canal ("main", "export", ...) y recibe un número
+    de secuencia. Dentro de un canal gana el último: al encolar uno nuevo se
+    descartan los pendientes del mismo canal, y is_current() permite ignorar
+    resultados de trabajos que ya fueron reemplazados. Como hay a lo sumo un
+    pendiente por canal, la cola queda acotada (maxsize).
+    """
+
+    def __init__(self, maxsize: int = 8):
+        self.maxsize = maxsize
+        self._jobs: deque = deque()
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._latest: dict[str, int] = {}
+        self._stopped = False
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def next_tag(self, channel: str = "main") -> int:
+        """Reserva un número de secuencia en el canal sin encolar nada (para
+        trabajos que corren fuera del ejecutor pero compiten por la grilla).
+        """
+        with self._cond:
+            self._seq += 1
+            self._latest[channel] = self._seq
+            return self._seq
+
+    def submit(self, fn, on_done, on_error, channel: str = "main") -> int:
+        """Encola fn(); al terminar llama on_done(seq, resultado) u
+        on_error(seq, excepción) desde el hilo del ejecutor.
+        """
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("El ejecutor está detenido.")
+            self._seq += 1
+            seq = self._seq
+            self._latest[channel] = seq
+            self._jobs = deque(j for j in self._jobs if j[1] != channel)
+            if len(self._jobs) >= self.maxsize:
+                raise RuntimeError("Demasiadas consultas en cola.")
+            self._jobs.append((seq, channel, fn, on_done, on_error))
+            self._cond.notify()
+            return seq
+
+    def is_current(self, seq: int, channel: str = "main") -> bool:
+        with self._cond:
+            return self._latest.get(channel) == seq
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._jobs.clear()
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._jobs and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                seq, channel, fn, on_done, on_error = self._jobs.popleft()
+            if not self.is_current(seq, channel):
+                continue
+            try:
+                result = fn()
+            except Exception as e:
+                on_error(seq, e)
+            else:
+                on_done(seq, result)
+
+class VirtualTree(ttk.Frame):
+    """Grilla de resultados virtualizada sobre un ttk.Treeview.
+
+    Solo existen tantos ítems como filas caben en pantalla; al desplazarse se
+    reutilizan sus IDs cambiando los valores, así la cantidad de widgets y la
+    memoria de Tk no dependen del número de filas. rows puede ser cualquier
+    secuencia con len() e índice.
+    """
+    SAMPLE_ROWS = 200
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.columns: list[str] = []
+        self.rows = []
+        self.top = 0
+        self.visible = 1
+        self.selected: int | None = None
+        # Clic en un encabezado -> on_heading(columna); sort = (columna, desc)
+        # se marca con una flecha.
+        self.on_heading = None
+        self.sort: tuple[str, bool] | None = None
+
+        font = tkfont.nametofont("TkDefaultFont")
+        self.char_width = font.measure("0")
+        style = ttk.Style(self)
+        self.rowheight = int(style.lookup("Treeview", "rowheight") or font.metrics("linespace") + 6)
+        style.configure("Treeview", rowheight=self.rowheight)
+
+        self.tree = ttk.Treeview(self, columns=(), show="headings", selectmode="browse")
+        self.vsb = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.hsb = ttk.Scrollbar(self, orient="horizontal", command=self.tree.xview)
+        self.tree.configure(xscroll=self.hsb.set)
+        self.hsb.pack(side=tk.BOTTOM, fill=tk.X)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.vsb.pack(side=tk.LEFT, fill=tk.Y)
+
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<MouseWheel>", self._on_wheel)
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll(3))
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        for key, step in (("<Up>", -1), ("<Down>", 1), ("<Prior>", "-page"), ("<Next>", "page"),
+                          ("<Home>", "home"), ("<End>", "end")):
+            self.tree.bind(key, lambda e, step=step: self._on_key(step))
+
+    def set_data(self, columns, rows):
+        columns = list(columns or [])
+        self.rows = rows if rows is not None else []
+        self.top = 0
+        self.selected = None
+        if columns != self.columns:
+            self.tree.delete(*self.tree.get_children())
+            self.tree["columns"] = columns
+            self.columns = columns
+        for c, width in zip(columns, self._column_widths(columns, self.rows)):
+            self.tree.heading(c, text=self._heading_text(c), command=lambda c=c: self.on_heading and self.on_heading(c))
+            self.tree.column(c, width=width, stretch=False)
+        self.render()
+
+    def clear(self):
+        self.set_data([], [])
+
+    def _heading_text(self, column: str) -> str:
+        if self.sort and self.sort[0] == column:
+            return f"{column} {'▼' if self.sort[1] else '▲'}"
+        return column
+
+    def _column_widths(self, columns, rows):
+        """Ancho por columna según una muestra pareja de hasta SAMPLE_ROWS filas."""
+        n = len(rows)
+        step = max(1, n // self.SAMPLE_ROWS)
+        sample = [rows[i] for i in range(0, n, step)][:self.SAMPLE_ROWS]
+        for j, c in enumerate(columns):
+            longest = max([len(str(r[j])) for r in sample] + [len(c) + 2])
+            yield min(400, max(80, longest * self.char_width + 16))
+
+    def render(self):
+        total = len(self.rows)
+        self.top = max(0, min(self.top, total - self.visible))
+        count = max(0, min(self.visible, total - self.top))
+        existing = self.tree.get_children()
+        for i in range(len(existing), count):
+            self.tree.insert("", tk.END, iid=f"r{i}")
+        if len(existing) > count:
+            self.tree.delete(*existing[count:])
+        for i in range(count):
+            self.tree.item(f"r{i}", values=list(self.rows[self.top + i]))
+        if self.selected is not None and self.top <= self.selected < self.top + count:
+            iid = f"r{self.selected - self.top}"
+            self.tree.selection_set(iid)
+            self.tree.focus(iid)
+        elif self.tree.selection():
+            self.tree.selection_remove(*self.tree.selection())
+        if total:
+            self.vsb.set(self.top / total, (self.top + count) / total)
+        else:
+            self.vsb.set(0, 1)
+
+    def scroll(self, n: int):
+        self.top += n
+        self.render()
+
+    def _on_scrollbar(self, *args):
+        total = len(self.rows)
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * total)
+        elif args[0] == "scroll":
+            n = int(args[1])
+            self.top += n * self.visible if args[2] == "pages" else n
+        self.render()
+
+    def _on_resize(self, event):
+        visible = max(1, (event.height - self.rowheight - 4) // self.rowheight)
+        if visible != self.visible:
+            self.visible = visible
+            self.render()
+
+    def _on_wheel(self, event):
+        if abs(event.delta) >= 120:
+            self.scroll(-3 * (event.delta // 120))
+        elif event.delta:
+            self.scroll(-1 if event.delta > 0 else 1)
+
+    def _on_select(self, event=None):
+        sel = self.tree.selection()
+        if sel:
+            self.selected = self.top + int(sel[0][1:])
+
+    def _on_key(self, step):
+        total = len(self.rows)
+        if not total:
+            return "break"
+        current = self.selected if self.selected is not None else self.top
+        if step == "home":
+            target = 0
+        elif step == "end":
+            target = total - 1
+        elif step in ("page", "-page"):
+            target = current + (self.visible if step == "page" else -self.visible)
+        else:
+            target = current + step
+        self.selected = max(0, min(total - 1, target))
+        if self.selected < self.top:
+            self.top = self.selected
+        elif self.selected >= self.top + self.visible:
+            self.top = self.selected - self.visible + 1
+        self.render()
+        return "break"
+
+# Consultas de los botones de "Acciones rápidas": atributo del botón -> (texto, SQL).
+# bench/carga.py las ejecuta tal cual para medirlas.
+QUICK_ACTIONS = {
+    "btn_q_mascotas_vacunadas": ("Mascotas vacunadas en Isabel Bongard", """
+SELECT mascota.chip_id, mascota.nombre_mascota, mascota.raza, sucursal.nombre_campus, vacuna.nombre_vacuna, vacuna.fecha_aplicacion
+FROM sucursal
+JOIN mascota ON sucursal.nombre_campus = mascota.nombre_campus 
+JOIN vacuna ON mascota.chip_id = vacuna.chip_id 
+WHERE sucursal.nombre_campus = 'Isabel Bongard'
+ORDER BY vacuna.fecha_aplicacion DESC;
+"""),
+    "btn_q_medicamentos_campus": ("Medicamentos por campus", """
+SELECT sucursal.nombre_campus, inventario.nombre AS medicamento, inventario.cantidad, medicamento.gramaje
+FROM inventario
+JOIN sucursal ON inventario.nombre_campus = sucursal.nombre_campus
+JOIN medicamento ON inventario.id_item = medicamento.id_item
+ORDER BY sucursal.nombre_campus, inventario.nombre;
+"""),
+    "btn_q_comida_mascotas": ("Comida y mascotas por campus", """
+SELECT 
+    nombre_campus,
+    total_mascotas,
+    stock_alimento AS stock_total_alimento,
+    kg_por_mascota,
+    items_criticos
+FROM resumen_campus
+ORDER BY stock_alimento DESC;
+"""),
+    "btn_q_stock_critico": ("Alimentos con stock crítico relativo", """
+SELECT sucursal.nombre_campus, inventario.nombre AS Comida, inventario.cantidad,
+ COUNT(mascota.chip_id) AS cantidad_mascotas,  inventario.cantidad / COUNT(mascota.chip_id) AS kg_por_mascota
+FROM inventario
+JOIN sucursal ON inventario.nombre_campus = sucursal.nombre_campus
+LEFT JOIN mascota ON mascota.nombre_campus = sucursal.nombre_campus
+WHERE inventario.tipo = 'Comida'
+GROUP BY sucursal.nombre_campus, inventario.nombre, inventario.cantidad
+HAVING (inventario.cantidad / COUNT(mascota.chip_id)) < 10
+ORDER BY kg_por_mascota ASC;
+"""),
+    "btn_q_mascotas_derivadas": ("Mascotas derivadas", """
+SELECT derivacion.id_derivacion, derivacion.fecha, derivacion.motivo, derivacion.ubicacion_vet, mascota.chip_id, mascota.nombre_mascota, sucursal.nombre_campus
+FROM derivacion
+JOIN mascota ON derivacion.chip_id = mascota.chip_id
+JOIN sucursal ON mascota.nombre_campus = sucursal.nombre_campus
+ORDER BY derivacion.fecha DESC;
+"""),
+}
+
+# Acciones que leen tablas de una migración (migraciones/*.sql): atributo del
+# botón -> (tabla, SQL equivalente sobre las tablas base). Se usa si el esquema
+# leído de la base no tiene esa tabla.
+QUICK_ACTION_FALLBACKS = {
+    "btn_q_comida_mascotas": ("resumen_campus", """
+SELECT
+    sucursal.nombre_campus,
+    m.total AS total_mascotas,
+    COALESCE(c.stock, 0) AS stock_total_alimento,
+    ROUND(COALESCE(c.stock, 0) / NULLIF(m.total, 0), 2) AS kg_por_mascota,
+    c.criticos AS items_criticos
+FROM sucursal
+CROSS JOIN LATERAL (
+    SELECT COUNT(*) AS total FROM mascota WHERE mascota.nombre_campus = sucursal.nombre_campus
+) m
+CROSS JOIN LATERAL (
+    SELECT SUM(inventario.cantidad) AS stock,
+           COUNT(*) FILTER (WHERE inventario.cantidad < 10 * m.total) AS criticos
+    FROM inventario
+    WHERE inventario.nombre_campus = sucursal.nombre_campus AND inventario.tipo = 'Comida'
+) c
+ORDER BY stock_total_alimento DESC;
+"""),
+}
 
 class App(tk.Tk):
     def __init__(self):
@@ -54,11 +1357,43 @@ class App(tk.Tk):
         self.minsize(1024, 640)
 
         self.client = PGClient()
+        self.executor = QueryExecutor()
+        # Un hilo por canal para _run_aux_async: las consultas auxiliares
+        # comparten aux_conn y corren de a una, en orden.
+        self._aux_workers: dict[str, ThreadPoolExecutor] = {}
 
         self.current_columns: list[str] = []
-        self.current_rows: list[tuple] = []
+        # Filas del resultado: ColumnStore para consultas, lista para el resto.
+        self.current_rows: ColumnStore | list[tuple] = []
         self.page_size_var = tk.IntVar(value=100)
         self.page_var = tk.IntVar(value=1)
+        # Paginación en el servidor: solo se trae la página visible.
+        # paged_sql es la consulta actual (None = resultado completo en memoria),
+        # total_rows es None mientras el count(*) no termina.
+        self.server_paging_var = tk.BooleanVar(value=True)
+        self.paged_sql: str | None = None
+        self.total_rows: int | None = None
+        self.has_more = False
+        self._count_id = 0
+        self.timeout_var = tk.StringVar(value="60")
+        self._cancel_requested = False
+        # SQL del resultado actual (None si no viene de una consulta, p. ej. esquema).
+        self.current_sql: str | None = None
+        self._export_conn: psycopg.Connection | None = None
+        self._export_cancelled = False
+        # Últimas consultas ejecutadas (la más reciente primero); reabrirlas
+        # suele salir de la caché de PGClient.
+        self.history: deque[str] = deque(maxlen=50)
+        # Orden y filtro locales sobre lo cargado (ver ResultIndex). view_rows
+        # es lo que se pagina y muestra: current_rows o un IndexedRows.
+        self.view_rows: ColumnStore | IndexedRows | list[tuple] = []
+        self.sort_state: tuple[str, bool] | None = None
+        self.filter_var = tk.StringVar()
+        self._result_index: ResultIndex | None = None
+        self._view_id = 0
+        self._filter_after = None
+        # Clave del esquema en disco: "host:puerto/base".
+        self._schema_key: str | None = None
 
         self.style = ttk.Style()
         self.style.configure("TButton", padding=6)
@@ -120,68 +1455,11 @@ class App(tk.Tk):
         self.btn_list_tables.pack(fill=tk.X, pady=3)
 
         # NUEVAS ACCIONES RÁPIDAS
-        self.btn_q_mascotas_vacunadas = ttk.Button(actions, text="Mascotas vacunadas en Isabel Bongard", 
-                                                 command=lambda: self.run_sql_async("""
-SELECT mascota.chip_id, mascota.nombre_mascota, mascota.raza, sucursal.nombre_campus, vacuna.nombre_vacuna, vacuna.fecha_aplicacion
-FROM sucursal
-JOIN mascota ON sucursal.nombre_campus = mascota.nombre_campus 
-JOIN vacuna ON mascota.chip_id = vacuna.chip_id 
-WHERE sucursal.nombre_campus = 'Isabel Bongard'
-ORDER BY vacuna.fecha_aplicacion DESC;
-"""))
-        self.btn_q_mascotas_vacunadas.pack(fill=tk.X, pady=3)
-
-        self.btn_q_medicamentos_campus = ttk.Button(actions, text="Medicamentos por campus", 
-                                                  command=lambda: self.run_sql_async("""
-SELECT sucursal.nombre_campus, inventario.nombre AS medicamento, inventario.cantidad, medicamento.gramaje
-FROM inventario
-JOIN sucursal ON inventario.nombre_campus = sucursal.nombre_campus
-JOIN medicamento ON inventario.id_item = medicamento.id_item
-ORDER BY sucursal.nombre_campus, inventario.nombre;
-"""))
-        self.btn_q_medicamentos_campus.pack(fill=tk.X, pady=3)
-
-        self.btn_q_comida_mascotas = ttk.Button(actions, text="Comida y mascotas por campus", 
-                                              command=lambda: self.run_sql_async("""
-SELECT 
-    sucursal.nombre_campus,
-    COUNT(mascota.chip_id) AS total_mascotas,
-    COALESCE((
-        SELECT SUM(cantidad) 
-        FROM inventario 
-        WHERE inventario.nombre_campus = sucursal.nombre_campus 
-        AND inventario.tipo = 'Comida'
-    ), 0) AS stock_total_alimento
-FROM sucursal
-LEFT JOIN mascota ON mascota.nombre_campus = sucursal.nombre_campus
-GROUP BY sucursal.nombre_campus
-ORDER BY stock_total_alimento DESC;
-"""))
-        self.btn_q_comida_mascotas.pack(fill=tk.X, pady=3)
-
-        self.btn_q_stock_critico = ttk.Button(actions, text="Alimentos con stock crítico relativo", 
-                                            command=lambda: self.run_sql_async("""
-SELECT sucursal.nombre_campus, inventario.nombre AS Comida, inventario.cantidad,
- COUNT(mascota.chip_id) AS cantidad_mascotas,  inventario.cantidad / COUNT(mascota.chip_id) AS kg_por_mascota
-FROM inventario
-JOIN sucursal ON inventario.nombre_campus = sucursal.nombre_campus
-LEFT JOIN mascota ON mascota.nombre_campus = sucursal.nombre_campus
-WHERE inventario.tipo = 'Comida'
-GROUP BY sucursal.nombre_campus, inventario.nombre, inventario.cantidad
-HAVING (inventario.cantidad / COUNT(mascota.chip_id)) < 10
-ORDER BY kg_por_mascota ASC;
-"""))
-        self.btn_q_stock_critico.pack(fill=tk.X, pady=3)
-
-        self.btn_q_mascotas_derivadas = ttk.Button(actions, text="Mascotas derivadas", 
-                                                 command=lambda: self.run_sql_async("""
-SELECT derivacion.id_derivacion, derivacion.fecha, derivacion.motivo, derivacion.ubicacion_vet, mascota.chip_id, mascota.nombre_mascota, sucursal.nombre_campus
-FROM derivacion
-JOIN mascota ON derivacion.chip_id = mascota.chip_id
-JOIN sucursal ON mascota.nombre_campus = sucursal.nombre_campus
-ORDER BY derivacion.fecha DESC;
-"""))
-        self.btn_q_mascotas_derivadas.pack(fill=tk.X, pady=3)
+        for attr, (text, sql) in QUICK_ACTIONS.items():
+            btn = ttk.Button(actions, text=text,
+                             command=lambda attr=attr, sql=sql: self.run_sql_async(self._quick_action_sql(attr, sql)))
+            btn.pack(fill=tk.X, pady=3)
+            setattr(self, attr, btn)
 
         pick = ttk.LabelFrame(left, text="Ver datos de una tabla", padding=8)
         pick.pack(fill=tk.X)
@@ -194,6 +1472,17 @@ ORDER BY derivacion.fecha DESC;
         btns_tbl.pack(fill=tk.X)
         ttk.Button(btns_tbl, text="Cargar tabla", command=self.on_load_selected_table).pack(side=tk.LEFT, expand=True, fill=tk.X)
         ttk.Button(btns_tbl, text="Ver esquema", command=self.on_view_schema).pack(side=tk.LEFT, expand=True, fill=tk.X, padx=(6,0))
+        self.btn_import = ttk.Button(pick, text="Importar CSV…", command=self.on_import_csv)
+        self.btn_import.pack(fill=tk.X, pady=(6, 0))
+
+        hist = ttk.LabelFrame(left, text="Historial", padding=8)
+        hist.pack(fill=tk.BOTH, expand=True, pady=(8, 0))
+        self.lst_history = tk.Listbox(hist, height=8, activestyle="none", exportselection=False)
+        self.lst_history.pack(fill=tk.BOTH, expand=True)
+        self.lst_history.bind("<Double-Button-1>", lambda e: self.on_open_history())
+        self.lst_history.bind("<Return>", lambda e: self.on_open_history())
+        self.btn_history = ttk.Button(hist, text="Abrir", command=self.on_open_history)
+        self.btn_history.pack(fill=tk.X, pady=(6, 0))
 
         sql_box = ttk.LabelFrame(right, text="SQL", padding=8)
         sql_box.pack(fill=tk.X)
@@ -208,17 +1497,29 @@ ORDER BY derivacion.fecha DESC;
         self.btn_exec.pack(side=tk.LEFT)
         self.btn_clear = ttk.Button(btns, text="Limpiar", command=lambda: self.txt_sql.delete("1.0", tk.END))
         self.btn_clear.pack(side=tk.LEFT, padx=(6, 0))
+        self.btn_cancel = ttk.Button(btns, text="Cancelar", command=self.on_cancel)
+        self.btn_cancel.pack(side=tk.LEFT, padx=(6, 0))
+        self.btn_refresh = ttk.Button(btns, text="Refrescar", command=self.on_refresh)
+        self.btn_refresh.pack(side=tk.LEFT, padx=(6, 0))
+        ttk.Label(btns, text="Timeout (s):").pack(side=tk.LEFT, padx=(12, 0))
+        self.ent_timeout = ttk.Entry(btns, textvariable=self.timeout_var, width=6)
+        self.ent_timeout.pack(side=tk.LEFT, padx=(4, 0))
 
         table_box = ttk.LabelFrame(right, text="Resultados", padding=8)
         table_box.pack(fill=tk.BOTH, expand=True, pady=(8, 0))
 
-        self.tree = ttk.Treeview(table_box, columns=(), show="headings")
-        vsb = ttk.Scrollbar(table_box, orient="vertical", command=self.tree.yview)
-        hsb = ttk.Scrollbar(table_box, orient="horizontal", command=self.tree.xview)
-        self.tree.configure(yscroll=vsb.set, xscroll=hsb.set)
-        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        vsb.pack(side=tk.LEFT, fill=tk.Y)
-        hsb.pack(side=tk.BOTTOM, fill=tk.X)
+        filter_bar = ttk.Frame(table_box)
+        filter_bar.pack(fill=tk.X, pady=(0, 6))
+        ttk.Label(filter_bar, text="Filtrar:").pack(side=tk.LEFT)
+        self.ent_filter = ttk.Entry(filter_bar, textvariable=self.filter_var)
+        self.ent_filter.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(4, 0))
+        ttk.Button(filter_bar, text="✕", width=3, command=lambda: self.filter_var.set("")).pack(side=tk.LEFT, padx=(4, 0))
+        self.filter_var.trace_add("write", lambda *args: self._on_filter_changed())
+
+        self.result_grid = VirtualTree(table_box)
+        self.result_grid.pack(fill=tk.BOTH, expand=True)
+        self.result_grid.on_heading = self.on_sort
+        self.tree = self.result_grid.tree
 
         pager = ttk.Frame(right)
         pager.pack(fill=tk.X, pady=(6,0))
@@ -233,6 +1534,8 @@ ORDER BY derivacion.fecha DESC;
         self.btn_prev.pack(side=tk.LEFT, padx=2)
         self.btn_next.pack(side=tk.LEFT, padx=2)
         self.btn_last.pack(side=tk.LEFT, padx=2)
+        self.chk_server_paging = ttk.Checkbutton(pager, text="Paginar en servidor", variable=self.server_paging_var)
+        self.chk_server_paging.pack(side=tk.LEFT, padx=(10, 0))
 
         self.lbl_page_info = ttk.Label(pager, text="Página 0 de 0", anchor="e")
         self.lbl_page_info.pack(side=tk.RIGHT)
@@ -243,6 +1546,10 @@ ORDER BY derivacion.fecha DESC;
         self.btn_export_all = ttk.Button(export, text="Exportar CSV (todo)", command=lambda: self.export_csv(current_only=False))
         self.btn_export_page.pack(side=tk.LEFT)
         self.btn_export_all.pack(side=tk.LEFT, padx=(6,0))
+        self.btn_export_cancel = ttk.Button(export, text="Cancelar exportación", command=self.on_cancel_export, state="disabled")
+        self.btn_export_cancel.pack(side=tk.LEFT, padx=(6,0))
+        self.lbl_export = ttk.Label(export, text="")
+        self.lbl_export.pack(side=tk.LEFT, padx=(10,0))
 
         self.status = ttk.Label(self, text="Desconectado", anchor="w", relief=tk.SUNKEN)
         self.status.pack(fill=tk.X, side=tk.BOTTOM)
@@ -253,9 +1560,32 @@ ORDER BY derivacion.fecha DESC;
         widgets = [self.btn_list_tables, self.btn_q_mascotas_vacunadas, self.btn_q_medicamentos_campus, 
                    self.btn_q_comida_mascotas, self.btn_q_stock_critico, self.btn_q_mascotas_derivadas, 
                    self.btn_exec, self.btn_clear, self.cmb_tables, self.btn_first, self.btn_prev, 
-                   self.btn_next, self.btn_last, self.ent_page_size, self.btn_export_page, self.btn_export_all]
+                   self.btn_next, self.btn_last, self.ent_page_size, self.btn_export_page, self.btn_export_all,
+                   self.chk_server_paging, self.ent_timeout, self.btn_import, self.btn_refresh,
+                   self.btn_history, self.ent_filter]
         for w in widgets:
             w.configure(state=("normal" if connected else "disabled"))
+        self.btn_cancel.configure(state="disabled")
+
+    def _set_running(self, running: bool):
+        self.btn_exec.configure(state=("disabled" if running else "normal"))
+        self.btn_cancel.configure(state=("normal" if running else "disabled"))
+        if running:
+            self._cancel_requested = False
+            self._apply_timeout()
+
+    def _apply_timeout(self):
+        try:
+            seconds = float(self.timeout_var.get().strip() or "0")
+        except ValueError:
+            seconds = 0
+            self.timeout_var.set("0")
+        self.client.set_statement_timeout(seconds)
+
+    def on_cancel(self):
+        self._cancel_requested = True
+        self.status.configure(text="Cancelando…")
+        threading.Thread(target=self.client.cancel, daemon=True).start()
 
     def on_connect(self):
         host = self.host_var.get().strip()
@@ -271,7 +1601,12 @@ ORDER BY derivacion.fecha DESC;
             self.client.connect(host, db, user, pw, port)
             self.status.configure(text=f"Conectado a {db}@{host}:{port} como {user}")
             self._toggle_controls(True)
-            self.on_list_tables()
+            self._schema_key = f"{host}:{port}/{db}"
+            cached = load_schema_cache(self._schema_key)
+            if cached is not None:
+                self.client.schema = cached
+                self._show_tables()
+            self._refresh_schema_async(show=cached is None)
         except Exception as e:
             messagebox.showerror("Conexión fallida", str(e))
             self.status.configure(text="Desconectado")
@@ -286,17 +1621,39 @@ ORDER BY derivacion.fecha DESC;
             self._reset_pager()
 
     def on_list_tables(self):
-        sql = """
-        SELECT table_name
-        FROM information_schema.tables
-        WHERE table_schema = 'public'
-        ORDER BY table_name
-        """
-        self.run_sql_async(sql, post=lambda cols, rows: self._fill_tables_combo([r[0] for r in rows]))
+        """Muestra las tablas del esquema en memoria y lo actualiza en segundo plano."""
+        if self.client.schema is not None:
+            self._show_tables()
+        self._refresh_schema_async(show=self.client.schema is None)
+
+    def _show_tables(self):
+        cols, rows = self.client.list_tables()
+        self._display_result(cols, rows, "Tablas", lambda c, r: self._fill_tables_combo([x[0] for x in r]))
+
+    def _refresh_schema_async(self, show: bool):
+        """Relee el esquema de pg_catalog en un hilo y lo guarda en disco."""
+        key = self._schema_key
+        if show:
+            self.status.configure(text="Leyendo esquema…")
+
+        def load():
+            schema = self.client.refresh_schema()
+            if key:
+                save_schema_cache(key, schema)
+            return schema
+
+        def done(schema):
+            self._fill_tables_combo(sorted(schema))
+            if show:
+                self._show_tables()
+        self._run_aux_async(load, done, channel="schema")
 
     def _fill_tables_combo(self, names: list[str]):
+        selected = self.tables_var.get()
         self.cmb_tables["values"] = names
-        if names:
+        if selected in names:
+            self.cmb_tables.current(names.index(selected))
+        elif names:
             self.cmb_tables.current(0)
 
     def on_load_selected_table(self):
@@ -306,23 +1663,48 @@ ORDER BY derivacion.fecha DESC;
             return
         self.run_sql_async(f"SELECT * FROM {psql_ident(name)} ORDER BY 1")
 
+    def on_import_csv(self):
+        name = self.tables_var.get().strip()
+        if not name:
+            messagebox.showinfo("Importar", "Selecciona una tabla primero.")
+            return
+        path = filedialog.askopenfilename(filetypes=[("CSV", "*.csv"), ("Todos", "*.*")], title="Importar CSV")
+        if not path:
+            return
+        try:
+            header = read_csv_header(path)
+        except Exception as e:
+            messagebox.showerror("Importar", str(e))
+            return
+        if not header:
+            messagebox.showinfo("Importar", "El archivo está vacío.")
+            return
+        self.status.configure(text="Obteniendo columnas…")
+
+        def worker():
+            try:
+                _, rows = self.client.table_schema(name)
+                self.after(0, lambda: (self.status.configure(text="Listo"), ImportDialog(self, name, path, header, rows)))
+            except Exception as e:
+                self.after(0, lambda e=e: self._on_query_error(e))
+        threading.Thread(target=worker, daemon=True).start()
+
     def on_view_schema(self):
         name = self.tables_var.get().strip()
         if not name:
             messagebox.showinfo("Esquema", "Selecciona una tabla primero.")
             return
-        def after(cols, rows):
-            self._set_current(cols, rows)
-            self._render_page()
-        self.status.configure(text="Obteniendo esquema…")
-        threading.Thread(target=self._schema_worker, args=(name, after), daemon=True).start()
+        schema = self.client.schema
+        if schema is not None and name in schema:
+            cols, rows = self.client.table_schema(name)
+            self._display_result(cols, rows, f"Esquema de {name}", None)
+            return
 
-    def _schema_worker(self, table_name, post):
-        try:
-            cols, rows = self.client.table_schema(table_name)
-            self.after(0, lambda: self._display_result(cols, rows, f"Esquema de {table_name}", post))
-        except Exception as e:
-            self.after(0, lambda: self._on_query_error(e))
+        def done(result):
+            cols, rows = result
+            self._display_result(cols, rows, f"Esquema de {name}", None)
+        self.status.configure(text="Obteniendo esquema…")
+        self._run_aux_async(lambda: self.client.table_schema(name), done)
 
     def on_execute_sql(self):
         sql = self.txt_sql.get("1.0", tk.END).strip()
@@ -331,100 +1713,345 @@ ORDER BY derivacion.fecha DESC;
             return
         self.run_sql_async(sql)
 
+    def on_refresh(self):
+        """Vuelve a ejecutar la consulta actual sin pasar por la caché."""
+        sql = self.paged_sql or self.current_sql or (self.history[0] if self.history else None)
+        if not sql:
+            return
+        self.client.cache.discard_sql(sql)
+        self.run_sql_async(sql)
+
+    def on_open_history(self):
+        sel = self.lst_history.curselection()
+        if sel and self.client.is_connected():
+            self.run_sql_async(self.history[sel[0]])
+
+    def _add_history(self, sql: str):
+        if sql in self.history:
+            self.history.remove(sql)
+        self.history.appendleft(sql)
+        self.lst_history.delete(0, tk.END)
+        for item in self.history:
+            self.lst_history.insert(tk.END, " ".join(item.split())[:80])
+
+    def _cache_note(self) -> str:
+        return " (caché)" if self.client.last_from_cache else ""
+
+    def _quick_action_sql(self, attr: str, sql: str) -> str:
+        """SQL del botón, o su alternativa de QUICK_ACTION_FALLBACKS si la base
+        no tiene la tabla de la migración (o aún no se leyó el esquema).
+        """
+        fallback = QUICK_ACTION_FALLBACKS.get(attr)
+        schema = self.client.schema
+        if fallback and (schema is None or fallback[0] not in schema):
+            return fallback[1]
+        return sql
+
     def run_sql_async(self, sql: str, post=None):
+        if post is None:
+            self._add_history(sql)
+        if post is None and self.server_paging_var.get() and is_pageable(sql):
+            self.run_paged_async(sql)
+            return
+        self.current_sql = None
+        self._cancel_count()
+        self.paged_sql = None
         self.status.configure(text="Ejecutando…")
-        self.btn_exec.configure(state="disabled")
+        self._set_running(True)
+
+        def done(result):
+            cols, rows = result
+            self._display_result(cols, rows, sql, post)
+            self.current_sql = sql
+            if self._cache_note():
+                self.status.configure(text=f"{len(rows)} filas · OK{self._cache_note()}")
+        self._submit(lambda: self.client.run_query(sql), done)
+
+    def _submit(self, fn, on_done, channel: str = "main"):
+        """Encola fn en el ejecutor; on_done/on_error corren en el hilo de Tk
+        y solo si el trabajo sigue siendo el último de su canal.
+        """
+        def done(seq, result):
+            self.after(0, lambda: self._if_current(seq, channel, on_done, result))
+
+        def error(seq, e):
+            self.after(0, lambda: self._if_current(seq, channel, on_error, e))
+
+        def on_error(e):
+            self._on_query_error(e, channel)
+        try:
+            return self.executor.submit(fn, done, error, channel)
+        except RuntimeError as e:
+            self._on_query_error(e, channel)
+
+    def _run_aux_async(self, fn, on_done, channel: str = "main"):
+        """Corre fn en el hilo auxiliar del canal (conexión auxiliar),
+        etiquetado en el canal. Los trabajos de un mismo canal van en orden.
+        """
+        seq = self.executor.next_tag(channel)
+        pool = self._aux_workers.get(channel)
+        if pool is None:
+            pool = self._aux_workers[channel] = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=f"aux-{channel}")
+
+        def on_error(e):
+            self._on_query_error(e, channel)
 
         def worker():
+            if not self.executor.is_current(seq, channel):
+                return
             try:
-                cols, rows = self.client.run_query(sql)
-                self.after(0, lambda: self._display_result(cols, rows, sql, post))
+                result = fn()
+                self.after(0, lambda: self._if_current(seq, channel, on_done, result))
             except Exception as e:
-                self.after(0, lambda: self._on_query_error(e))
+                self.after(0, lambda e=e: self._if_current(seq, channel, on_error, e))
+        pool.submit(worker)
+
+    def _if_current(self, seq, channel, callback, arg):
+        if self.executor.is_current(seq, channel):
+            callback(arg)
+
+    def run_paged_async(self, sql: str):
+        """Ejecuta la consulta en modo paginado: página 1 ahora y el total
+        con un count(*) aparte, que se cancela si llega otra consulta.
+        """
+        self._cancel_count()
+        self.paged_sql = sql
+        self.current_sql = sql
+        self.total_rows = None
+        self.page_var.set(1)
+        self._fetch_page_async()
+        self._count_id += 1
+        count_id = self._count_id
+
+        def worker():
+            try:
+                total = self.client.count_rows(sql)
+            except Exception:
+                total = None
+            self.after(0, lambda: self._on_count(count_id, total))
         threading.Thread(target=worker, daemon=True).start()
 
+    def _cancel_count(self):
+        if self.total_rows is None and self.paged_sql is not None:
+            self.client.cancel_count()
+        self._count_id += 1
+
+    def _on_count(self, count_id: int, total: int | None):
+        if count_id != self._count_id:
+            return
+        self.total_rows = total
+        self._update_page_label()
+
+    def _fetch_page_async(self):
+        sql = self.paged_sql
+        page = max(1, int(self.page_var.get()))
+        size = self._page_size()
+        self.status.configure(text=f"Cargando página {page}…")
+        self._set_running(True)
+
+        def done(result):
+            cols, rows, more = result
+            self._display_page(sql, page, cols, rows, more)
+        self._submit(lambda: self.client.run_query_page(sql, page, size), done)
+
+    def _display_page(self, sql, page, columns, rows, more):
+        if sql != self.paged_sql:
+            return
+        self.current_columns = list(columns or [])
+        self.current_rows = list(rows or [])
+        self.has_more = more
+        self.page_var.set(page)
+        self.status.configure(text=f"Página {page} · {len(rows)} filas · OK{self._cache_note()}")
+        self._set_running(False)
+        self._apply_view()
+
     def _display_result(self, columns, rows, sql, post):
         self._set_current(columns, rows)
-        self._render_page()
         self.status.configure(text=f"{len(rows)} filas · OK")
-        self.btn_exec.configure(state="normal")
+        self._set_running(False)
+        self._apply_view()
         if post:
             try:
                 post(columns, rows)
             except Exception:
                 pass
 
-    def _on_query_error(self, e: Exception):
-        self.btn_exec.configure(state="normal")
+    def _on_query_error(self, e: Exception, channel: str = "main"):
+        # Solo el canal principal maneja los botones Ejecutar/Cancelar; un
+        # error leyendo el esquema no debe liberar una consulta en curso.
+        if channel == "main":
+            self._set_running(False)
+        if isinstance(e, psycopg.errors.QueryCanceled) and self._cancel_requested:
+            self.status.configure(text="Consulta cancelada")
+            return
         messagebox.showerror("Error de consulta", str(e))
         self.status.configure(text="Error")
 
     def _set_current(self, columns, rows):
+        self._cancel_count()
+        self.paged_sql = None
+        self.current_sql = None
+        if list(columns or []) != self.current_columns:
+            self.sort_state = None
         self.current_columns = list(columns or [])
-        self.current_rows = list(rows or [])
+        self.current_rows = rows if isinstance(rows, ColumnStore) else list(rows or [])
         self.page_var.set(1)
 
     def _reset_pager(self):
+        self._cancel_count()
+        self.paged_sql = None
         self.current_columns = []
         self.current_rows = []
+        self.view_rows = []
+        self._result_index = None
         self.page_var.set(1)
         self._update_page_label()
 
+    def _on_filter_changed(self):
+        # Se filtra cuando se deja de escribir.
+        if self._filter_after is not None:
+            self.after_cancel(self._filter_after)
+        self._filter_after = self.after(250, self._apply_view)
+
+    def on_sort(self, column: str):
+        """Clic en un encabezado: ascendente, descendente y sin orden."""
+        if self.sort_state is None or self.sort_state[0] != column:
+            self.sort_state = (column, False)
+        elif not self.sort_state[1]:
+            self.sort_state = (column, True)
+        else:
+            self.sort_state = None
+        self._apply_view()
+
+    def _apply_view(self):
+        """Aplica el orden y el filtro locales a lo cargado, sin consultar al
+        servidor. Los índices se arman (una vez por resultado) en un hilo aparte.
+        """
+        self._filter_after = None
+        rows = self.current_rows
+        text = self.filter_var.get().strip()
+        if self.sort_state and self.sort_state[0] not in self.current_columns:
+            self.sort_state = None
+        sort = self.sort_state
+        self.result_grid.sort = sort
+        self._view_id += 1
+        view_id = self._view_id
+        if not rows or (not text and sort is None):
+            self._show_view(view_id, rows, None)
+            return
+        if self._result_index is None or self._result_index.rows is not rows:
+            self._result_index = ResultIndex(rows)
+            self.view_rows = rows
+        index = self._result_index
+        j = self.current_columns.index(sort[0]) if sort else None
+        desc = bool(sort and sort[1])
+        self.status.configure(text="Ordenando / filtrando…")
+
+        def worker():
+            started = time.perf_counter()
+            try:
+                order = index.view(j, desc, text)
+            except Exception as e:
+                self.after(0, lambda e=e: self._on_query_error(e))
+                return
+            view = rows if order is None else IndexedRows(rows, order)
+            elapsed = time.perf_counter() - started
+            self.after(0, lambda: self._show_view(view_id, view, elapsed))
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _show_view(self, view_id: int, view, seconds: float | None):
+        if view_id != self._view_id:
+            return
+        self.view_rows = view
+        if self.paged_sql is None:
+            self.page_var.set(1)
+        self._populate_tree(self.current_columns, self._page_slice())
+        self._update_page_label()
+        if seconds is not None:
+            where = " de la página" if self.paged_sql is not None else ""
+            self.status.configure(text=f"{len(view)} de {len(self.current_rows)} filas{where} · {seconds * 1000:.0f} ms")
+
     def _render_page(self):
+        if self.paged_sql is not None:
+            self._fetch_page_async()
+            return
         self._populate_tree(self.current_columns, self._page_slice())
         self._update_page_label()
 
-    def _page_slice(self):
-        if not self.current_rows:
-            return []
+    def _page_size(self) -> int:
         try:
-            size = max(1, int(self.page_size_var.get()))
+            return max(1, int(self.page_size_var.get()))
         except Exception:
-            size = 100
-            self.page_size_var.set(size)
-        total = len(self.current_rows)
+            self.page_size_var.set(100)
+            return 100
+
+    def _page_slice(self):
+        rows = self.view_rows
+        if self.paged_sql is not None:
+            return rows
+        if not rows:
+            return []
+        size = self._page_size()
+        total = len(rows)
         pages = max(1, (total + size - 1) // size)
         page = min(max(1, int(self.page_var.get())), pages)
         start = (page - 1) * size
         end = min(start + size, total)
-        return self.current_rows[start:end]
+        if isinstance(rows, (ColumnStore, IndexedRows)):
+            return rows.view(start, end)
+        return rows[start:end]
+
+    def _total_pages(self) -> int | None:
+        """Cantidad de páginas, o None si el total aún se está contando."""
+        total = len(self.view_rows) if self.paged_sql is None else self.total_rows
+        if total is None:
+            return None
+        size = self._page_size()
+        return max(1, (total + size - 1) // size)
 
     def _update_page_label(self):
-        total = len(self.current_rows)
-        try:
-            size = max(1, int(self.page_size_var.get()))
-        except Exception:
-            size = 100
-        pages = max(1, (total + size - 1) // size)
-        page = min(max(1, int(self.page_var.get())), pages)
+        pages = self._total_pages()
+        page = max(1, int(self.page_var.get()))
+        if pages is None:
+            self.lbl_page_info.configure(text=f"Página {page} de ? · contando filas…")
+            return
+        page = min(page, pages)
+        if self.paged_sql is None and self.view_rows is not self.current_rows:
+            total = f"{len(self.view_rows)} de {len(self.current_rows)}"
+        else:
+            total = len(self.current_rows) if self.paged_sql is None else self.total_rows
         self.lbl_page_info.configure(text=f"Página {page} de {pages} · {total} filas")
 
+    def _has_data(self) -> bool:
+        return self.paged_sql is not None or bool(self.current_rows)
+
     def on_first_page(self):
-        if self.current_rows:
+        if self._has_data():
             self.page_var.set(1)
             self._render_page()
 
     def on_prev_page(self):
-        if self.current_rows and self.page_var.get() > 1:
+        if self._has_data() and self.page_var.get() > 1:
             self.page_var.set(self.page_var.get() - 1)
             self._render_page()
 
     def on_next_page(self):
-        if not self.current_rows:
+        if not self._has_data():
             return
-        total = len(self.current_rows)
-        size = max(1, int(self.page_size_var.get()))
-        pages = max(1, (total + size - 1) // size)
-        if self.page_var.get() < pages:
+        pages = self._total_pages()
+        more = self.has_more if pages is None else self.page_var.get() < pages
+        if more:
             self.page_var.set(self.page_var.get() + 1)
             self._render_page()
 
     def on_last_page(self):
-        if not self.current_rows:
+        if not self._has_data():
+            return
+        pages = self._total_pages()
+        if pages is None:
+            self.status.configure(text="Aún se está contando el total de filas…")
             return
-        total = len(self.current_rows)
-        size = max(1, int(self.page_size_var.get()))
-        pages = max(1, (total + size - 1) // size)
         self.page_var.set(pages)
         self._render_page()
 
@@ -432,7 +2059,7 @@ ORDER BY derivacion.fecha DESC;
         if not self.current_columns:
             messagebox.showinfo("Exportar", "No hay datos para exportar.")
             return
-        rows = self._page_slice() if current_only else self.current_rows
+        rows = self._page_slice() if current_only else self.view_rows
         if not rows:
             messagebox.showinfo("Exportar", "No hay filas en esta selección.")
             return
@@ -443,33 +2070,116 @@ ORDER BY derivacion.fecha DESC;
         )
         if not path:
             return
+        # Con orden o filtro locales se exporta lo que se ve.
+        local_view = self.paged_sql is None and self.view_rows is not self.current_rows
+        if not current_only and not local_view and self.current_sql and is_pageable(self.current_sql):
+            self._export_from_server(self.current_sql, path)
+            return
         try:
-            with open(path, "w", newline="", encoding="utf-8") as f:
-                writer = csv.writer(f)
-                writer.writerow(self.current_columns)
-                for r in rows:
-                    writer.writerow(list(r))
+            self._write_csv(path, self.current_columns, rows)
             messagebox.showinfo("Exportar", f"Exportado correctamente://{path}")
         except Exception as e:
             messagebox.showerror("Exportar", str(e))
 
+    def _write_csv(self, path, columns, rows):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for r in rows:
+                writer.writerow(list(r))
+
+    def _export_from_server(self, sql, path):
+        """Exporta todo el resultado directo desde el servidor (COPY) en un hilo
+        aparte, mostrando el avance y permitiendo cancelar.
+        """
+        if self._export_conn is not None:
+            messagebox.showinfo("Exportar", "Ya hay una exportación en curso.")
+            return
+        self._export_cancelled = False
+        self.btn_export_all.configure(state="disabled")
+        self.btn_export_cancel.configure(state="normal")
+        self.lbl_export.configure(text="Exportando…")
+        started = time.monotonic()
+
+        def on_conn(conn):
+            self._export_conn = conn
+
+        def progress(rows, nbytes):
+            self.after(0, lambda: self._on_export_progress(rows, nbytes, started))
+
+        def worker():
+            try:
+                rows, nbytes = self.client.copy_to_csv(sql, path, progress, on_conn)
+                self.after(0, lambda: self._on_export_finished(path, rows, nbytes, started, None))
+            except Exception as e:
+                self.after(0, lambda e=e: self._on_export_finished(path, 0, 0, started, e))
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _on_export_progress(self, rows, nbytes, started):
+        if self._export_conn is None:
+            return
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.lbl_export.configure(
+            text=f"Exportando… {rows:,} filas · {nbytes / 1e6:.1f} MB · {rows / elapsed:,.0f} filas/s"
+        )
+
+    def on_cancel_export(self):
+        conn = self._export_conn
+        if conn is not None:
+            self._export_cancelled = True
+            self.lbl_export.configure(text="Cancelando exportación…")
+            threading.Thread(target=conn.cancel_safe, daemon=True).start()
+
+    def _on_export_finished(self, path, rows, nbytes, started, error):
+        self._export_conn = None
+        self.btn_export_all.configure(state=("normal" if self.client.is_connected() else "disabled"))
+        self.btn_export_cancel.configure(state="disabled")
+        if error is not None:
+            if self._export_cancelled:
+                self.lbl_export.configure(text="Exportación cancelada")
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            else:
+                self.lbl_export.configure(text="Error al exportar")
+                messagebox.showerror("Exportar", str(error))
+            return
+        elapsed = time.monotonic() - started
+        self.lbl_export.configure(text=f"{rows:,} filas · {nbytes / 1e6:.1f} MB en {elapsed:.1f} s")
+        messagebox.showinfo("Exportar", f"Exportado correctamente://{path}")
+
     def _clear_tree(self):
-        for c in self.tree["columns"]:
-            self.tree.heading(c, text="")
-            self.tree.column(c, width=0)
-        self.tree.delete(*self.tree.get_children())
-        self.tree["columns"] = ()
+        self.result_grid.clear()
 
     def _populate_tree(self, columns, rows):
-        self._clear_tree()
-        if not columns:
-            return
-        self.tree["columns"] = columns
-        for c in columns:
-            self.tree.heading(c, text=c)
-            self.tree.column(c, width=max(80, len(c) * 10))
-        for r in rows:
-            self.tree.insert("", tk.END, values=list(r))
+        self.result_grid.set_data(columns, rows)
+
+def strip_sql(sql: str) -> str:
+    """Quita espacios y el ";" final para poder usar la consulta como subconsulta."""
+    return sql.strip().rstrip(";").strip()
+
+# Literales, identificadores entre comillas y comentarios: se quitan antes de
+# buscar palabras clave para no confundir 'delete' dentro de un texto.
+SQL_NOISE = re.compile(
+    r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/|\$(\w*)\$.*?\$\1\$",
+    re.DOTALL,
+)
+# WITH ... INSERT/UPDATE/DELETE y SELECT ... INTO modifican datos: no se
+# pueden envolver en una subconsulta ni guardar en la caché.
+WRITE_KEYWORDS = re.compile(r"\b(insert|update|delete|merge|into)\b", re.IGNORECASE)
+
+def is_pageable(sql: str) -> bool:
+    """True si la sentencia es una única consulta de solo lectura que devuelve
+    filas y se puede envolver en SELECT ... LIMIT/OFFSET.
+    """
+    body = strip_sql(sql)
+    if not body or ";" in body:
+        return False
+    first = body.split(None, 1)[0].lower()
+    if first not in ("select", "with", "values", "table"):
+        return False
+    return not WRITE_KEYWORDS.search(SQL_NOISE.sub(" ", body))
 
 def psql_ident(name: str) -> str:
     """Devuelve un identificador SQL escapado con comillas dobles si es necesario.
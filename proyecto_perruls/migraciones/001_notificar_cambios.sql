@@ -0,0 +1,59 @@
+-- Avisos de cambios para invalidar la caché de la API (LISTEN perruls_cambios).
+-- Cada fila insertada, modificada o eliminada envía un NOTIFY con
+-- {"tabla", "chip_id", "nombre_campus"}; en un UPDATE se avisa la fila
+-- anterior y la nueva (Postgres descarta los avisos repetidos en la misma
+-- transacción).
+--
+-- Aplicar con: psql -h <host> -U perruls -d perruls -f migraciones/001_notificar_cambios.sql
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION perruls_notificar_cambio() RETURNS trigger AS $$
+DECLARE
+    fila jsonb;
+BEGIN
+    IF TG_OP <> 'DELETE' THEN
+        fila := to_jsonb(NEW);
+        PERFORM pg_notify('perruls_cambios', json_build_object(
+            'tabla', TG_TABLE_NAME,
+            'chip_id', fila->>'chip_id',
+            'nombre_campus', fila->>'nombre_campus'
+        )::text);
+    END IF;
+    IF TG_OP <> 'INSERT' THEN
+        fila := to_jsonb(OLD);
+        PERFORM pg_notify('perruls_cambios', json_build_object(
+            'tabla', TG_TABLE_NAME,
+            'chip_id', fila->>'chip_id',
+            'nombre_campus', fila->>'nombre_campus'
+        )::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS notificar_cambio ON mascota;
+CREATE TRIGGER notificar_cambio AFTER INSERT OR UPDATE OR DELETE ON mascota
+    FOR EACH ROW EXECUTE FUNCTION perruls_notificar_cambio();
+
+DROP TRIGGER IF EXISTS notificar_cambio ON vacuna;
+CREATE TRIGGER notificar_cambio AFTER INSERT OR UPDATE OR DELETE ON vacuna
+    FOR EACH ROW EXECUTE FUNCTION perruls_notificar_cambio();
+
+DROP TRIGGER IF EXISTS notificar_cambio ON tratamiento;
+CREATE TRIGGER notificar_cambio AFTER INSERT OR UPDATE OR DELETE ON tratamiento
+    FOR EACH ROW EXECUTE FUNCTION perruls_notificar_cambio();
+
+DROP TRIGGER IF EXISTS notificar_cambio ON derivacion;
+CREATE TRIGGER notificar_cambio AFTER INSERT OR UPDATE OR DELETE ON derivacion
+    FOR EACH ROW EXECUTE FUNCTION perruls_notificar_cambio();
+
+DROP TRIGGER IF EXISTS notificar_cambio ON inventario;
+CREATE TRIGGER notificar_cambio AFTER INSERT OR UPDATE OR DELETE ON inventario
+    FOR EACH ROW EXECUTE FUNCTION perruls_notificar_cambio();
+
+DROP TRIGGER IF EXISTS notificar_cambio ON medicamento;
+CREATE TRIGGER notificar_cambio AFTER INSERT OR UPDATE OR DELETE ON medicamento
+    FOR EACH ROW EXECUTE FUNCTION perruls_notificar_cambio();
+
+COMMIT;
@@ -0,0 +1,219 @@
+-- Resumen por campus para el dashboard (/reportes/campus).
+-- Mantiene una fila por sucursal con: cantidad de mascotas, stock de comida,
+-- kg por mascota e ítems de comida con stock crítico relativo
+-- (cantidad / mascotas < 10, igual que "Alimentos con stock crítico relativo").
+--
+-- Triggers por sentencia: mascota e inventario aplican deltas sacados de las
+-- tablas de transición (sin volver a contar mascotas); sucursal, que casi no
+-- cambia, recalcula sus campus completos. La lectura es O(campus).
+--
+-- Aplicar con: psql -h <host> -U perruls -d perruls -f migraciones/002_resumen_campus.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS resumen_campus (
+    nombre_campus   text PRIMARY KEY,
+    total_mascotas  integer NOT NULL DEFAULT 0,
+    stock_alimento  numeric NOT NULL DEFAULT 0,
+    kg_por_mascota  numeric,
+    items_criticos  integer NOT NULL DEFAULT 0,
+    actualizado     timestamptz NOT NULL DEFAULT now()
+);
+
+-- Recalcula los campus indicados (todos si campus es NULL).
+CREATE OR REPLACE FUNCTION perruls_refrescar_resumen_campus(campus text[]) RETURNS void AS $$
+BEGIN
+    -- Bloquear primero las filas del resumen: si otra transacción está
+    -- actualizando el mismo campus, esperamos a que confirme y el cálculo
+    -- siguiente ya ve sus cambios.
+    PERFORM 1 FROM resumen_campus r
+    WHERE campus IS NULL OR r.nombre_campus = ANY(campus)
+    ORDER BY r.nombre_campus
+    FOR UPDATE;
+
+    INSERT INTO resumen_campus AS r (
+        nombre_campus, total_mascotas, stock_alimento, kg_por_mascota, items_criticos, actualizado
+    )
+    SELECT
+        s.nombre_campus,
+        m.total,
+        COALESCE(c.stock, 0),
+        ROUND(COALESCE(c.stock, 0) / NULLIF(m.total, 0), 2),
+        c.criticos,
+        now()
+    FROM sucursal s
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*) AS total FROM mascota WHERE mascota.nombre_campus = s.nombre_campus
+    ) m
+    CROSS JOIN LATERAL (
+        SELECT
+            SUM(i.cantidad) AS stock,
+            COUNT(*) FILTER (WHERE i.cantidad < 10 * m.total) AS criticos
+        FROM inventario i
+        WHERE i.nombre_campus = s.nombre_campus AND i.tipo = 'Comida'
+    ) c
+    WHERE campus IS NULL OR s.nombre_campus = ANY(campus)
+    ON CONFLICT (nombre_campus) DO UPDATE SET
+        total_mascotas = EXCLUDED.total_mascotas,
+        stock_alimento = EXCLUDED.stock_alimento,
+        kg_por_mascota = EXCLUDED.kg_por_mascota,
+        items_criticos = EXCLUDED.items_criticos,
+        actualizado = EXCLUDED.actualizado;
+
+    DELETE FROM resumen_campus r
+    WHERE (campus IS NULL OR r.nombre_campus = ANY(campus))
+      AND NOT EXISTS (SELECT 1 FROM sucursal s WHERE s.nombre_campus = r.nombre_campus);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Filas de las tablas de transición con signo: +1 las nuevas, -1 las viejas.
+-- En un UPDATE cada fila aparece dos veces y lo que no cambió se cancela.
+CREATE OR REPLACE FUNCTION perruls_filas_transicion(op text, columnas text) RETURNS text AS $$
+    SELECT CASE op
+        WHEN 'INSERT' THEN format('SELECT 1 AS signo, %s FROM nuevas', columnas)
+        WHEN 'DELETE' THEN format('SELECT -1 AS signo, %s FROM viejas', columnas)
+        ELSE format('SELECT 1 AS signo, %1$s FROM nuevas UNION ALL SELECT -1, %1$s FROM viejas', columnas)
+    END;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- sucursal: recalcula los campus de las filas nuevas/viejas.
+CREATE OR REPLACE FUNCTION perruls_resumen_campus_trigger() RETURNS trigger AS $$
+DECLARE
+    campus text[];
+BEGIN
+    EXECUTE format('SELECT array_agg(DISTINCT nombre_campus) FROM (%s) f',
+                   perruls_filas_transicion(TG_OP, 'nombre_campus'))
+    INTO campus;
+    IF campus IS NOT NULL THEN
+        PERFORM perruls_refrescar_resumen_campus(campus);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- mascota: total_mascotas += altas - bajas por campus. Cambiar el total mueve
+-- el umbral de stock crítico (10 * total), así que solo se cuentan los ítems
+-- de comida cuya cantidad queda entre el umbral viejo y el nuevo. Un UPDATE
+-- que no cambia de campus no toca el resumen.
+CREATE OR REPLACE FUNCTION perruls_resumen_campus_mascota() RETURNS trigger AS $$
+DECLARE
+    campus text[];
+    deltas integer[];
+BEGIN
+    EXECUTE format($q$
+        SELECT array_agg(nombre_campus ORDER BY nombre_campus), array_agg(delta ORDER BY nombre_campus)
+        FROM (
+            SELECT nombre_campus, SUM(signo)::integer AS delta
+            FROM (%s) f
+            WHERE nombre_campus IS NOT NULL
+            GROUP BY nombre_campus
+            HAVING SUM(signo) <> 0
+        ) d
+    $q$, perruls_filas_transicion(TG_OP, 'nombre_campus'))
+    INTO campus, deltas;
+    IF campus IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    -- Bloquear primero las filas del resumen: si otra transacción está
+    -- actualizando el mismo campus, esperamos a que confirme y la sentencia
+    -- siguiente ya ve su total y su inventario.
+    PERFORM 1 FROM resumen_campus r
+    WHERE r.nombre_campus = ANY(campus)
+    ORDER BY r.nombre_campus
+    FOR UPDATE;
+
+    UPDATE resumen_campus r SET
+        total_mascotas = r.total_mascotas + d.delta,
+        kg_por_mascota = ROUND(r.stock_alimento / NULLIF(r.total_mascotas + d.delta, 0), 2),
+        items_criticos = r.items_criticos + sign(d.delta)::integer * (
+            SELECT COUNT(*)
+            FROM inventario i
+            WHERE i.nombre_campus = r.nombre_campus AND i.tipo = 'Comida'
+              AND i.cantidad >= 10 * LEAST(r.total_mascotas, r.total_mascotas + d.delta)
+              AND i.cantidad < 10 * GREATEST(r.total_mascotas, r.total_mascotas + d.delta)
+        ),
+        actualizado = now()
+    FROM unnest(campus, deltas) AS d(nombre_campus, delta)
+    WHERE r.nombre_campus = d.nombre_campus;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- inventario: suma al stock la diferencia de cantidad de la comida tocada y
+-- ajusta items_criticos con esas mismas filas contra el total del campus.
+CREATE OR REPLACE FUNCTION perruls_resumen_campus_inventario() RETURNS trigger AS $$
+DECLARE
+    filas text := perruls_filas_transicion(TG_OP, 'nombre_campus, tipo, cantidad');
+    campus text[];
+BEGIN
+    EXECUTE format($q$
+        SELECT array_agg(DISTINCT nombre_campus ORDER BY nombre_campus)
+        FROM (%s) f
+        WHERE tipo = 'Comida' AND nombre_campus IS NOT NULL
+    $q$, filas)
+    INTO campus;
+    IF campus IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    PERFORM 1 FROM resumen_campus r
+    WHERE r.nombre_campus = ANY(campus)
+    ORDER BY r.nombre_campus
+    FOR UPDATE;
+
+    EXECUTE format($q$
+        UPDATE resumen_campus r SET
+            stock_alimento = r.stock_alimento + d.stock,
+            kg_por_mascota = ROUND((r.stock_alimento + d.stock) / NULLIF(r.total_mascotas, 0), 2),
+            items_criticos = r.items_criticos + d.criticos,
+            actualizado = now()
+        FROM (
+            SELECT
+                f.nombre_campus,
+                COALESCE(SUM(f.signo * f.cantidad), 0) AS stock,
+                COALESCE(SUM(f.signo) FILTER (WHERE f.cantidad < 10 * t.total_mascotas), 0) AS criticos
+            FROM (%s) f
+            JOIN resumen_campus t ON t.nombre_campus = f.nombre_campus
+            WHERE f.tipo = 'Comida'
+            GROUP BY f.nombre_campus
+        ) d
+        WHERE r.nombre_campus = d.nombre_campus
+          AND (d.stock <> 0 OR d.criticos <> 0)
+    $q$, filas);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    tabla text;
+    funcion text;
+BEGIN
+    FOREACH tabla IN ARRAY ARRAY['sucursal', 'mascota', 'inventario'] LOOP
+        funcion := CASE tabla
+            WHEN 'sucursal' THEN 'perruls_resumen_campus_trigger'
+            ELSE 'perruls_resumen_campus_' || tabla
+        END;
+        EXECUTE format('DROP TRIGGER IF EXISTS resumen_campus_ins ON %I', tabla);
+        EXECUTE format('DROP TRIGGER IF EXISTS resumen_campus_upd ON %I', tabla);
+        EXECUTE format('DROP TRIGGER IF EXISTS resumen_campus_del ON %I', tabla);
+        EXECUTE format(
+            'CREATE TRIGGER resumen_campus_ins AFTER INSERT ON %I '
+            'REFERENCING NEW TABLE AS nuevas '
+            'FOR EACH STATEMENT EXECUTE FUNCTION %I()', tabla, funcion);
+        EXECUTE format(
+            'CREATE TRIGGER resumen_campus_upd AFTER UPDATE ON %I '
+            'REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas '
+            'FOR EACH STATEMENT EXECUTE FUNCTION %I()', tabla, funcion);
+        EXECUTE format(
+            'CREATE TRIGGER resumen_campus_del AFTER DELETE ON %I '
+            'REFERENCING OLD TABLE AS viejas '
+            'FOR EACH STATEMENT EXECUTE FUNCTION %I()', tabla, funcion);
+    END LOOP;
+END;
+$$;
+
+SELECT perruls_refrescar_resumen_campus(NULL);
+
+COMMIT;
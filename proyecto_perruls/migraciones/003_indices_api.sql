@@ -0,0 +1,59 @@
+-- Índices para los caminos de acceso de la API.
+-- Cada índice cubre el filtro y el orden de un endpoint; los INCLUDE llevan
+-- las columnas que devuelve para que Postgres pueda responder con un
+-- index-only scan. La verificación de planes al iniciar la API
+-- (verificar_planes en api_perruls.py) avisa si alguno falta.
+--
+-- CREATE INDEX bloquea escrituras (no lecturas) en la tabla mientras se
+-- construye. En una base grande y con tráfico se puede correr cada
+-- sentencia a mano con CREATE INDEX CONCURRENTLY, fuera de BEGIN/COMMIT.
+--
+-- Aplicar con: psql -h <host> -U perruls -d perruls -f migraciones/003_indices_api.sql
+
+BEGIN;
+
+-- /mascotas/{chip_id}/vacunas y la sección "vacunas" de /perfil y /mascotas/batch.
+CREATE INDEX IF NOT EXISTS vacuna_chip_fecha_idx
+    ON vacuna (chip_id, fecha_aplicacion DESC)
+    INCLUDE (id_vacuna, nombre_vacuna);
+
+-- /mascotas/{chip_id}/tratamientos y la sección "tratamientos".
+CREATE INDEX IF NOT EXISTS tratamiento_chip_fecha_idx
+    ON tratamiento (chip_id, fecha_inicio DESC)
+    INCLUDE (id_tratamiento, descripcion, fecha_fin);
+
+-- /tratamientos: orden del cursor (fecha_tratamiento_inic, id_tratamiento).
+CREATE INDEX IF NOT EXISTS tratamiento_inic_id_idx
+    ON tratamiento (fecha_tratamiento_inic, id_tratamiento);
+
+-- /mascotas/{chip_id}/derivaciones y la sección "derivaciones".
+CREATE INDEX IF NOT EXISTS derivacion_chip_fecha_idx
+    ON derivacion (chip_id, fecha_derivacion DESC)
+    INCLUDE (id_derivacion, veterinaria, motivo);
+
+-- /mascotas: orden del cursor (nombre_mascota, chip_id), sin filtro y por campus.
+-- El segundo también sirve al JOIN y al conteo de /reportes/mascotas-por-campus.
+CREATE INDEX IF NOT EXISTS mascota_nombre_chip_idx
+    ON mascota (nombre_mascota, chip_id);
+CREATE INDEX IF NOT EXISTS mascota_campus_nombre_idx
+    ON mascota (nombre_campus, nombre_mascota, chip_id);
+
+-- /inventario/comida (y ?critico=true) e /inventario/medicamentos: parciales
+-- por tipo, en el orden del cursor (nombre_campus, nombre, id_item).
+CREATE INDEX IF NOT EXISTS inventario_comida_idx
+    ON inventario (nombre_campus, nombre, id_item)
+    INCLUDE (cantidad, unidad_de_medida, fecha_venc)
+    WHERE tipo = 'Comida';
+CREATE INDEX IF NOT EXISTS inventario_comida_critica_idx
+    ON inventario (nombre_campus, nombre, id_item)
+    INCLUDE (cantidad, unidad_de_medida, fecha_venc)
+    WHERE tipo = 'Comida' AND cantidad < 10;
+CREATE INDEX IF NOT EXISTS inventario_medicamento_idx
+    ON inventario (nombre_campus, nombre, id_item)
+    INCLUDE (cantidad)
+    WHERE tipo = 'Medicamento';
+
+COMMIT;
+
+-- Estadísticas al día para que el planificador use los índices nuevos.
+ANALYZE mascota, vacuna, tratamiento, derivacion, inventario;
@@ -0,0 +1,38 @@
+-- Índice del orden de /tratamientos con la fecha que admite NULL.
+-- La API pagina por (fecha_tratamiento_inic IS NULL,
+-- COALESCE(fecha_tratamiento_inic, DATE 'epoch'), id_tratamiento): la
+-- comparación de filas con un NULL nunca es verdadera y los tratamientos
+-- sin fecha quedaban fuera. Reemplaza a tratamiento_inic_id_idx de 003; las
+-- expresiones deben ser idénticas a las de TRATAMIENTO_CLAVES en
+-- api_perruls.py para que el índice sirva al ORDER BY y al cursor.
+--
+-- Lo mismo para /inventario/comida (y ?critico=true), que ordena por
+-- (nombre_campus IS NULL, COALESCE(nombre_campus, ''), nombre, id_item)
+-- como COMIDA_CLAVES: reemplaza a inventario_comida_idx e
+-- inventario_comida_critica_idx. El filtro ?nombre_campus= se escribe sobre
+-- esas mismas dos expresiones para usar el índice también.
+--
+-- Aplicar con: psql -h <host> -U perruls -d perruls -f migraciones/004_claves_con_nulos.sql
+
+BEGIN;
+
+DROP INDEX IF EXISTS tratamiento_inic_id_idx;
+CREATE INDEX IF NOT EXISTS tratamiento_inic_nulos_id_idx
+    ON tratamiento ((fecha_tratamiento_inic IS NULL),
+                    COALESCE(fecha_tratamiento_inic, DATE 'epoch'),
+                    id_tratamiento);
+
+DROP INDEX IF EXISTS inventario_comida_idx;
+CREATE INDEX IF NOT EXISTS inventario_comida_nulos_idx
+    ON inventario ((nombre_campus IS NULL), COALESCE(nombre_campus, ''), nombre, id_item)
+    INCLUDE (cantidad, unidad_de_medida, fecha_venc)
+    WHERE tipo = 'Comida';
+DROP INDEX IF EXISTS inventario_comida_critica_idx;
+CREATE INDEX IF NOT EXISTS inventario_comida_critica_nulos_idx
+    ON inventario ((nombre_campus IS NULL), COALESCE(nombre_campus, ''), nombre, id_item)
+    INCLUDE (cantidad, unidad_de_medida, fecha_venc)
+    WHERE tipo = 'Comida' AND cantidad < 10;
+
+COMMIT;
+
+ANALYZE tratamiento, inventario;
@@ -0,0 +1,17 @@
+-- Avisos de cambios de sucursal, como los de 001 para las demás tablas.
+-- /sucursales y los reportes por campus se guardan en la caché con la
+-- etiqueta sucursal:*; sin este trigger una sucursal nueva o editada no se
+-- veía hasta que vencía el TTL (una hora), y /reportes/campus (que 002
+-- recalcula al cambiar sucursal) podía no coincidir con /sucursales.
+--
+-- Requiere 001 (perruls_notificar_cambio).
+--
+-- Aplicar con: psql -h <host> -U perruls -d perruls -f migraciones/005_notificar_sucursal.sql
+
+BEGIN;
+
+DROP TRIGGER IF EXISTS notificar_cambio ON sucursal;
+CREATE TRIGGER notificar_cambio AFTER INSERT OR UPDATE OR DELETE ON sucursal
+    FOR EACH ROW EXECUTE FUNCTION perruls_notificar_cambio();
+
+COMMIT;
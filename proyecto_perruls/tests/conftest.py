@@ -0,0 +1,32 @@
+"""
+Carga api_perruls.py y la GUI para los tests. Ninguno de los dos es un
+paquete importable (la GUI tiene espacios en el nombre), así que se leen
+desde su archivo. Importarlos no abre conexiones: el pool se abre recién
+en el lifespan de la app.
+"""
+import importlib.util
+import os
+import sys
+
+import pytest
+
+DIR_PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def cargar_modulo(nombre, archivo):
+    spec = importlib.util.spec_from_file_location(nombre, os.path.join(DIR_PROYECTO, archivo))
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[nombre] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+@pytest.fixture(scope="session")
+def api_perruls():
+    return cargar_modulo("api_perruls", "api_perruls.py")
+
+
+@pytest.fixture(scope="session")
+def gui():
+    pytest.importorskip("tkinter")
+    return cargar_modulo("consultas_rapidas", "consultas rapidas python (1).py")
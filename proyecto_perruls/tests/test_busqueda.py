@@ -0,0 +1,175 @@
+"""
+Índice de búsqueda de /mascotas/search: cómo se rearma si falla y qué
+encuentra (armado con una conexión falsa). No necesitan base.
+"""
+import asyncio
+import random
+
+import pytest
+
+
+async def esperar(condicion, segundos=2):
+    for _ in range(int(segundos / 0.01)):
+        if condicion():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("no se cumplió a tiempo")
+
+
+def test_indice_fallido_se_reintenta_con_la_siguiente_busqueda(api_perruls, monkeypatch):
+    api = api_perruls
+    llamadas = []
+    indice = object()
+
+    def construir():
+        llamadas.append(1)
+        if len(llamadas) == 1:
+            raise OSError("sin base")
+        return indice
+
+    monkeypatch.setattr(api, "construir_indice_busqueda", construir)
+    monkeypatch.setattr(api, "BUSQUEDA_REFRESCO", 60)
+    monkeypatch.setattr(api, "indice_busqueda", None)
+
+    async def correr():
+        monkeypatch.setattr(api, "cambios_mascota", asyncio.Event())
+        monkeypatch.setattr(api, "pedido_indice", asyncio.Event())
+        tarea = asyncio.create_task(api.mantener_indice_busqueda())
+        try:
+            await esperar(lambda: llamadas)
+            with pytest.raises(api.HTTPException) as error:
+                await api.buscar_mascotas("lucas", 5, None, None)
+            assert error.value.status_code == 503
+            # Sin esperar los 60 s de API_SEARCH_REFRESH.
+            await esperar(lambda: api.indice_busqueda is indice)
+            assert len(llamadas) == 2
+        finally:
+            tarea.cancel()
+
+    asyncio.run(correr())
+
+
+def test_fallos_seguidos_esperan_cada_vez_mas(api_perruls, monkeypatch):
+    api = api_perruls
+    esperas = []
+
+    def construir():
+        raise OSError("sin base")
+
+    async def dormir(segundos):
+        esperas.append(segundos)
+        if len(esperas) == 3:
+            raise asyncio.CancelledError
+
+    monkeypatch.setattr(api, "construir_indice_busqueda", construir)
+    monkeypatch.setattr(api, "BUSQUEDA_REINTENTOS", 2)
+    monkeypatch.setattr(api, "indice_busqueda", None)
+
+    async def correr():
+        monkeypatch.setattr(api, "cambios_mascota", asyncio.Event())
+        pedido = asyncio.Event()
+        pedido.set()
+        # Una búsqueda pendiente en cada vuelta: solo frena el backoff.
+        pedido.clear = lambda: None
+        monkeypatch.setattr(api, "pedido_indice", pedido)
+        monkeypatch.setattr(api.asyncio, "sleep", dormir)
+        with pytest.raises(asyncio.CancelledError):
+            await api.mantener_indice_busqueda()
+
+    asyncio.run(correr())
+    assert esperas == [1, 2, 4]
+
+
+MASCOTAS = [
+    ("C1", "Lucas", "Labrador Retriever", "Norte", "Disponible"),
+    ("C2", "Luna", "Beagle", "Sur", "Adoptado"),
+    ("C3", "Firulais 12", "Mestizo", "Norte", "Disponible"),
+    ("C4", "Firulais 123", "Labrador", "Sur", "Disponible"),
+    ("C5", "Toby", "Pastor Alemán", "Norte", "Adoptado"),
+    ("C6", "Lucas", "Beagle", "Sur", "Disponible"),
+]
+
+
+class CursorFalso:
+    def __init__(self, filas):
+        self.filas = filas
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        assert "ORDER BY nombre_mascota, chip_id" in sql
+
+    def __iter__(self):
+        return iter(sorted(self.filas, key=lambda f: (f[1], f[0])))
+
+
+class ConexionFalsa:
+    def __init__(self, filas):
+        self.filas = filas
+
+    def cursor(self, name=None):
+        return CursorFalso(self.filas)
+
+
+@pytest.fixture
+def indice(api_perruls):
+    return api_perruls.IndiceBusqueda.construir(ConexionFalsa(MASCOTAS))
+
+
+def chips(indice, consulta, **filtros):
+    return [indice.chip(fila) for fila, _ in indice.buscar(consulta, 10, **filtros)]
+
+
+def test_indice_numera_las_filas_en_el_orden_de_mascotas(indice):
+    assert [indice.chip(f) for f in range(indice.filas)] == ["C3", "C4", "C1", "C6", "C2", "C5"]
+    assert indice.stats()["filas"] == 6
+
+
+def test_busqueda_exacta_prefijo_tildes_y_errores(indice):
+    assert chips(indice, "lucas") == ["C1", "C6"]
+    assert chips(indice, "Lúcas")[:2] == ["C1", "C6"]
+    assert set(chips(indice, "lab")) == {"C1", "C4"}
+    assert set(chips(indice, "labrdor")) == {"C1", "C4"}
+    assert chips(indice, "aleman") == ["C5"]
+
+
+def test_todas_las_palabras_calzan_y_la_raza_pesa_menos(api_perruls, indice):
+    api = api_perruls
+    # "lucas beagle": solo C6 tiene las dos palabras.
+    assert [(indice.chip(f), p) for f, p in indice.buscar("lucas beagle", 10)] == [
+        ("C6", api.PUNTAJE_EXACTO + api.PUNTAJE_EXACTO * api.PESO_RAZA)]
+    assert chips(indice, "lucas toby") == []
+    assert {p for _, p in indice.buscar("beagle", 10)} == {api.PUNTAJE_EXACTO * api.PESO_RAZA}
+
+
+def test_numeros_solo_calzan_completos(indice):
+    assert chips(indice, "12") == ["C3"]
+    assert chips(indice, "firulais 123") == ["C4"]
+    assert chips(indice, "1") == []
+
+
+def test_filtros_de_campus_y_estado(indice):
+    assert chips(indice, "lucas", nombre_campus="Sur") == ["C6"]
+    assert chips(indice, "lucas", estado_adop="Adoptado") == []
+    assert chips(indice, "lucas", nombre_campus="Oeste") == []
+
+
+def test_el_tope_de_combinaciones_no_cambia_el_resultado(api_perruls, monkeypatch):
+    rnd = random.Random(7)
+    nombres = ["Lucas", "Luna", "Lula", "Toby", "Tobías", "Max", "Maxi", "Rocky"]
+    razas = ["Labrador", "Beagle", "Boxer", "Mestizo", "Pastor Alemán"]
+    filas = [
+        (f"C{i:04}", f"{rnd.choice(nombres)} {rnd.choice(nombres)}", rnd.choice(razas), "Norte", "Disponible")
+        for i in range(300)
+    ]
+    indice = api_perruls.IndiceBusqueda.construir(ConexionFalsa(filas))
+    consultas = ["lu", "lu to", "max bea", "tob lab", "l m b"]
+    esperado = {q: indice.buscar(q, 25) for q in consultas}
+    for q, resultado in esperado.items():
+        assert resultado == sorted(resultado, key=lambda x: (-x[1], x[0]))
+    monkeypatch.setattr(indice, "MAX_COMBINACIONES", 1)
+    assert {q: indice.buscar(q, 25) for q in consultas} == esperado
@@ -0,0 +1,148 @@
+"""
+CacheRespuestas (LRU, TTL, una sola ejecución por clave) y la comparación
+de If-None-Match. No necesitan base.
+"""
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def cache(api_perruls):
+    return api_perruls.CacheRespuestas(max_entradas=2)
+
+
+def productor_de(valor, llamadas):
+    async def productor():
+        llamadas.append(valor)
+        await asyncio.sleep(0)
+        return {"valor": valor}
+    return productor
+
+
+def test_guarda_y_reutiliza(api_perruls, cache):
+    llamadas = []
+
+    async def correr():
+        a = await cache.obtener("k", 60, productor_de(1, llamadas))
+        b = await cache.obtener("k", 60, productor_de(2, llamadas))
+        return a, b
+
+    a, b = asyncio.run(correr())
+    assert a == b and llamadas == [1]
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert a[1] == '"' + api_perruls.hashlib.sha1(a[2]).hexdigest() + '"'
+
+
+def test_ttl_vencido_vuelve_a_ejecutar(cache):
+    llamadas = []
+
+    async def correr():
+        await cache.obtener("k", 0, productor_de(1, llamadas))
+        return await cache.obtener("k", 0, productor_de(2, llamadas))
+
+    assert asyncio.run(correr())[2] == b'{"valor":2}'
+    assert llamadas == [1, 2]
+
+
+def test_lru_descarta_la_menos_usada(cache):
+    llamadas = []
+
+    async def correr():
+        for clave in ("a", "b", "a", "c"):
+            await cache.obtener(clave, 60, productor_de(clave, llamadas), etiquetas=[f"t:{clave}"])
+
+    asyncio.run(correr())
+    assert list(cache.entradas) == ["a", "c"]
+    assert cache.evictions == 1
+    assert "t:b" not in cache.etiquetas
+
+
+def test_invalidar_por_etiqueta(cache):
+    async def correr():
+        await cache.obtener("a", 60, productor_de("a", []), etiquetas=["chip:1"])
+        await cache.obtener("b", 60, productor_de("b", []), etiquetas=["chip:2"])
+        cache.invalidar(["chip:1"])
+
+    asyncio.run(correr())
+    assert list(cache.entradas) == ["b"]
+    assert cache.invalidations == 1
+
+
+def test_no_guarda_si_se_invalido_mientras_se_consultaba(cache):
+    async def productor():
+        cache.invalidar(["chip:1"])
+        return {"valor": "viejo"}
+
+    asyncio.run(cache.obtener("k", 60, productor))
+    assert "k" not in cache.entradas
+
+
+def test_solicitudes_concurrentes_ejecutan_una_vez(cache):
+    llamadas = []
+
+    async def correr():
+        return await asyncio.gather(*(cache.obtener("k", 60, productor_de(i, llamadas)) for i in range(5)))
+
+    resultados = asyncio.run(correr())
+    assert llamadas == [0]
+    assert all(r == resultados[0] for r in resultados)
+    assert cache.coalesced == 4
+
+
+def test_lider_cancelado_no_aborta_a_las_que_esperan(cache):
+    llamadas = []
+
+    async def productor():
+        llamadas.append(len(llamadas))
+        if len(llamadas) == 1:
+            await asyncio.Event().wait()  # el primero queda colgado hasta cancelarse
+        return {"valor": len(llamadas)}
+
+    async def correr():
+        lider = asyncio.create_task(cache.obtener("k", 60, productor))
+        await asyncio.sleep(0)
+        espera = asyncio.create_task(cache.obtener("k", 60, productor))
+        await asyncio.sleep(0)
+        lider.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await lider
+        return await espera
+
+    entrada = asyncio.run(correr())
+    assert entrada[2] == b'{"valor":2}'
+    assert llamadas == [0, 1]
+    assert cache.en_vuelo == {}
+
+
+def test_cancelar_una_que_espera_no_afecta_al_lider(cache):
+    async def productor():
+        await asyncio.sleep(0.01)
+        return {"valor": 1}
+
+    async def correr():
+        lider = asyncio.create_task(cache.obtener("k", 60, productor))
+        await asyncio.sleep(0)
+        espera = asyncio.create_task(cache.obtener("k", 60, productor))
+        await asyncio.sleep(0)
+        espera.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await espera
+        return await lider
+
+    assert asyncio.run(correr())[2] == b'{"valor":1}'
+
+
+@pytest.mark.parametrize("cabecera, coincide", [
+    (None, False),
+    ("", False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"x", "abc"', True),
+    ('"x",W/"abc"', True),
+    ("*", True),
+    ('"x"', False),
+    ('"abcd"', False),
+])
+def test_etag_coincide(api_perruls, cabecera, coincide):
+    assert api_perruls.etag_coincide(cabecera, '"abc"') is coincide
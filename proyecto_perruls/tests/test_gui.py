@@ -0,0 +1,133 @@
+"""
+Partes de la GUI que no necesitan ventana ni base: qué consultas se
+paginan en el servidor y cómo se guardan, ordenan y filtran los resultados.
+"""
+import datetime as dt
+from decimal import Decimal
+
+import pytest
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM mascota",
+    "  select 1;  ",
+    "WITH t AS (SELECT 1) SELECT * FROM t",
+    "VALUES (1), (2)",
+    "TABLE mascota",
+    "SELECT 'insert into x' AS texto",
+    'SELECT "update" FROM t',
+    "SELECT 1 -- delete\n",
+    "SELECT /* into */ 1",
+    "SELECT $$delete$$, $f$ update $f$",
+])
+def test_is_pageable_lecturas(gui, sql):
+    assert gui.is_pageable(sql)
+
+
+@pytest.mark.parametrize("sql", [
+    "",
+    ";",
+    "INSERT INTO mascota VALUES (1)",
+    "UPDATE mascota SET peso = 1",
+    "WITH borradas AS (DELETE FROM t RETURNING *) SELECT * FROM borradas",
+    "SELECT * INTO copia FROM mascota",
+    "SELECT 1; SELECT 2",
+    "SHOW statement_timeout",
+    "EXPLAIN SELECT 1",
+])
+def test_is_pageable_rechaza_escrituras_y_varias_sentencias(gui, sql):
+    assert not gui.is_pageable(sql)
+
+
+def filas_de_prueba():
+    return [
+        (i, i * 0.5, f"Nombre {i % 3}", None if i % 4 == 0 else Decimal(f"{i}.{i % 2}0"),
+         dt.date(2024, 1, 1 + i % 28), None if i % 5 == 0 else f"único {i}", 2 ** 70 if i == 7 else i)
+        for i in range(50)
+    ]
+
+
+@pytest.mark.parametrize("tramo", [1, 7, 50])
+def test_column_store_devuelve_las_mismas_filas(gui, tramo):
+    filas = filas_de_prueba()
+    store = gui.ColumnStore(list("abcdefg"))
+    for i in range(0, len(filas), tramo):
+        store.extend(filas[i:i + tramo])
+    assert len(store) == len(filas)
+    assert list(store) == filas
+    assert store[3] == filas[3] and store[-1] == filas[-1]
+    assert store[10:20] == filas[10:20] and store[::7] == filas[::7]
+    assert store.take([5, 0, 5]) == [filas[5], filas[0], filas[5]]
+    assert list(store.view(45, 100)) == filas[45:]
+    with pytest.raises(IndexError):
+        store[50]
+
+
+def test_column_store_elige_la_representacion(gui):
+    store = gui.ColumnStore(list("abcdefg"), filas_de_prueba())
+    tipos = [store.column(j).kind for j in range(7)]
+    # La última columna pasa a objetos al llegar un entero de 70 bits.
+    assert tipos == ["int", "float", "dict", "dict", "dict", "dict", "obj"]
+
+
+def test_column_store_conserva_decimales_y_nulos(gui):
+    filas = [(None,), (Decimal("1.0"),), (Decimal("1.00"),), (None,)]
+    store = gui.ColumnStore(["x"], filas)
+    assert [str(v) for v, in store] == ["None", "1.0", "1.00", "None"]
+
+
+def test_column_store_texto_con_muchos_valores_distintos(gui, monkeypatch):
+    monkeypatch.setattr(gui.Column, "DICT_MAX", 4)
+    filas = [(None if i % 3 == 0 else f"ñandú {i}",) for i in range(20)]
+    store = gui.ColumnStore(["x"], filas)
+    assert store.column(0).kind == "text"
+    assert list(store) == filas
+    assert store.take([2, 3]) == [filas[2], filas[3]]
+
+
+def orden_esperado(filas, j, desc=False):
+    # Como ORDER BY en PostgreSQL: texto sin distinguir mayúsculas, NULL al
+    # final en ASC (y al principio en DESC, por ser el mismo orden al revés).
+    def clave(i):
+        v = filas[i][j]
+        if v is None:
+            return (True, 0, i)
+        return (False, (v.casefold(), v) if type(v) is str else v, i)
+    orden = sorted(range(len(filas)), key=clave)
+    return orden[::-1] if desc else orden
+
+
+FILAS_INDICE = [
+    (3, "ana", None, 2.5),
+    (1, "Bruno", "Norte", None),
+    (None, "Ana", "Sur", 1.0),
+    (2, None, "Norte", 2.5),
+    (1, "carla", "norte", 0.5),
+]
+
+
+@pytest.fixture(params=["store", "lista"])
+def indice(gui, request):
+    filas = gui.ColumnStore(list("abcd"), FILAS_INDICE) if request.param == "store" else list(FILAS_INDICE)
+    return gui.ResultIndex(filas)
+
+
+@pytest.mark.parametrize("j", range(4))
+def test_result_index_ordena_como_postgres(indice, j):
+    # Los empates se desempatan por posición, así que el orden es estable.
+    assert list(indice.order(j)) == orden_esperado(FILAS_INDICE, j)
+    assert list(indice.view(j, True, "")) == orden_esperado(FILAS_INDICE, j, desc=True)
+
+
+def test_result_index_busca_en_todas_las_columnas(indice):
+    assert list(indice.search("NORTE")) == [1, 3, 4]
+    assert list(indice.search("2.5")) == [0, 3]
+    assert list(indice.search("zzz")) == []
+    assert indice.search("") is None
+    assert indice.view(None, False, "") is None
+
+
+def test_result_index_filtra_y_ordena(indice):
+    assert list(indice.view(1, False, "norte")) == [1, 4, 3]
+    assert list(indice.view(1, True, "norte")) == [3, 4, 1]
+    assert list(indice.view(None, False, "a")) == [0, 2, 4]
@@ -0,0 +1,150 @@
+"""
+Invalidación de la caché de respuestas por LISTEN/NOTIFY, contra un
+Postgres local.
+
+Usa la base del benchmark (BENCH_DB_NAME, por defecto perruls_bench),
+sembrada con bench/carga.py preparar (aplica también migraciones/*.sql).
+La conexión se toma de DB_HOST/DB_USER/DB_PASS/DB_PORT, como la API. Si la
+base no está disponible el test se omite.
+
+  python bench/carga.py preparar --escala 1k
+  python -m pytest tests
+"""
+import importlib.util
+import os
+import sys
+import time
+
+import psycopg
+import pytest
+
+DIR_PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Antes de importar la API: el pool toma la base del entorno al crearse.
+os.environ["DB_NAME"] = os.getenv("BENCH_DB_NAME", "perruls_bench")
+os.environ["API_SEARCH"] = "0"
+os.environ["API_EXPLAIN_CHECK"] = "0"
+
+
+def _cargar_api():
+    spec = importlib.util.spec_from_file_location(
+        "api_perruls", os.path.join(DIR_PROYECTO, "api_perruls.py")
+    )
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules["api_perruls"] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+@pytest.fixture(scope="module")
+def api():
+    modulo = _cargar_api()
+    try:
+        with psycopg.connect(**modulo.conninfo(), connect_timeout=3) as conn:
+            trigger = conn.execute(
+                "SELECT 1 FROM pg_trigger "
+                "WHERE tgname = 'notificar_cambio' AND tgrelid = 'mascota'::regclass"
+            ).fetchone()
+    except psycopg.Error as e:
+        pytest.skip(f"sin base de benchmark: {e}")
+    if trigger is None:
+        pytest.skip("falta migraciones/001_notificar_cambios.sql")
+    return modulo
+
+
+@pytest.fixture(scope="module")
+def cliente(api):
+    from fastapi.testclient import TestClient
+
+    with TestClient(api.app) as c:
+        # escuchar_cambios limpia la caché apenas queda escuchando.
+        _esperar(lambda: api.cache.version > 0, "LISTEN")
+        yield c
+
+
+@pytest.fixture
+def db(api):
+    with psycopg.connect(**api.conninfo(), autocommit=True) as conn:
+        yield conn
+
+
+def _esperar(condicion, que, segundos=5.0):
+    limite = time.monotonic() + segundos
+    while not condicion():
+        if time.monotonic() > limite:
+            raise AssertionError(f"no llegó {que} en {segundos} s")
+        time.sleep(0.01)
+
+
+def _cambiar(api, db, sql, params):
+    """Ejecuta el UPDATE y espera a que su aviso invalide la caché."""
+    version = api.cache.version
+    db.execute(sql, params)
+    _esperar(lambda: api.cache.version > version, "el aviso NOTIFY")
+
+
+def test_mascota_actualizada_se_ve_despues_del_aviso(api, cliente, db):
+    chip_id, nombre = db.execute(
+        "SELECT chip_id, nombre_mascota FROM mascota ORDER BY chip_id LIMIT 1"
+    ).fetchone()
+    ruta = f"/mascotas/{chip_id}"
+    assert cliente.get(ruta).json()["nombre_mascota"] == nombre
+    hits = api.cache.hits
+    assert cliente.get(ruta).json()["nombre_mascota"] == nombre
+    assert api.cache.hits == hits + 1
+
+    try:
+        _cambiar(api, db, "UPDATE mascota SET nombre_mascota = %s WHERE chip_id = %s",
+                 (nombre + " (editado)", chip_id))
+        assert cliente.get(ruta).json()["nombre_mascota"] == nombre + " (editado)"
+    finally:
+        db.execute("UPDATE mascota SET nombre_mascota = %s WHERE chip_id = %s", (nombre, chip_id))
+
+
+def test_inventario_actualizado_se_ve_despues_del_aviso(api, cliente, db):
+    id_item, nombre, campus, cantidad = db.execute(
+        "SELECT id_item, nombre, nombre_campus, cantidad FROM inventario "
+        "WHERE tipo = 'Comida' AND nombre_campus IS NOT NULL ORDER BY id_item LIMIT 1"
+    ).fetchone()
+    ruta = f"/inventario/comida?nombre_campus={campus}&limit=1000"
+
+    def cantidad_listada():
+        return next(r["cantidad"] for r in cliente.get(ruta).json()["data"] if r["nombre_item"] == nombre)
+
+    assert cantidad_listada() == cantidad
+    hits = api.cache.hits
+    assert cantidad_listada() == cantidad
+    assert api.cache.hits == hits + 1
+
+    try:
+        _cambiar(api, db, "UPDATE inventario SET cantidad = %s WHERE id_item = %s",
+                 (cantidad + 1000, id_item))
+        assert cantidad_listada() == cantidad + 1000
+    finally:
+        db.execute("UPDATE inventario SET cantidad = %s WHERE id_item = %s", (cantidad, id_item))
+
+
+def test_sucursal_actualizada_se_ve_despues_del_aviso(api, cliente, db):
+    if db.execute(
+        "SELECT 1 FROM pg_trigger WHERE tgname = 'notificar_cambio' AND tgrelid = 'sucursal'::regclass"
+    ).fetchone() is None:
+        pytest.skip("falta migraciones/005_notificar_sucursal.sql")
+    campus, direccion = db.execute(
+        "SELECT nombre_campus, direccion FROM sucursal ORDER BY nombre_campus LIMIT 1"
+    ).fetchone()
+
+    def direccion_listada():
+        return next(s["direccion"] for s in cliente.get("/sucursales").json()["data"]
+                    if s["nombre_campus"] == campus)
+
+    assert direccion_listada() == direccion
+    hits = api.cache.hits
+    assert direccion_listada() == direccion
+    assert api.cache.hits == hits + 1
+
+    try:
+        _cambiar(api, db, "UPDATE sucursal SET direccion = %s WHERE nombre_campus = %s",
+                 (direccion + " (editada)", campus))
+        assert direccion_listada() == direccion + " (editada)"
+    finally:
+        db.execute("UPDATE sucursal SET direccion = %s WHERE nombre_campus = %s", (direccion, campus))
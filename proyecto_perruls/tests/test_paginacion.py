@@ -0,0 +1,94 @@
+"""
+Paginación por cursor: codificación y validación del cursor, claves sin
+NULL y el SELECT que arma consulta_paginada. No necesitan base.
+"""
+import datetime
+import os
+
+import pytest
+
+
+def test_cursor_ida_y_vuelta(api_perruls):
+    api = api_perruls
+    tipos = [bool, datetime.date, int, str]
+    valores = [False, datetime.date(2024, 2, 29), 42, "Ñandú"]
+    cursor = api.encode_cursor(valores)
+    assert "=" not in cursor
+    assert api.decode_cursor(cursor, tipos) == valores
+
+
+@pytest.mark.parametrize("valores, tipos", [
+    (["1"], [int]),           # texto donde va un número
+    ([1], [bool]),            # 1 no es True
+    ([True], [int]),          # ni True es 1
+    (["2024-13-01"], [datetime.date]),
+    ([1, 2], [int]),          # cantidad de claves distinta
+    ({"a": 1}, [int]),
+])
+def test_cursor_alterado_responde_400(api_perruls, valores, tipos):
+    api = api_perruls
+    with pytest.raises(api.HTTPException) as error:
+        api.decode_cursor(api.encode_cursor(valores), tipos)
+    assert error.value.status_code == 400
+
+
+def test_cursor_que_no_es_base64_responde_400(api_perruls):
+    with pytest.raises(api_perruls.HTTPException) as error:
+        api_perruls.decode_cursor("no es un cursor!", [int])
+    assert error.value.status_code == 400
+
+
+def test_clave_con_nulos(api_perruls):
+    assert api_perruls.clave_con_nulos("i.nombre_campus", str, "''") == [
+        ("i.nombre_campus IS NULL", bool),
+        ("COALESCE(i.nombre_campus, '')", str),
+    ]
+
+
+def test_consulta_paginada_con_filtro_y_cursor(api_perruls):
+    api = api_perruls
+    cursor = api.encode_cursor([False, "Norte", "Arroz", 7])
+    sql, params, limit = api.consulta_comida(
+        fields="nombre_item", limit=10, cursor=cursor, nombre_campus="Norte")
+    claves = ", ".join(k for k, _ in api.COMIDA_CLAVES)
+    assert f"ORDER BY {claves} LIMIT %b" in sql
+    assert f"({claves}) > (%s, %s, %s, %s)" in sql
+    assert params == ["Norte", False, "Norte", "Arroz", 7, 11]
+    assert limit == 10
+    assert sql.count("%s") + sql.count("%b") == len(params)
+
+
+def test_consulta_paginada_omite_filtros_sin_valor_y_acota_limit(api_perruls):
+    api = api_perruls
+    sql, params, limit = api.consulta_mascotas(limit=10 ** 6)
+    assert " WHERE " not in sql
+    assert limit == api.LIMITE_MAXIMO and params == [limit + 1]
+
+
+def test_consulta_paginada_sin_limit_para_exportar(api_perruls):
+    sql, params, limit = api_perruls.consulta_mascotas(limit=None, estado_adop="Adoptado")
+    assert limit is None and "LIMIT" not in sql and "_k0" not in sql
+    assert params == ["Adoptado"]
+
+
+def test_pagina_quita_claves_y_arma_next_cursor(api_perruls):
+    api = api_perruls
+    rows = [{"nombre": n, "_k0": n, "_k1": i} for i, n in enumerate(["a", "b", "c"])]
+    resultado = api.pagina(rows, 2, 2)
+    assert resultado["data"] == [{"nombre": "a"}, {"nombre": "b"}]
+    assert api.decode_cursor(resultado["next_cursor"], [str, int]) == ["b", 1]
+    assert api.pagina([{"nombre": "a", "_k0": "a"}], 2, 1)["next_cursor"] is None
+
+
+@pytest.mark.parametrize("claves, alias", [("COMIDA_CLAVES", "i."), ("TRATAMIENTO_CLAVES", "t.")])
+def test_claves_con_nulos_coinciden_con_los_indices_de_004(api_perruls, claves, alias):
+    # Si el ORDER BY no es exactamente la expresión indexada, Postgres ordena
+    # la tabla entera en cada página.
+    ruta = os.path.join(os.path.dirname(api_perruls.__file__), "migraciones", "004_claves_con_nulos.sql")
+    with open(ruta, encoding="utf-8") as f:
+        migracion = " ".join(f.read().split())
+    expresiones = []
+    for k, _ in getattr(api_perruls, claves):
+        k = k.replace(alias, "")
+        expresiones.append(f"({k})" if k.endswith(" IS NULL") else k)
+    assert f"({', '.join(expresiones)})" in migracion